@@ -1,10 +1,15 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 from utils import ClashConfigManager
+from scheduler import RegenerationScheduler
 from subscription_parser import SubscriptionParser
+from node_index import parse_dedupe_options
+from file_store import file_lock, atomic_write
 from functools import wraps
+import threading
+import json
 
 # 加载环境变量
 load_dotenv()
@@ -15,6 +20,29 @@ CORS(app)
 # 初始化配置管理器
 config_manager = ClashConfigManager()
 
+# 后台定时生成配置的调度器
+scheduler = RegenerationScheduler(config_manager)
+_scheduler_started = False
+_scheduler_start_lock = threading.Lock()
+
+def start_scheduler():
+    """启用定时生成时启动调度器，每个进程只启动一次"""
+    global _scheduler_started
+    if _scheduler_started:
+        return
+    with _scheduler_start_lock:
+        if _scheduler_started:
+            return
+        _scheduler_started = True
+    if os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true':
+        scheduler.start()
+
+# 在处理请求的进程中启动：调试模式重载器的监视进程不处理请求，不会多启动一个调度器；
+# 由 WSGI 服务器加载时同样生效
+@app.before_request
+def ensure_scheduler_started():
+    start_scheduler()
+
 # 错误处理装饰器
 def handle_api_errors(f):
     @wraps(f)
@@ -74,17 +102,26 @@ def update_url_alias(url):
 @app.route('/api/test-urls', methods=['POST'])
 @handle_api_errors
 def test_urls():
-    """测试 URL 是否可用"""
+    """测试 URL 是否可用
+    
+    lightweight 为 true 时，优先复用最近一次获取订阅的结果，不再发起新的探测请求
+    """
     data = request.get_json()
     urls = data.get('urls', [])
+    lightweight = data.get('lightweight', False)
     
     results = []
     for url in urls:
-        is_available, status = config_manager.test_url_availability(url)
+        recent = config_manager.get_recent_fetch_status(url) if lightweight else None
+        if recent is not None:
+            is_available, status = recent
+        else:
+            is_available, status = config_manager.test_url_availability(url)
         results.append({
             'url': url,
             'available': is_available,
-            'status': status
+            'status': status,
+            'cached': recent is not None
         })
         
     return jsonify({'success': True, 'results': results})
@@ -126,24 +163,106 @@ def fetch_proxies():
     data = request.get_json()
     urls = data.get('urls', [])
     filter_options = data.get('filter_options', {'regions': ['hk']})
+    force_refresh = data.get('force_refresh', False)  # 忽略订阅缓存
+    streaming = data.get('streaming', False)  # 流式解析超大订阅
     
     if not urls:
         return jsonify({'success': False, 'error': '请提供至少一个订阅 URL'})
         
+    # 跨订阅去重选项，在获取订阅之前校验
+    try:
+        dedupe_options = parse_dedupe_options(data.get('dedupe'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+        
+    # 增量模式：只返回相对客户端快照发生变化的节点
+    if data.get('incremental'):
+        result = config_manager.fetch_proxies_incremental(
+            urls, filter_options, data.get('snapshot_versions', {}),
+            force_refresh=force_refresh, streaming=streaming, dedupe_options=dedupe_options)
+        return jsonify({'success': True, 'incremental': True, **result})
+        
     # 获取并过滤节点
-    proxies = config_manager.fetch_proxies_from_urls(urls, filter_options)
+    proxies, details = config_manager.fetch_proxies_with_details(
+        urls, filter_options, force_refresh=force_refresh, streaming=streaming,
+        dedupe_options=dedupe_options)
     
     return jsonify({
         'success': True,
         'proxies': proxies,
-        'total': len(proxies)
+        'total': len(proxies),
+        'details': details
     })
 
+@app.route('/api/fetch-proxies/stream', methods=['POST'])
+@handle_api_errors
+def fetch_proxies_stream():
+    """以 Server-Sent Events 推送获取结果：每个订阅完成后立即推送其详情和节点"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': '请求体必须是 JSON 对象'}), 400
+    urls = data.get('urls', [])
+    filter_options = data.get('filter_options', {'regions': ['hk']})
+    try:
+        dedupe_options = parse_dedupe_options(data.get('dedupe'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    def sse(event: str, payload: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        
+    def generate():
+        if not urls:
+            yield sse('error', {'error': '请提供至少一个订阅 URL'})
+            return
+        try:
+            total = 0
+            for result in config_manager.iter_fetch_proxies(
+                    urls, filter_options,
+                    force_refresh=data.get('force_refresh', False),
+                    streaming=data.get('streaming', False),
+                    dedupe_options=dedupe_options):
+                total += len(result['proxies'])
+                yield sse('subscription', result)
+            yield sse('done', {'total': total})
+        except Exception as e:
+            yield sse('error', {'error': str(e)})
+            
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/http-stats', methods=['GET'])
+@handle_api_errors
+def get_http_stats():
+    """获取 HTTP 连接复用统计"""
+    return jsonify({'success': True, 'stats': config_manager.get_http_stats()})
+
+@app.route('/api/cache-stats', methods=['GET'])
+@handle_api_errors
+def get_cache_stats():
+    """获取订阅、解析、渲染、测速和 DNS 缓存的统计（含命中/未命中计数）"""
+    return jsonify({'success': True, 'stats': config_manager.get_cache_stats()})
+
+@app.route('/api/subscription-health', methods=['GET'])
+@handle_api_errors
+def get_subscription_health():
+    """获取订阅的健康历史摘要"""
+    urls = request.args.getlist('url') or None
+    return jsonify({'success': True, 'subscriptions': config_manager.get_health_summary(urls)})
+
+@app.route('/api/proxy-backends', methods=['POST'])
+@handle_api_errors
+def get_proxy_backends():
+    """解析节点的服务器地址，返回按后端 IP 分组的视图（哪些节点共享同一服务器）"""
+    data = request.get_json()
+    proxies = data.get('proxies', [])
+    return jsonify({'success': True, **config_manager.get_backend_view(proxies)})
+
 @app.route('/api/parse-clash-nodes', methods=['POST'])
 @handle_api_errors
 def parse_clash_nodes():
     """解析用户粘贴的 Clash 格式节点"""
-    import time  # 按需导入
+    from node_index import assign_node_ids  # 按需导入
     
     data = request.get_json()
     nodes_text = data.get('nodes_text', '')
@@ -154,9 +273,9 @@ def parse_clash_nodes():
     # 使用 SubscriptionParser 解析节点
     nodes = SubscriptionParser.parse_clash_nodes(nodes_text)
     
-    # 为每个节点添加唯一 ID 和标记
-    for i, node in enumerate(nodes):
-        node['_id'] = f"custom_{i}_{int(time.time())}"
+    # 为每个节点添加稳定的 ID 和标记
+    assign_node_ids(nodes, 'custom')
+    for node in nodes:
         node['is_custom'] = True
         
     return jsonify({
@@ -210,7 +329,11 @@ def generate_config():
         github_token=github_token,
         reuse_gist=reuse_gist,
         save_config=save_config,
-        gist_name=gist_name
+        gist_name=gist_name,
+        all_proxies=data.get('all_proxies'),  # 可选：获取到的全部节点（含未选中的）
+        filter_options=data.get('filter_options'),  # 可选：获取节点时使用的过滤选项
+        verify_remote=data.get('verify_remote'),  # 可选：与远程文件内容比较
+        latency_top_n=data.get('latency_top_n')  # 可选：每个地区只保留延迟最低的 N 个节点
     )
     
     return jsonify(result)
@@ -222,7 +345,7 @@ def get_config():
     config = {
         'github_token': bool(os.getenv('GITHUB_TOKEN')),
         'reuse_gist': os.getenv('REUSE_GIST', 'false').lower() == 'true',
-        'has_gist_id': os.path.exists('.gist_id'),
+        'has_gist_id': bool(config_manager.load_gist_configs()),
         'default_gist_name': os.getenv('DEFAULT_GIST_NAME')
     }
     return jsonify({'success': True, 'config': config})
@@ -319,6 +442,27 @@ def get_current_gist():
         'current_id': gists.get(current_name) if current_name else None
     })
 
+@app.route('/api/scheduler/status', methods=['GET'])
+@handle_api_errors
+def get_scheduler_status():
+    """获取定时生成任务的状态（上次运行耗时、结果、下次运行时间）"""
+    return jsonify({'success': True, 'status': scheduler.get_status()})
+
+@app.route('/api/scheduler/jobs/<string:name>', methods=['PUT'])
+@handle_api_errors
+def update_scheduler_job(name):
+    """更新某个 Gist 的定时任务设置（enabled、interval、jitter、filter_options）"""
+    data = request.get_json()
+    job = scheduler.set_job(name, data)
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/scheduler/jobs/<string:name>/run', methods=['POST'])
+@handle_api_errors
+def run_scheduler_job(name):
+    """立即运行某个 Gist 的定时任务"""
+    status = scheduler.run_job(name)
+    return jsonify({'success': status['outcome'] != 'error', 'status': status})
+
 @app.route('/api/save-github-token', methods=['POST'])
 @handle_api_errors
 def save_github_token():
@@ -329,28 +473,32 @@ def save_github_token():
     if not token:
         return jsonify({'success': False, 'error': '请提供有效的 GitHub Token'})
     
-    # 读取现有的 .env 文件内容
     env_file = '.env'
-    env_lines = []
-    token_exists = False
-    
-    if os.path.exists(env_file):
-        with open(env_file, 'r', encoding='utf-8') as f:
-            env_lines = f.readlines()
-    
-    # 更新或添加 GITHUB_TOKEN
-    for i, line in enumerate(env_lines):
-        if line.strip().startswith('GITHUB_TOKEN='):
-            env_lines[i] = f'GITHUB_TOKEN={token}\n'
-            token_exists = True
-            break
-    
-    if not token_exists:
-        env_lines.append(f'GITHUB_TOKEN={token}\n')
-    
-    # 写入 .env 文件
-    with open(env_file, 'w', encoding='utf-8') as f:
-        f.writelines(env_lines)
+    
+    # 在文件锁内完成读取、修改和写入，避免并发请求互相覆盖
+    with file_lock(env_file):
+        # 读取现有的 .env 文件内容
+        env_lines = []
+        token_exists = False
+        
+        if os.path.exists(env_file):
+            with open(env_file, 'r', encoding='utf-8') as f:
+                env_lines = f.readlines()
+        
+        # 更新或添加 GITHUB_TOKEN
+        for i, line in enumerate(env_lines):
+            if line.strip().startswith('GITHUB_TOKEN='):
+                env_lines[i] = f'GITHUB_TOKEN={token}\n'
+                token_exists = True
+                break
+        
+        if not token_exists:
+            if env_lines and not env_lines[-1].endswith('\n'):
+                env_lines[-1] += '\n'
+            env_lines.append(f'GITHUB_TOKEN={token}\n')
+        
+        # 原子写入 .env 文件
+        atomic_write(env_file, ''.join(env_lines))
     
     # 更新当前环境变量
     os.environ['GITHUB_TOKEN'] = token
@@ -0,0 +1,125 @@
+"""订阅解析基准测试
+
+生成数 MB 的订阅内容（Clash YAML、Base64 分享链接、纯文本分享链接），
+对比旧版解析流程（先整体尝试 YAML，再尝试 Base64，最后按行解析）
+与当前的格式识别解析、流式解析和按内容哈希的解析缓存。
+
+用法:
+    python bench/bench_parse.py --nodes 20000 --repeat 3
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from urllib.parse import quote
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subscription_cache import ParseMemo  # noqa: E402
+from subscription_parser import SubscriptionParser  # noqa: E402
+
+REGIONS = ['香港', '日本', '新加坡', '美国', '台湾']
+
+
+def make_links(count: int) -> list:
+    """生成 trojan / ss / vmess 分享链接"""
+    links = []
+    for i in range(count):
+        name = f'{REGIONS[i % len(REGIONS)]} {i:05d}'
+        server = f'node{i}.example.com'
+        kind = i % 3
+        if kind == 0:
+            links.append(f'trojan://password{i}@{server}:443?sni={server}#{quote(name)}')
+        elif kind == 1:
+            auth = base64.b64encode(f'aes-256-gcm:password{i}'.encode()).decode()
+            links.append(f'ss://{auth}@{server}:8388#{quote(name)}')
+        else:
+            vmess = {'v': '2', 'ps': name, 'add': server, 'port': '443', 'id': f'00000000-0000-0000-0000-{i:012d}',
+                     'aid': '0', 'net': 'ws', 'path': '/ws', 'host': server, 'tls': 'tls'}
+            links.append('vmess://' + base64.b64encode(json.dumps(vmess, ensure_ascii=False).encode()).decode())
+    return links
+
+
+def make_clash_yaml(count: int) -> str:
+    """生成带大量规则的 Clash 配置"""
+    proxies = [{'name': f'{REGIONS[i % len(REGIONS)]} {i:05d}', 'type': 'trojan', 'server': f'node{i}.example.com',
+                'port': 443, 'password': f'password{i}', 'sni': f'node{i}.example.com', 'udp': True}
+               for i in range(count)]
+    rules = [f'DOMAIN-SUFFIX,site{i}.example.org,PROXY' for i in range(count * 2)]
+    return yaml.safe_dump({'port': 7890, 'proxies': proxies, 'rules': rules},
+                          allow_unicode=True, sort_keys=False, default_flow_style=None)
+
+
+def legacy_parse(content: str) -> list:
+    """旧版解析流程：依次整体尝试 YAML、Base64（递归）、分享链接"""
+    try:
+        data = yaml.safe_load(content)
+        if isinstance(data, dict) and 'proxies' in data:
+            return data['proxies']
+    except Exception:
+        pass
+
+    try:
+        decoded = base64.b64decode(content).decode('utf-8')
+        return legacy_parse(decoded)
+    except Exception:
+        pass
+
+    return SubscriptionParser.parse_share_links(content.strip())
+
+
+def stream_parse(content: str) -> list:
+    data = content.encode('utf-8')
+    chunks = (data[i:i + 65536] for i in range(0, len(data), 65536))
+    return list(SubscriptionParser.iter_parse_stream(chunks))
+
+
+def timed(func, content: str, repeat: int):
+    """返回最短耗时（秒）和解析出的节点数"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='订阅解析基准测试')
+    parser.add_argument('--nodes', type=int, default=20000, help='每个订阅的节点数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短耗时')
+    args = parser.parse_args()
+
+    links = '\n'.join(make_links(args.nodes))
+    samples = {
+        'clash-yaml': make_clash_yaml(args.nodes),
+        'base64': base64.b64encode(links.encode('utf-8')).decode(),
+        'share-links': links,
+    }
+
+    memo = ParseMemo()
+    cases = [
+        ('legacy', legacy_parse),
+        ('parse_subscription', SubscriptionParser.parse_subscription),
+        ('iter_parse_stream', stream_parse),
+        ('ParseMemo (hit)', lambda content: memo.get_or_parse(content, SubscriptionParser.parse_subscription)),
+    ]
+
+    print(f'libyaml: {yaml.__with_libyaml__}')
+    for label, content in samples.items():
+        print(f'\n{label}: {len(content.encode("utf-8")) / 1024 / 1024:.1f} MB')
+        # 预先填充解析缓存，之后只测命中路径
+        memo.get_or_parse(content, SubscriptionParser.parse_subscription)
+        for name, func in cases:
+            elapsed, count = timed(func, content, args.repeat)
+            print(f'  {name:<20} {elapsed:8.3f} s  {count} 个节点')
+
+
+if __name__ == '__main__':
+    main()
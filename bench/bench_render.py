@@ -0,0 +1,130 @@
+"""节点行渲染基准测试
+
+生成上万个节点，对比旧版逐字段格式化的渲染方式、render_proxy、
+带缓存的 ProxySerializer（首次渲染与缓存命中）以及 yaml_backend.dump。
+
+用法:
+    python bench/bench_render.py --nodes 10000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml_backend  # noqa: E402
+from proxy_serializer import FIELD_ORDER, ProxySerializer, render_proxy  # noqa: E402
+
+REGIONS = ['香港', '日本', '新加坡', '美国', '台湾']
+
+
+def make_proxies(count: int) -> list:
+    """生成 trojan / ss / vmess 节点，部分带嵌套的传输层配置"""
+    proxies = []
+    for i in range(count):
+        server = f'node{i}.example.com'
+        proxy = {'name': f'{REGIONS[i % len(REGIONS)]} {i:05d}', 'server': server, 'port': 443 + i % 3, 'udp': True}
+        kind = i % 3
+        if kind == 0:
+            proxy.update({'type': 'trojan', 'password': f'password{i}', 'sni': server, 'skip-cert-verify': False})
+        elif kind == 1:
+            proxy.update({'type': 'ss', 'cipher': 'aes-256-gcm', 'password': f'password:{i}#'})
+        else:
+            proxy.update({'type': 'vmess', 'uuid': f'00000000-0000-0000-0000-{i:012d}', 'alterId': 0,
+                          'cipher': 'auto', 'tls': True, 'network': 'ws',
+                          'ws-opts': {'path': '/ws', 'headers': {'Host': server}}})
+        proxy['_id'] = f'id{i}'
+        proxies.append(proxy)
+    return proxies
+
+
+def legacy_format_value(key, value):
+    """旧版的字段格式化（_format_yaml_value）"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        if any(char in value for char in [':', '{', '}', '"', '\n', '#']):
+            escaped_value = value.replace('\\', '\\\\').replace('"', '\\"')
+            return f'{key}: "{escaped_value}"'
+        return f'{key}: "{value}"'
+    elif isinstance(value, bool):
+        return f'{key}: {str(value).lower()}'
+    elif isinstance(value, (int, float)):
+        return f'{key}: {value}'
+    elif isinstance(value, list):
+        return f'{key}: [{", ".join(str(item) for item in value)}]'
+    elif isinstance(value, dict):
+        dict_items = []
+        for k, v in value.items():
+            if isinstance(v, str):
+                dict_items.append(f'{k}: "{v}"')
+            else:
+                dict_items.append(f'{k}: {v}')
+        return f'{key}: {{ {", ".join(dict_items)} }}'
+    return f'{key}: {value}'
+
+
+def legacy_render_all(proxies: list) -> list:
+    """旧版渲染：先按字段顺序查找，再遍历一遍其余字段"""
+    field_order = list(FIELD_ORDER)
+    lines = []
+    for proxy in proxies:
+        items = []
+        for key in field_order:
+            if key in proxy and not key.startswith('_'):
+                formatted_value = legacy_format_value(key, proxy[key])
+                if formatted_value:
+                    items.append(formatted_value)
+        for key, value in proxy.items():
+            if key not in field_order and not key.startswith('_'):
+                formatted_value = legacy_format_value(key, value)
+                if formatted_value:
+                    items.append(formatted_value)
+        lines.append('  - { ' + ', '.join(items) + ' }')
+    return lines
+
+
+def yaml_dump_all(proxies: list) -> list:
+    public = [{key: value for key, value in proxy.items() if not key.startswith('_')} for proxy in proxies]
+    return yaml_backend.dump({'proxies': public}, default_flow_style=None, width=1 << 20).splitlines()
+
+
+def timed(func, repeat: int, setup=None) -> float:
+    """返回最短耗时（秒），setup 在每次计时前调用"""
+    best = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='节点行渲染基准测试')
+    parser.add_argument('--nodes', type=int, default=10000, help='节点数')
+    parser.add_argument('--repeat', type=int, default=5, help='每项重复次数，取最短耗时')
+    args = parser.parse_args()
+
+    proxies = make_proxies(args.nodes)
+    serializer = ProxySerializer(max_entries=args.nodes)
+
+    cases = [
+        ('legacy', lambda: legacy_render_all(proxies), None),
+        ('render_proxy', lambda: [render_proxy(proxy) for proxy in proxies], None),
+        ('ProxySerializer (cold)', lambda: serializer.render_all(proxies), serializer.clear),
+        ('ProxySerializer (warm)', lambda: serializer.render_all(proxies), None),
+        ('yaml_backend.dump', lambda: yaml_dump_all(proxies), None),
+    ]
+
+    print(f'{args.nodes} 个节点，libyaml: {yaml_backend.HAS_LIBYAML}')
+    for name, func, setup in cases:
+        elapsed = timed(func, args.repeat, setup)
+        print(f'  {name:<24} {elapsed * 1000:9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import os
+import threading
+from typing import Dict, List, Optional, Union
+
+# 插入位置的名称
+SLOT_PROXIES = 'proxies'                # proxies: 下 "# 添加处" 之后的节点列表
+SLOT_EXCLUDE_FILTER = 'exclude-filter'  # 代理组的 exclude-filter 行（值为已加引号的 YAML 字符串）
+
+PROXIES_MARKER = '# 添加处'
+
+
+class Slot:
+    """模板中的插入位置
+
+    提供值时输出 prefix + 值 + suffix，否则输出模板中原有的文本。
+    """
+
+    __slots__ = ('name', 'prefix', 'suffix', 'default')
+
+    def __init__(self, name: str, prefix: str = '', suffix: str = '', default: str = ''):
+        self.name = name
+        self.prefix = prefix
+        self.suffix = suffix
+        self.default = default
+
+
+class CompiledTemplate:
+    """编译后的配置模板
+
+    模板只解析一次，拆分为固定文本段和命名的插入位置；
+    生成配置时只需按顺序拼接各段文本和插入的内容。
+    """
+
+    def __init__(self, lines: List[str]):
+        self.segments = []  # type: List[Union[str, Slot]]
+        self._compile(lines)
+
+    def _compile(self, lines: List[str]):
+        buffer = []
+        proxies_added = False
+
+        def add_slot(slot: Slot):
+            if buffer:
+                self.segments.append(''.join(buffer))
+                del buffer[:]
+            self.segments.append(slot)
+
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+
+            if 'exclude-filter:' in line:
+                # 保持原有的缩进
+                indent = line[:len(line) - len(line.lstrip())]
+                add_slot(Slot(SLOT_EXCLUDE_FILTER, f'{indent}exclude-filter: ', '\n', line))
+            else:
+                buffer.append(line)
+
+            # proxies: 的下一行是 "# 添加处" 注释时，节点插入在注释之后
+            if (line.strip() == 'proxies:' and not proxies_added
+                    and i + 1 < len(lines) and PROXIES_MARKER in lines[i + 1]):
+                i += 1
+                buffer.append(lines[i])
+                add_slot(Slot(SLOT_PROXIES))
+                proxies_added = True
+
+                # 跳过模板中原有的代理节点，直到空行或新的顶层配置项
+                while i + 1 < len(lines):
+                    current_line = lines[i + 1]
+                    if not current_line.strip() or not current_line.startswith(' '):
+                        break
+                    i += 1
+
+            i += 1
+
+        if buffer:
+            self.segments.append(''.join(buffer))
+
+    @property
+    def slot_names(self) -> List[str]:
+        return [segment.name for segment in self.segments if isinstance(segment, Slot)]
+
+    def render(self, values: Dict[str, Optional[str]]) -> str:
+        """按插入位置的名称填入内容，生成完整的配置
+
+        Args:
+            values: {插入位置名称: 内容}，未提供或为 None/空时保留模板原有文本
+        """
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            value = values.get(segment.name)
+            if value:
+                parts.append(segment.prefix)
+                parts.append(value)
+                parts.append(segment.suffix)
+            else:
+                parts.append(segment.default)
+        return ''.join(parts)
+
+
+_templates = {}  # {path: (mtime_ns, size, CompiledTemplate)}
+_templates_lock = threading.Lock()
+
+
+def load_template(path: str) -> CompiledTemplate:
+    """加载并编译模板，文件未修改时直接返回缓存的编译结果"""
+    stat = os.stat(path)
+    with _templates_lock:
+        cached = _templates.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        template = CompiledTemplate(f.readlines())
+
+    with _templates_lock:
+        _templates[path] = (stat.st_mtime_ns, stat.st_size, template)
+    return template
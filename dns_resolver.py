@@ -0,0 +1,230 @@
+import time
+import socket
+import asyncio
+import ipaddress
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+# dnspython 为可选依赖，安装后按记录的 TTL 缓存，否则使用系统解析器和固定有效期
+try:
+    import dns.asyncresolver
+    import dns.exception
+    _HAS_DNSPYTHON = True
+except ImportError:
+    _HAS_DNSPYTHON = False
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def group_hosts(resolved: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """把共享任意一个地址的域名合并为同一个后端（传递合并：A、B 共享一个地址，B、C 共享另一个时三者同组）
+
+    Args:
+        resolved: {域名: [ip, ...]}，解析失败的域名对应空列表
+
+    Returns:
+        {域名: 所在后端的全部地址（排序后）}，同组域名对应同一个列表；解析失败的域名不包含在内
+    """
+    parent = {}
+
+    def find(address: str) -> str:
+        root = address
+        while parent[root] != root:
+            root = parent[root]
+        while parent[address] != root:
+            parent[address], address = root, parent[address]
+        return root
+
+    for addresses in resolved.values():
+        for address in addresses:
+            parent.setdefault(address, address)
+        for address in addresses[1:]:
+            first, other = find(addresses[0]), find(address)
+            if first != other:
+                parent[max(first, other)] = min(first, other)
+
+    members = {}  # {根地址: [地址, ...]}
+    for address in parent:
+        members.setdefault(find(address), []).append(address)
+    for addresses in members.values():
+        addresses.sort()
+    return {host: members[find(addresses[0])] for host, addresses in resolved.items() if addresses}
+
+
+class DnsResolver:
+    """节点服务器域名的批量解析器
+
+    同一批域名在一个事件循环中并发解析（并发数有上限），结果在进程内缓存：
+    安装了 dnspython 时按 DNS 记录的 TTL 缓存（不超过 max_ttl），
+    否则通过系统 getaddrinfo 解析（在线程池中执行，不会逐个串行）并使用 max_ttl。
+    解析失败的结果按 negative_ttl 缓存，避免反复解析不存在的域名。
+    """
+
+    def __init__(self, max_ttl: float = 300, negative_ttl: float = 60,
+                 concurrency: int = 32, timeout: float = 5.0):
+        """
+        Args:
+            max_ttl: 成功结果的最长缓存时间（秒）
+            negative_ttl: 解析失败结果的缓存时间（秒）
+            concurrency: 同时进行的解析数上限
+            timeout: 单个域名的解析超时（秒）
+        """
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._cache = {}  # {host: (过期时间, [ip, ...])}，解析失败时列表为空
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def _lookup_dnspython(self, host: str) -> Tuple[List[str], float]:
+        resolver = dns.asyncresolver.Resolver()
+        resolver.lifetime = self.timeout
+        addresses = []
+        ttl = self.max_ttl
+        for record_type in ('A', 'AAAA'):
+            try:
+                answer = await resolver.resolve(host, record_type)
+            except dns.exception.DNSException:
+                continue
+            addresses.extend(record.to_text() for record in answer)
+            ttl = min(ttl, answer.rrset.ttl)
+        return addresses, ttl
+
+    async def _lookup_system(self, host: str) -> Tuple[List[str], float]:
+        loop = asyncio.get_running_loop()
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(host, None, type=socket.SOCK_STREAM), self.timeout)
+        addresses = []
+        for info in infos:
+            address = info[4][0]
+            if address not in addresses:
+                addresses.append(address)
+        return addresses, self.max_ttl
+
+    async def _lookup(self, semaphore: asyncio.Semaphore, host: str) -> Tuple[List[str], float]:
+        async with semaphore:
+            try:
+                addresses = []
+                if _HAS_DNSPYTHON:
+                    addresses, ttl = await self._lookup_dnspython(host)
+                if not addresses:
+                    # dnspython 不读取 hosts 文件，查不到时再用系统解析器
+                    addresses, ttl = await self._lookup_system(host)
+            except (OSError, asyncio.TimeoutError, UnicodeError):
+                addresses, ttl = [], self.negative_ttl
+            if not addresses:
+                ttl = self.negative_ttl
+            return addresses, ttl
+
+    async def resolve_many_async(self, hosts: Iterable[str]) -> Dict[str, List[str]]:
+        """在当前事件循环中批量解析，IP 地址原样返回，解析失败的域名对应空列表"""
+        now = time.time()
+        results = {}
+        pending = []
+        with self._lock:
+            for host in set(hosts):
+                if not host:
+                    continue
+                if is_ip_address(host):
+                    results[host] = [host]
+                    continue
+                cached = self._cache.get(host)
+                if cached and cached[0] > now:
+                    self.hits += 1
+                    results[host] = cached[1]
+                else:
+                    self.misses += 1
+                    pending.append(host)
+
+        if pending:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            resolved = await asyncio.gather(*(self._lookup(semaphore, host) for host in pending))
+            now = time.time()
+            with self._lock:
+                for host, (addresses, ttl) in zip(pending, resolved):
+                    self._cache[host] = (now + ttl, addresses)
+                    results[host] = addresses
+                # 顺便清理过期条目
+                for host in [h for h, (expires, _) in self._cache.items() if expires <= now]:
+                    del self._cache[host]
+        return results
+
+    def resolve_many(self, hosts: Iterable[str]) -> Dict[str, List[str]]:
+        """批量解析（同步调用，内部创建事件循环）"""
+        hosts = list(hosts)
+        if not hosts:
+            return {}
+        return asyncio.run(self.resolve_many_async(hosts))
+
+    def resolve(self, host: str) -> List[str]:
+        """解析单个域名"""
+        return self.resolve_many([host]).get(host, [])
+
+    def resolve_backends(self, proxies: Iterable[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """批量解析节点的服务器地址，返回 {域名: 所在后端的全部地址}（见 group_hosts）"""
+        return group_hosts(self.resolve_many(
+            str(proxy.get('server')) for proxy in proxies if isinstance(proxy, dict) and proxy.get('server')))
+
+    def backend_view(self, proxies: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """得到节点列表的 IP 级视图：哪些节点实际指向同一个后端
+
+        共享任意一个地址的域名视为同一个后端。
+
+        Returns:
+            {
+                'backends': [{'ip', 'addresses', 'hosts', 'nodes': [{'_id', 'name', 'server', 'port'}]}]，
+                            按节点数从多到少，ip 为后端中最小的地址,
+                'unresolved': 解析失败的节点,
+                'shared': 与其他节点共享后端 IP 的节点数
+            }
+        """
+        backend_of = self.resolve_backends(proxies)
+
+        backends = {}  # {ip: {'ip', 'addresses', 'hosts', 'nodes'}}
+        unresolved = []
+        for proxy in proxies:
+            host = str(proxy.get('server') or '')
+            summary = {'_id': proxy.get('_id'), 'name': proxy.get('name'),
+                       'server': host, 'port': proxy.get('port')}
+            addresses = backend_of.get(host)
+            if not addresses:
+                unresolved.append(summary)
+                continue
+            backend = backends.setdefault(addresses[0], {'ip': addresses[0], 'addresses': addresses,
+                                                         'hosts': [], 'nodes': []})
+            if host not in backend['hosts']:
+                backend['hosts'].append(host)
+            backend['nodes'].append(summary)
+
+        groups = sorted(backends.values(), key=lambda group: len(group['nodes']), reverse=True)
+        return {
+            'backends': groups,
+            'unresolved': unresolved,
+            'shared': sum(len(group['nodes']) for group in groups if len(group['nodes']) > 1)
+        }
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._cache),
+                'dnspython': _HAS_DNSPYTHON,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,162 @@
+import os
+import copy
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Union
+
+# 进程间文件锁：POSIX 使用 flock，Windows 使用 msvcrt.locking
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:
+    import msvcrt
+    _HAS_FCNTL = False
+
+_thread_locks = {}  # {锁文件路径: RLock}，同一进程内的线程先在这里排队
+_thread_locks_guard = threading.Lock()
+
+_json_cache = {}  # {path: (文件签名, data)}
+_json_cache_lock = threading.Lock()
+
+
+def _thread_lock(lock_path: str) -> threading.RLock:
+    with _thread_locks_guard:
+        lock = _thread_locks.get(lock_path)
+        if lock is None:
+            lock = _thread_locks[lock_path] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """对 path 加排他锁（锁文件为 path + '.lock'），同时对本进程的线程和其他进程生效
+
+    同一线程可以重入。
+    """
+    lock_path = os.path.abspath(path) + '.lock'
+    with _thread_lock(lock_path):
+        directory = os.path.dirname(lock_path)
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if _HAS_FCNTL:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                # LK_LOCK 最多等待约 10 秒后抛出异常，这里持续重试
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            try:
+                yield
+            finally:
+                if _HAS_FCNTL:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+def atomic_write(path: str, data: Union[str, bytes], encoding: str = 'utf-8'):
+    """原子写入：先写入同目录下的临时文件并刷盘，再重命名覆盖目标文件
+
+    读取方只会看到完整的旧内容或新内容；目标文件已存在时保留其权限。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data.encode(encoding) if isinstance(data, str) else data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        except OSError:
+            pass
+        _replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _replace(source: str, target: str, attempts: int = 10):
+    # Windows 上目标文件正被其他进程读取时重命名会失败，稍后重试
+    for attempt in range(attempts):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """读取 JSON 文件，文件不存在或内容无效时返回 default
+
+    解析结果按文件签名（inode、修改时间和大小）缓存，文件被其他进程修改后自动重新读取；
+    每次返回独立的副本，调用方可以放心修改。
+    """
+    signature = file_signature(path)
+    if signature is None:
+        return default
+
+    with _json_cache_lock:
+        cached = _json_cache.get(path)
+    if cached and cached[0] == signature:
+        return copy.deepcopy(cached[1])
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return default
+
+    with _json_cache_lock:
+        _json_cache[path] = (signature, data)
+    return copy.deepcopy(data)
+
+
+def write_json(path: str, data: Any, indent: int = 2):
+    """在文件锁内原子写入 JSON 文件"""
+    content = json.dumps(data, ensure_ascii=False, indent=indent)
+    with file_lock(path):
+        atomic_write(path, content)
+
+
+def update_json(path: str, update: Callable[[Any], Any], default: Any = None) -> Any:
+    """在文件锁内读取、修改并原子写回 JSON 文件，避免并发的读-改-写丢失更新
+
+    Args:
+        update: 接收当前内容，返回新内容的函数
+
+    Returns:
+        写入的新内容
+    """
+    with file_lock(path):
+        data = update(read_json(path, default))
+        atomic_write(path, json.dumps(data, ensure_ascii=False, indent=2))
+        return data
+
+
+def file_signature(path: str) -> Optional[tuple]:
+    """文件的 (inode, 修改时间, 大小)，文件不存在时返回 None，用于判断缓存是否过期
+
+    原子写入每次都会生成新的 inode，即使修改时间的精度不足也能发现变化。
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,190 @@
+import os
+import math
+import time
+import sqlite3
+import threading
+from urllib.parse import urlparse
+from typing import Any, Dict, List, Optional, Tuple
+
+# 记录类型
+KIND_GET = 'get'        # 普通/条件 GET 获取订阅
+KIND_STREAM = 'stream'  # 流式获取订阅
+KIND_HEAD = 'head'      # 可用性测试（HEAD）
+FETCH_KINDS = (KIND_GET, KIND_STREAM)
+
+
+class HealthStore:
+    """订阅健康历史（SQLite 时间序列）
+
+    记录每次访问订阅的耗时、状态、内容大小和节点数，并据此：
+    - 按历史耗时从慢到快安排获取顺序，让最慢的订阅最先开始；
+    - 连续失败达到阈值时熔断，按指数退避跳过该订阅，退避结束后放行一次试探；
+    - 按主机的 p95 耗时设置请求超时，而不是固定值。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS fetch_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            host TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            ts REAL NOT NULL,
+            latency REAL,
+            ok INTEGER NOT NULL,
+            status TEXT,
+            body_size INTEGER,
+            node_count INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_fetch_history_url_ts ON fetch_history (url, ts);
+        CREATE INDEX IF NOT EXISTS idx_fetch_history_host_ts ON fetch_history (host, ts);
+    '''
+
+    def __init__(self, db_path: str = 'data/health.db', failure_threshold: int = 3,
+                 backoff_base: float = 60, backoff_max: float = 3600,
+                 retention_days: float = 30, window: int = 50):
+        """
+        Args:
+            db_path: 数据库文件路径
+            failure_threshold: 连续失败多少次后熔断
+            backoff_base: 熔断后的初始退避时间（秒），之后每多失败一次翻倍
+            backoff_max: 退避时间上限（秒）
+            retention_days: 历史记录保留天数
+            window: 计算耗时分位数时使用的最近记录数
+        """
+        self.db_path = db_path
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retention = retention_days * 86400
+        self.window = window
+        self._lock = threading.Lock()
+        self._inserts = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).netloc or url
+
+    def record(self, url: str, kind: str, latency: Optional[float], ok: bool, status: str,
+               body_size: int = None, node_count: int = None):
+        """记录一次访问
+
+        Args:
+            latency: 耗时（秒）
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO fetch_history (url, host, kind, ts, latency, ok, status, body_size, node_count) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, self._host(url), kind, time.time(), latency, int(bool(ok)), status, body_size, node_count))
+            self._inserts += 1
+            # 定期清理过期记录
+            if self._inserts % 100 == 0:
+                self._conn.execute('DELETE FROM fetch_history WHERE ts < ?', (time.time() - self.retention,))
+            self._conn.commit()
+
+    def _recent(self, column: str, value: str, kinds: Tuple[str, ...], limit: int) -> List[Tuple]:
+        placeholders = ','.join('?' * len(kinds))
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT ts, latency, ok FROM fetch_history WHERE {column} = ? AND kind IN ({placeholders}) '
+                'ORDER BY ts DESC LIMIT ?', (value, *kinds, limit)).fetchall()
+
+    @staticmethod
+    def _percentile(values: List[float], percent: float) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        # 最近秩法
+        rank = max(1, math.ceil(percent / 100 * len(values)))
+        return values[rank - 1]
+
+    def latency_percentile(self, url: str, percent: float = 95, kinds: Tuple[str, ...] = FETCH_KINDS,
+                           by_host: bool = True) -> Optional[float]:
+        """最近成功访问耗时的分位数（秒），没有记录时返回 None"""
+        column, value = ('host', self._host(url)) if by_host else ('url', url)
+        rows = self._recent(column, value, kinds, self.window)
+        return self._percentile([latency for _, latency, ok in rows if ok and latency is not None], percent)
+
+    def timeout_for(self, url: str, default: float, kinds: Tuple[str, ...] = FETCH_KINDS,
+                    minimum: float = 3, maximum: float = 60, min_samples: int = 5) -> float:
+        """根据主机的 p95 耗时得出请求超时：p95 的两倍再加 2 秒，限制在 [minimum, maximum] 内
+
+        样本不足时使用默认值。
+        """
+        rows = self._recent('host', self._host(url), kinds, self.window)
+        samples = [latency for _, latency, ok in rows if ok and latency is not None]
+        if len(samples) < min_samples:
+            return default
+        p95 = self._percentile(samples, 95)
+        return round(min(maximum, max(minimum, p95 * 2 + 2)), 1)
+
+    def circuit_state(self, url: str) -> Dict[str, Any]:
+        """订阅的熔断状态
+
+        Returns:
+            {'open': 是否熔断中, 'failure_streak': 连续失败次数, 'retry_at': 可重试的时间戳}
+        """
+        rows = self._recent('url', url, FETCH_KINDS, max(self.window, self.failure_threshold))
+        streak = 0
+        for _, _, ok in rows:
+            if ok:
+                break
+            streak += 1
+
+        if streak < self.failure_threshold:
+            return {'open': False, 'failure_streak': streak, 'retry_at': None}
+
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** (streak - self.failure_threshold))
+        retry_at = rows[0][0] + backoff
+        return {'open': time.time() < retry_at, 'failure_streak': streak, 'retry_at': retry_at}
+
+    def order_slowest_first(self, urls: List[str]) -> List[int]:
+        """按最近的平均耗时从慢到快排列，返回 URL 的序号；没有历史的订阅视为最慢"""
+        averages = []
+        for index, url in enumerate(urls):
+            rows = self._recent('url', url, FETCH_KINDS, 20)
+            samples = [latency for _, latency, ok in rows if ok and latency is not None]
+            average = sum(samples) / len(samples) if samples else float('inf')
+            averages.append((-average, index))
+        return [index for _, index in sorted(averages)]
+
+    def get_summary(self, urls: List[str] = None) -> List[Dict[str, Any]]:
+        """每个订阅的健康摘要"""
+        if urls is None:
+            with self._lock:
+                urls = [row[0] for row in self._conn.execute('SELECT DISTINCT url FROM fetch_history')]
+
+        summary = []
+        for url in urls:
+            with self._lock:
+                last = self._conn.execute(
+                    'SELECT ts, latency, ok, status, body_size, node_count FROM fetch_history '
+                    'WHERE url = ? AND kind IN (?, ?) ORDER BY ts DESC LIMIT 1', (url, *FETCH_KINDS)).fetchone()
+            circuit = self.circuit_state(url)
+            summary.append({
+                'url': url,
+                'last_ts': last[0] if last else None,
+                'last_latency': last[1] if last else None,
+                'last_ok': bool(last[2]) if last else None,
+                'last_status': last[3] if last else None,
+                'body_size': last[4] if last else None,
+                'node_count': last[5] if last else None,
+                'p95': self.latency_percentile(url, by_host=False),
+                'timeout': self.timeout_for(url, default=15),
+                'failure_streak': circuit['failure_streak'],
+                'circuit_open': circuit['open'],
+                'retry_at': circuit['retry_at']
+            })
+        return summary
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
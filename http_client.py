@@ -0,0 +1,155 @@
+import threading
+import time
+import requests
+from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# brotli 为可选依赖，安装后才声明支持 br 压缩
+try:
+    import brotli  # noqa: F401
+    _HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        _HAS_BROTLI = True
+    except ImportError:
+        _HAS_BROTLI = False
+
+
+class CappedRetry(Retry):
+    """重试策略：遵循 Retry-After 响应头，但等待时间不超过 max_retry_after 秒
+
+    服务端可能返回很长的 Retry-After（如 3600），不加限制时会长时间占用线程池中的线程。
+    每次退避等待结束后记录下一次尝试的开始时间（attempt_started），
+    调用方据此统计单次尝试的耗时，而不是包含重试和等待的总耗时。
+    """
+
+    def __init__(self, *args, max_retry_after: float = 5.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+        self.attempt_started = None
+
+    def new(self, **kwargs):
+        # 每次重试都会通过 new() 创建新实例，需要带上等待上限
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.max_retry_after)
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        self.attempt_started = time.perf_counter()
+
+
+class HttpClient:
+    """带连接池的 HTTP 客户端
+
+    封装一个共享的 requests.Session：每个主机一个连接池并保持长连接，
+    协商 gzip/brotli 压缩，对幂等请求的连接错误和限流/临时错误状态码按退避策略自动重试
+    （读超时不重试），并统计连接复用情况。
+    """
+
+    # 需要重试的状态码（限流和服务端临时错误）
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_connections: int = 20, pool_maxsize: int = 10,
+                 retries: int = 2, backoff_factor: float = 0.5, max_retry_after: float = 5.0):
+        """
+        Args:
+            pool_connections: 缓存的主机连接池数量
+            pool_maxsize: 每个主机连接池保留的最大连接数
+            retries: 最大重试次数
+            backoff_factor: 重试退避系数，第 n 次重试前等待 backoff_factor * 2^(n-1) 秒
+            max_retry_after: 按 Retry-After 响应头等待的最长时间（秒）
+        """
+        retry = CappedRetry(
+            total=retries,
+            read=False,  # 读超时直接抛出不重试：慢服务端重试只会成倍占用线程和主机并发名额
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['HEAD', 'GET']),  # 只重试幂等请求
+            respect_retry_after_header=True,
+            raise_on_status=False,  # 重试耗尽后返回最后一次响应，由调用方处理状态码
+            max_retry_after=max_retry_after
+        )
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate, br' if _HAS_BROTLI else 'gzip, deflate'
+
+        self._request_count = 0
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """通过共享会话发送请求"""
+        with self._lock:
+            self._request_count += 1
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PATCH', url, **kwargs)
+
+    @staticmethod
+    def attempt_started(response: requests.Response, default: float) -> float:
+        """响应所属的那次尝试的开始时间（time.perf_counter()）
+
+        发生过重试时为最后一次尝试的开始时间，否则返回 default（调用方记录的请求开始时间）。
+        """
+        retries = getattr(response.raw, 'retries', None)
+        return getattr(retries, 'attempt_started', None) or default
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接复用统计
+
+        Returns:
+            包含总请求数、新建连接数、复用次数以及各主机明细的字典
+        """
+        hosts = {}
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            stats = hosts.setdefault(host, {'requests': 0, 'connections': 0})
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+
+        total_requests = sum(item['requests'] for item in hosts.values())
+        total_connections = sum(item['connections'] for item in hosts.values())
+        for item in hosts.values():
+            item['reused'] = max(0, item['requests'] - item['connections'])
+
+        return {
+            'requests': self._request_count,
+            'pool_requests': total_requests,
+            'connections': total_connections,
+            'reused': max(0, total_requests - total_connections),
+            'brotli': _HAS_BROTLI,
+            'hosts': hosts
+        }
+
+    def close(self):
+        """关闭会话和所有连接池"""
+        self.session.close()
@@ -0,0 +1,216 @@
+import ssl
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 基于 UDP/QUIC 的协议无法用 TCP 握手测速
+UDP_TYPES = frozenset(['hysteria', 'hysteria2', 'tuic', 'wireguard'])
+# 协议本身使用 TLS 的节点类型
+TLS_TYPES = frozenset(['trojan'])
+
+# 测速目标：(服务器, 端口, TLS 握手使用的 SNI，不需要 TLS 时为 None)
+Target = Tuple[str, int, Optional[str]]
+
+
+def probe_target(proxy: Dict[str, Any]) -> Optional[Target]:
+    """根据节点配置得到测速目标，无法测速的节点（UDP 协议、缺少地址）返回 None"""
+    server = proxy.get('server')
+    if not server or str(proxy.get('type', '')).lower() in UDP_TYPES:
+        return None
+    try:
+        port = int(proxy.get('port'))
+    except (TypeError, ValueError):
+        return None
+
+    sni = None
+    if (proxy.get('tls') is True or 'reality-opts' in proxy
+            or str(proxy.get('type', '')).lower() in TLS_TYPES):
+        sni = proxy.get('sni') or proxy.get('servername') or str(server)
+    return str(server), port, sni
+
+
+class LatencyProber:
+    """节点延迟测试
+
+    对每个节点的 server:port 测量 TCP 连接时间，启用 TLS 的节点再测量 TLS 握手时间。
+    所有目标在同一个事件循环中并发测试，并发数有上限，每个目标有独立的超时；
+    结果按目标缓存，有效期内不重复测试。
+    """
+
+    def __init__(self, concurrency: int = 64, timeout: float = 3.0, ttl: float = 300, resolver=None):
+        """
+        Args:
+            concurrency: 同时进行的测试数上限
+            timeout: 每个目标的超时时间（秒，包含 TCP 连接和 TLS 握手）
+            ttl: 结果缓存有效期（秒）
+            resolver: 共享的 DnsResolver，提供时先批量解析域名，连接时间不含 DNS 解析
+        """
+        self.resolver = resolver
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ttl = ttl
+        self._cache = {}  # {target: (测试时间, 结果)}
+        self._lock = threading.Lock()
+
+        # 只测量握手耗时，不校验证书
+        self._ssl_context = ssl.create_default_context()
+        self._ssl_context.check_hostname = False
+        self._ssl_context.verify_mode = ssl.CERT_NONE
+
+    async def _probe_one(self, semaphore: asyncio.Semaphore, target: Target, address: str) -> Dict[str, Any]:
+        host, port, sni = target
+        if address is None:
+            return {'ok': False, 'tcp': None, 'tls': None, 'latency': None, 'error': 'DNS 解析失败'}
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            transport = None
+            tcp_ms = None
+            started = time.perf_counter()
+            try:
+                transport, protocol = await asyncio.wait_for(
+                    loop.create_connection(asyncio.Protocol, address, port), self.timeout)
+                tcp_ms = (time.perf_counter() - started) * 1000
+
+                tls_ms = None
+                if sni is not None:
+                    tls_started = time.perf_counter()
+                    remaining = max(0.001, self.timeout - (tls_started - started))
+                    transport = await asyncio.wait_for(
+                        loop.start_tls(transport, protocol, self._ssl_context, server_hostname=sni), remaining)
+                    tls_ms = (time.perf_counter() - tls_started) * 1000
+
+                return {
+                    'ok': True,
+                    'tcp': round(tcp_ms, 1),
+                    'tls': round(tls_ms, 1) if tls_ms is not None else None,
+                    'latency': round(tcp_ms + (tls_ms or 0), 1),
+                    'error': None
+                }
+            except asyncio.TimeoutError:
+                error = '超时'
+            except (OSError, ssl.SSLError, ValueError) as e:
+                error = str(e) or type(e).__name__
+            finally:
+                if transport is not None:
+                    transport.close()
+
+            # TCP 连接成功但 TLS 握手失败时保留 TCP 连接时间，便于排查
+            return {
+                'ok': False,
+                'tcp': round(tcp_ms, 1) if tcp_ms is not None else None,
+                'tls': None,
+                'latency': None,
+                'error': error
+            }
+
+    async def _probe_all(self, targets: List[Target]) -> List[Dict[str, Any]]:
+        # 信号量需在事件循环内创建
+        semaphore = asyncio.Semaphore(self.concurrency)
+        if self.resolver is not None:
+            resolved = await self.resolver.resolve_many_async(host for host, _, _ in targets)
+            addresses = [(resolved.get(host) or [None])[0] for host, _, _ in targets]
+        else:
+            addresses = [host for host, _, _ in targets]
+        return await asyncio.gather(*(self._probe_one(semaphore, target, address)
+                                      for target, address in zip(targets, addresses)))
+
+    def probe_targets(self, targets: List[Target]) -> Dict[Target, Dict[str, Any]]:
+        """测试一组目标，有效期内的结果直接使用缓存"""
+        now = time.time()
+        results = {}
+        pending = []
+        with self._lock:
+            for target in set(targets):
+                cached = self._cache.get(target)
+                if cached and now - cached[0] < self.ttl:
+                    results[target] = cached[1]
+                else:
+                    pending.append(target)
+
+        if pending:
+            measured = asyncio.run(self._probe_all(pending))
+            checked_at = time.time()
+            with self._lock:
+                for target, result in zip(pending, measured):
+                    self._cache[target] = (checked_at, result)
+                    results[target] = result
+                # 顺便清理过期条目
+                for target in [t for t, (at, _) in self._cache.items() if checked_at - at >= self.ttl]:
+                    del self._cache[target]
+        return results
+
+    def annotate(self, proxies: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """测试节点并把延迟（毫秒）写入 _latency 字段
+
+        Returns:
+            与节点一一对应的测试结果，无法测速的节点为 None
+        """
+        targets = [probe_target(proxy) for proxy in proxies]
+        measured = self.probe_targets([target for target in targets if target is not None])
+
+        results = []
+        for proxy, target in zip(proxies, targets):
+            result = measured.get(target) if target is not None else None
+            proxy['_latency'] = result['latency'] if result else None
+            results.append(result)
+        return results
+
+    def select_fastest(self, proxies: List[Dict[str, Any]], top_n: int = None,
+                       max_latency: float = None,
+                       keep: Callable[[Dict[str, Any]], bool] = None) -> List[Dict[str, Any]]:
+        """按延迟排序和筛选节点
+
+        测试失败或超过 max_latency 的节点被丢弃；每个地区（_region）内按延迟从低到高排序，
+        只保留前 top_n 个。无法测速的节点（如 UDP 协议）视为延迟未知，排在同地区已测速节点之后。
+
+        Args:
+            proxies: 节点列表
+            top_n: 每个地区保留的节点数，为 None 时不限制
+            max_latency: 允许的最大延迟（毫秒）
+            keep: 判断节点是否必须保留（不参与测试和筛选）的函数，如链式代理用到的节点
+
+        Returns:
+            必须保留的节点（原顺序）加上按地区分组、按延迟排序后的节点
+        """
+        kept = [proxy for proxy in proxies if keep and keep(proxy)]
+        candidates = [proxy for proxy in proxies if not (keep and keep(proxy))]
+        results = self.annotate(candidates)
+
+        groups = {}  # {地区: [(排序键, 节点)]}，按地区首次出现的顺序
+        for position, (proxy, result) in enumerate(zip(candidates, results)):
+            if result is not None:
+                if not result['ok']:
+                    continue
+                if max_latency is not None and result['latency'] > max_latency:
+                    continue
+                sort_key = (0, result['latency'], position)
+            else:
+                sort_key = (1, 0, position)
+            groups.setdefault(proxy.get('_region', ''), []).append((sort_key, proxy))
+
+        selected = list(kept)
+        for ranked in groups.values():
+            ranked.sort(key=lambda item: item[0])
+            if top_n is not None:
+                ranked = ranked[:top_n]
+            selected.extend(proxy for _, proxy in ranked)
+        return selected
+
+    def clear(self):
+        """清空缓存的测试结果"""
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            ok = sum(1 for _, result in self._cache.values() if result['ok'])
+            return {
+                'entries': len(self._cache),
+                'reachable': ok,
+                'unreachable': len(self._cache) - ok,
+                'ttl': self.ttl,
+                'concurrency': self.concurrency,
+                'timeout': self.timeout
+            }
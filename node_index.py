@@ -0,0 +1,275 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Set, Tuple
+
+from proxy_filter import NodeFilter
+
+# 决定节点连接身份的字段：相同的服务器、端口、协议和凭据视为同一个节点
+IDENTITY_FIELDS = ('type', 'server', 'port', 'ports', 'cipher', 'password', 'uuid',
+                   'username', 'auth', 'auth-str', 'private-key', 'network',
+                   # 传输层和 TLS 路由字段：共用同一个 CDN 入口的节点靠它们区分实际后端
+                   'tls', 'servername', 'sni', 'peer', 'flow', 'alterId',
+                   'ws-opts', 'ws-path', 'ws-headers', 'h2-opts', 'http-opts', 'grpc-opts', 'reality-opts',
+                   'plugin', 'plugin-opts', 'obfs', 'obfs-param', 'obfs-password', 'protocol', 'protocol-param')
+
+# 去重策略
+DEDUPE_NONE = 'none'              # 不去重
+DEDUPE_KEEP_FIRST = 'first'       # 保留第一个出现的节点
+DEDUPE_PREFER_SOURCE = 'prefer'   # 优先保留指定订阅中的节点
+DEDUPE_MERGE_NAMES = 'merge_names'  # 保留第一个，并把其他副本的名称记录到 _aliases（接口返回和节点列表中可见，生成的配置中不包含）
+DEDUPE_POLICIES = (DEDUPE_NONE, DEDUPE_KEEP_FIRST, DEDUPE_PREFER_SOURCE, DEDUPE_MERGE_NAMES)
+
+# 不区分大小写的身份字段（协议名、域名和加密方式）
+CASE_INSENSITIVE_FIELDS = ('type', 'server', 'cipher', 'network', 'servername', 'sni', 'peer')
+_SERVER_INDEX = IDENTITY_FIELDS.index('server')
+_SNI_INDEX = IDENTITY_FIELDS.index('sni')
+_SNI_FIELDS = ('sni', 'servername', 'peer')
+
+
+def parse_dedupe_options(options: Any) -> Dict[str, Any]:
+    """校验去重选项，在开始获取订阅之前调用
+
+    Args:
+        options: 请求中的去重选项，None 表示使用默认值
+
+    Returns:
+        {'policy': str, 'preferred_sources': List[str], 'resolve': bool}
+
+    Raises:
+        ValueError: 选项不是对象、策略不受支持、preferred_sources 不是 URL 列表或 resolve 不是布尔值
+    """
+    if options is None:
+        options = {}
+    if not isinstance(options, dict):
+        raise ValueError("去重选项必须是对象")
+    policy = options.get('policy', DEDUPE_KEEP_FIRST)
+    if policy not in DEDUPE_POLICIES:
+        raise ValueError(f"不支持的去重策略: {policy}")
+    preferred = options.get('preferred_sources') or []
+    if not isinstance(preferred, list) or not all(isinstance(url, str) for url in preferred):
+        raise ValueError("preferred_sources 必须是订阅 URL 列表")
+    resolve = options.get('resolve', False)
+    if not isinstance(resolve, bool):
+        raise ValueError("resolve 必须是 true 或 false")
+    return {'policy': policy, 'preferred_sources': preferred, 'resolve': resolve}
+
+
+def _normalize_identity(value: Any, lowercase: bool = False) -> Any:
+    """规范化身份字段的值：去掉首尾空白，数字字符串转为整数，'true'/'false' 转为布尔值"""
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        if value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        return value.lower() if lowercase else value
+    if isinstance(value, dict):
+        return {str(key): _normalize_identity(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_identity(item) for item in value]
+    return value
+
+
+def node_fingerprint(proxy: Dict[str, Any], address: str = None) -> str:
+    """计算节点连接身份的指纹
+
+    与节点名称无关；端口等字段的字符串和数字写法（"443" 与 443）、协议名和域名的大小写视为相同，
+    嵌套的选项按键排序后参与计算。
+
+    Args:
+        proxy: 节点
+        address: 服务器解析得到的后端地址，提供时代替服务器域名参与计算；
+            启用 TLS 且未指定 SNI 的节点以原域名作为 SNI，共用 CDN 入口的不同域名不会被视为同一节点
+    """
+    identity = [_normalize_identity(proxy.get(field), field in CASE_INSENSITIVE_FIELDS)
+                for field in IDENTITY_FIELDS]
+    if address is not None:
+        if NodeFilter.has_tls(proxy) and not any(proxy.get(field) for field in _SNI_FIELDS):
+            identity[_SNI_INDEX] = identity[_SERVER_INDEX]
+        identity[_SERVER_INDEX] = address
+    raw = json.dumps(identity, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def backend_fingerprints(proxy: Dict[str, Any], backends: Dict[str, List[str]] = None) -> List[str]:
+    """按服务器的每个后端地址计算指纹，服务器未解析时只有按域名计算的一个指纹
+
+    Args:
+        backends: {域名: [ip, ...]}，见 dns_resolver.group_hosts
+    """
+    addresses = backends.get(str(proxy.get('server') or '')) if backends else None
+    if not addresses:
+        return [node_fingerprint(proxy)]
+    return [node_fingerprint(proxy, address) for address in addresses]
+
+
+def dedupe_sources(sources: List[List[Dict[str, Any]]], policy: str = DEDUPE_KEEP_FIRST,
+                   source_ids: List[str] = None,
+                   preferred_sources: List[str] = None,
+                   backends: Dict[str, List[str]] = None) -> Tuple[List[List[Dict[str, Any]]], List[int]]:
+    """对多个订阅的节点列表做跨订阅去重
+
+    只丢弃其他订阅中已经出现的节点；同一订阅内身份相同的多个节点由订阅自身决定，全部保留。
+
+    Args:
+        sources: 每个订阅过滤后的节点列表，按订阅顺序排列
+        policy: 去重策略，见 DEDUPE_POLICIES
+        source_ids: 每个订阅的标识（如 URL），用于 prefer 策略
+        preferred_sources: prefer 策略下的订阅优先级，越靠前越优先
+        backends: 服务器的后端地址（见 dns_resolver.group_hosts），提供时指向同一后端的不同域名视为同一服务器
+
+    Returns:
+        (去重后的各订阅节点列表, 各订阅被丢弃的重复节点数)
+    """
+    if policy not in DEDUPE_POLICIES:
+        raise ValueError(f"不支持的去重策略: {policy}")
+
+    dropped = [0] * len(sources)
+    if policy == DEDUPE_NONE:
+        return sources, dropped
+
+    # 指纹索引：{fingerprint: (优先级, 订阅序号, 该订阅中首个节点的序号)}
+    index = {}
+    # group_hosts 为同一后端的域名给出相同的地址列表，取第一个地址即可
+    fingerprints = [[backend_fingerprints(proxy, backends)[0] for proxy in proxies] for proxies in sources]
+
+    ranks = [0] * len(sources)
+    if policy == DEDUPE_PREFER_SOURCE:
+        source_ids = source_ids or []
+        priority = {source: rank for rank, source in enumerate(preferred_sources or [])}
+        ranks = [priority.get(source_ids[i] if i < len(source_ids) else None, len(priority))
+                 for i in range(len(sources))]
+    for src, prints in enumerate(fingerprints):
+        for pos, fp in enumerate(prints):
+            candidate = (ranks[src], src, pos)
+            if fp not in index or candidate[:2] < index[fp][:2]:
+                index[fp] = candidate
+
+    result = []
+    for src, proxies in enumerate(sources):
+        kept = []
+        for pos, proxy in enumerate(proxies):
+            fp = fingerprints[src][pos]
+            _, keep_src, keep_pos = index[fp]
+            if keep_src == src:
+                kept.append(proxy)
+                continue
+            dropped[src] += 1
+            if policy == DEDUPE_MERGE_NAMES:
+                winner = sources[keep_src][keep_pos]
+                name = proxy.get('name')
+                if name and name != winner.get('name') and name not in winner.get('_aliases', []):
+                    winner.setdefault('_aliases', []).append(name)
+        result.append(kept)
+
+    return result, dropped
+
+
+def _short_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:6]
+
+
+def assign_node_ids(proxies: List[Dict[str, Any]], prefix: str = 'proxy',
+                    used: Set[str] = None, source: str = None) -> List[Dict[str, Any]]:
+    """根据节点连接身份为节点生成稳定的 _id
+
+    同一节点在多次获取之间 ID 保持不变，不受订阅中节点顺序、到达顺序或增删的影响。
+    同一列表中身份相同的节点按名称排序，第一个使用基础 ID，其余追加名称摘要，名称也相同时再追加序号。
+
+    Args:
+        proxies: 节点列表（原地修改）
+        prefix: ID 前缀，如 'proxy' 或 'custom'
+        used: 已分配的 ID 集合，与其冲突的 ID 追加序号（会被更新）
+        source: 订阅标识；不去重时按订阅分别分配，传入 URL 使多个订阅中的同一节点 ID 不同
+
+    Returns:
+        传入的节点列表
+    """
+    if used is None:
+        used = set()
+    suffix = f"_{_short_hash(source)}" if source is not None else ''
+
+    groups = {}
+    for proxy in proxies:
+        groups.setdefault(f"{prefix}_{node_fingerprint(proxy)[:12]}{suffix}", []).append(proxy)
+
+    for base_id, members in groups.items():
+        if len(members) > 1:
+            members = sorted(members, key=lambda proxy: (str(proxy.get('name', '')), node_digest(proxy)))
+        for rank, proxy in enumerate(members):
+            node_id = base_id if rank == 0 else f"{base_id}_{_short_hash(str(proxy.get('name', '')))}"
+            candidate = node_id
+            counter = 2
+            while candidate in used:
+                candidate = f"{node_id}_{counter}"
+                counter += 1
+            used.add(candidate)
+            proxy['_id'] = candidate
+    return proxies
+
+
+def node_digest(proxy: Dict[str, Any]) -> str:
+    """计算节点完整内容的摘要（不含 _id 和每次测速都会变化的 _latency），用于判断节点是否发生变化"""
+    content = {key: value for key, value in proxy.items() if key not in ('_id', '_latency')}
+    raw = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class SnapshotStore:
+    """保存每个订阅最近一次获取的节点快照，用于增量刷新
+
+    快照版本由节点 ID 和内容摘要计算得出，内容不变时版本也不变。
+    每个订阅保留最近几个版本，多个客户端各自轮询时不会使对方持有的版本失效。
+    客户端提交的版本仍在保留范围内时，只返回新增、删除和变化的节点；
+    否则（首次获取或版本已过期）返回该订阅的全部节点并标记为重置。
+    """
+
+    def __init__(self, max_entries: int = 256, versions_per_key: int = 8):
+        self.max_entries = max_entries
+        self.versions_per_key = versions_per_key
+        self._snapshots = {}  # {(url, options_key): OrderedDict{version: {node_id: digest}}}，最近的版本在最后
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(digests: Dict[str, str]) -> str:
+        raw = '\n'.join(f"{node_id}:{digest}" for node_id, digest in sorted(digests.items()))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+    def diff(self, url: str, options_key: str, proxies: List[Dict[str, Any]],
+             client_version: str = None) -> Dict[str, Any]:
+        """与客户端持有的快照比较，并保存新的快照
+
+        Args:
+            url: 订阅 URL
+            options_key: 过滤/去重选项的标识，不同选项的快照互不影响
+            proxies: 该订阅本次获取的节点（需已包含 _id）
+            client_version: 客户端持有的快照版本
+
+        Returns:
+            {'version', 'reset', 'added', 'changed', 'removed'}
+        """
+        digests = {proxy['_id']: node_digest(proxy) for proxy in proxies}
+        version = self._version(digests)
+        key = (url, options_key)
+
+        with self._lock:
+            versions = self._snapshots.pop(key, None) or OrderedDict()
+            old_digests = versions.get(client_version) if client_version is not None else None
+            versions.pop(version, None)
+            versions[version] = digests
+            while len(versions) > self.versions_per_key:
+                versions.popitem(last=False)
+            self._snapshots[key] = versions
+            while len(self._snapshots) > self.max_entries:
+                self._snapshots.pop(next(iter(self._snapshots)))
+
+        if old_digests is None:
+            return {'version': version, 'reset': True, 'added': proxies, 'changed': [], 'removed': []}
+
+        added = [proxy for proxy in proxies if proxy['_id'] not in old_digests]
+        changed = [proxy for proxy in proxies
+                   if proxy['_id'] in old_digests and old_digests[proxy['_id']] != digests[proxy['_id']]]
+        removed = [node_id for node_id in old_digests if node_id not in digests]
+        return {'version': version, 'reset': False, 'added': added, 'changed': changed, 'removed': removed}
@@ -0,0 +1,368 @@
+import re
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 自定义关键词匹配到的节点所属的地区标记
+CUSTOM_REGION = 'custom'
+
+# 正则表达式中需要转义的字符（- 在字符类外部不是特殊字符），以及字符类内部需要转义的字符
+_REGEX_ESCAPES = {char: '\\' + char for char in '.^$*+?{}[]()|\\'}
+_CLASS_ESCAPES = {char: '\\' + char for char in '\\]^-['}
+_TRIE_END = None  # 前缀树中表示名称结束的键
+
+
+class RegionMatcher:
+    """预编译的地区关键词匹配器
+
+    所有关键词预先转为小写，合并为一个交替正则，每个节点名称只需小写一次、搜索一次，
+    并能直接得到匹配的地区。
+    """
+
+    def __init__(self, keyword_map: Tuple[Tuple[str, Tuple[str, ...]], ...]):
+        """
+        Args:
+            keyword_map: ((地区, (关键词, ...)), ...)，同一关键词出现在多个地区时以先出现的为准
+        """
+        self._region_of = {}  # {小写关键词: 地区}
+        for region, keywords in keyword_map:
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword and keyword not in self._region_of:
+                    self._region_of[keyword] = region
+
+        # 较长的关键词放在前面，同一位置优先匹配更具体的关键词
+        alternatives = sorted(self._region_of, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(kw) for kw in alternatives)) if alternatives else None
+
+    @property
+    def empty(self) -> bool:
+        return self._pattern is None
+
+    def match(self, name: str) -> Optional[str]:
+        """返回名称匹配到的地区，没有匹配时返回 None"""
+        if self._pattern is None:
+            return None
+        found = self._pattern.search(name.lower())
+        return self._region_of[found.group(0)] if found else None
+
+
+@lru_cache(maxsize=64)
+def compile_region_matcher(keyword_map: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> RegionMatcher:
+    """按过滤配置缓存编译好的匹配器，相同配置只编译一次"""
+    return RegionMatcher(keyword_map)
+
+
+def build_keyword_map(region_keywords: Dict[str, list], regions: list,
+                      keywords: list = None) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    """根据选择的地区和自定义关键词，构建可哈希的关键词映射，用作匹配器的缓存键"""
+    keyword_map = tuple((region, tuple(region_keywords[region]))
+                        for region in regions if region in region_keywords)
+    if keywords:
+        keyword_map += ((CUSTOM_REGION, tuple(keywords)),)
+    return keyword_map
+
+
+class NodeFilter:
+    """编译后的节点过滤规则
+
+    除地区/关键词外，还支持名称包含/排除正则、协议类型、端口范围、必须启用 TLS，
+    以及每个地区的最大节点数。规则只编译一次，可在解析流中逐个节点判断。
+    """
+
+    # 协议本身强制使用 TLS 的节点类型
+    TLS_TYPES = frozenset(['trojan', 'hysteria', 'hysteria2', 'tuic'])
+
+    def __init__(self, region_matcher: RegionMatcher, filter_options: Dict[str, Any],
+                 require_region: bool = True, known_regions: RegionMatcher = None):
+        """
+        Args:
+            region_matcher: 地区匹配器，匹配到的地区会写入节点的 _region 字段
+            require_region: 是否要求名称匹配到地区，为 False 时仅标注地区
+            known_regions: 全部地区的匹配器，resolve_regions 时名称属于其他地区的节点不参与推断
+            filter_options: 过滤选项，可包含：
+                - include_regex: str - 名称必须匹配的正则（不区分大小写）
+                - exclude_regex: str - 名称匹配则排除的正则（不区分大小写）
+                - types: str | List[str] - 允许的协议类型，如 "ss,trojan" 或 ['ss', 'trojan']
+                - ports: str | List - 允许的端口或端口范围，如 "443,8000-9000"
+                - tls_required: bool - 是否只保留启用 TLS 的节点
+                - max_per_region: int - 每个地区最多保留的节点数
+                - latency_top_n: int - 测速后每个地区只保留延迟最低的 N 个节点
+                - max_latency: float - 测速后丢弃延迟超过该值（毫秒）的节点
+                - resolve_regions: bool - 名称中没有地区的节点使用同一后端 IP 上其他节点的地区
+                  （需要解析服务器地址，见 apply_backend_regions）
+        """
+        self.region_matcher = region_matcher
+        self.require_region = require_region
+        self.known_regions = known_regions
+        self.resolve_regions = bool(filter_options.get('resolve_regions', False))
+        self.include_re = self._compile_regex(filter_options.get('include_regex'), 'include_regex')
+        self.exclude_re = self._compile_regex(filter_options.get('exclude_regex'), 'exclude_regex')
+        self.types = self._parse_types(filter_options.get('types'))
+        self.port_ranges = self._parse_port_ranges(filter_options.get('ports'))
+        self.tls_required = bool(filter_options.get('tls_required', False))
+        max_per_region = filter_options.get('max_per_region')
+        self.max_per_region = int(max_per_region) if max_per_region else None
+        latency_top_n = filter_options.get('latency_top_n')
+        self.latency_top_n = int(latency_top_n) if latency_top_n else None
+        max_latency = filter_options.get('max_latency')
+        self.max_latency = float(max_latency) if max_latency else None
+
+    @property
+    def latency_enabled(self) -> bool:
+        """是否需要对节点测速"""
+        return self.latency_top_n is not None or self.max_latency is not None
+
+    @staticmethod
+    def _compile_regex(pattern: Optional[str], field: str):
+        if not pattern:
+            return None
+        try:
+            return re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"{field} 不是有效的正则表达式: {e}")
+
+    @staticmethod
+    def _parse_types(types) -> Optional[frozenset]:
+        """将 "ss,trojan" 或 ['ss', 'trojan'] 解析为小写的类型集合"""
+        if not types:
+            return None
+        items = types.split(',') if isinstance(types, str) else types
+        if not isinstance(items, (list, tuple, set, frozenset)):
+            raise ValueError(f"types 格式无效: {types}")
+        parsed = frozenset(str(item).strip().lower() for item in items if str(item).strip())
+        return parsed or None
+
+    @staticmethod
+    def _parse_port_ranges(ports) -> Optional[Tuple[Tuple[int, int], ...]]:
+        """将 "443,8000-9000" 或 [443, "8000-9000"] 解析为 ((443, 443), (8000, 9000))"""
+        if not ports:
+            return None
+        items = ports.split(',') if isinstance(ports, str) else ports
+        ranges = []
+        try:
+            for item in items:
+                item = str(item).strip()
+                if not item:
+                    continue
+                if '-' in item:
+                    low, high = item.split('-', 1)
+                    ranges.append((int(low), int(high)))
+                else:
+                    ranges.append((int(item), int(item)))
+        except ValueError:
+            raise ValueError(f"ports 格式无效: {ports}")
+        return tuple(ranges) or None
+
+    def _port_allowed(self, port) -> bool:
+        try:
+            port = int(port)
+        except (TypeError, ValueError):
+            return False
+        return any(low <= port <= high for low, high in self.port_ranges)
+
+    @classmethod
+    def has_tls(cls, proxy: Dict[str, Any]) -> bool:
+        """节点是否启用 TLS（显式开启、协议强制或使用 REALITY）"""
+        return (proxy.get('tls') is True
+                or str(proxy.get('type', '')).lower() in cls.TLS_TYPES
+                or 'reality-opts' in proxy)
+
+    def accept(self, proxy: Dict[str, Any]) -> bool:
+        """判断单个节点是否通过过滤（不含每地区数量限制），并标注 _region"""
+        if not isinstance(proxy, dict):
+            return False
+        name = proxy.get('name')
+        if not isinstance(name, str):
+            return False
+
+        if self.types is not None and str(proxy.get('type', '')).lower() not in self.types:
+            return False
+        if self.port_ranges is not None and not self._port_allowed(proxy.get('port')):
+            return False
+        if self.tls_required and not self.has_tls(proxy):
+            return False
+        if self.exclude_re is not None and self.exclude_re.search(name):
+            return False
+        if self.include_re is not None and not self.include_re.search(name):
+            return False
+
+        region = self.region_matcher.match(name)
+        if region:
+            proxy['_region'] = region
+        elif self.require_region:
+            # 名称中没有任何地区的节点先保留，由 apply_backend_regions 按后端地址决定
+            if not self.resolve_regions:
+                return False
+            if self.known_regions is not None and self.known_regions.match(name):
+                return False
+        return True
+
+    def apply_backend_regions(self, proxies: List[Dict[str, Any]],
+                              backends: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+        """为名称中没有地区的节点推断地区（resolve_regions）
+
+        与已标注地区的节点指向同一后端（见 dns_resolver.group_hosts）时使用其地区；
+        仍然没有地区且要求匹配地区的节点被丢弃。
+
+        Args:
+            proxies: 通过 accept 的节点
+            backends: {域名: 所在后端的全部地址}
+
+        Returns:
+            保留的节点列表
+        """
+        def backend_key(proxy):
+            addresses = backends.get(str(proxy.get('server') or ''))
+            return addresses[0] if addresses else None
+
+        region_of = {}  # {后端地址: 地区}
+        for proxy in proxies:
+            key = backend_key(proxy)
+            if key is not None and proxy.get('_region'):
+                region_of.setdefault(key, proxy['_region'])
+
+        result = []
+        for proxy in proxies:
+            if not proxy.get('_region'):
+                region = region_of.get(backend_key(proxy))
+                if region:
+                    proxy['_region'] = region
+                elif self.require_region:
+                    continue
+            result.append(proxy)
+        return result
+
+    def new_limiter(self, limit: int = None) -> Optional[Callable[[Dict[str, Any]], bool]]:
+        """创建每地区数量限制的判断函数（有状态，每次获取新建一个），未设置上限时返回 None
+
+        Args:
+            limit: 每个地区的上限，默认使用 max_per_region
+        """
+        limit = limit or self.max_per_region
+        if not limit:
+            return None
+        counts = {}
+
+        def within_limit(proxy: Dict[str, Any]) -> bool:
+            region = proxy.get('_region', '')
+            if counts.get(region, 0) >= limit:
+                return False
+            counts[region] = counts.get(region, 0) + 1
+            return True
+
+        return within_limit
+
+    def make_predicate(self) -> Callable[[Dict[str, Any]], bool]:
+        """组合过滤规则和数量限制，得到可在解析流中使用的判断函数（不含 resolve_regions 的地区推断）"""
+        limiter = self.new_limiter()
+        if limiter is None:
+            return self.accept
+        return lambda proxy: self.accept(proxy) and limiter(proxy)
+
+
+@lru_cache(maxsize=64)
+def _compile_node_filter(options_key: str, region_keywords_key: str) -> NodeFilter:
+    filter_options = json.loads(options_key)
+    region_keywords = json.loads(region_keywords_key)
+    regions = filter_options.get('regions', [])
+    keywords = filter_options.get('keywords', [])
+
+    if 'all' in regions:
+        # 不按地区过滤，只用全部地区关键词标注地区
+        matcher = compile_region_matcher(build_keyword_map(region_keywords, list(region_keywords), keywords))
+        return NodeFilter(matcher, filter_options, require_region=False)
+
+    matcher = compile_region_matcher(build_keyword_map(region_keywords, regions, keywords))
+    known_regions = compile_region_matcher(build_keyword_map(region_keywords, list(region_keywords), keywords))
+    return NodeFilter(matcher, filter_options, known_regions=known_regions)
+
+
+def compile_node_filter(filter_options: Dict[str, Any], region_keywords: Dict[str, list]) -> NodeFilter:
+    """编译过滤选项，相同的过滤配置只编译一次
+
+    Raises:
+        ValueError: 正则表达式或端口范围无效
+    """
+    options_key = json.dumps(filter_options, sort_keys=True, ensure_ascii=False)
+    region_keywords_key = json.dumps(region_keywords, sort_keys=True, ensure_ascii=False)
+    return _compile_node_filter(options_key, region_keywords_key)
+
+
+def _char_class(chars: list) -> str:
+    """将已排序的字符输出为字符类，连续 3 个以上的字符写成范围，如 [0-9]"""
+    parts = []
+    i = 0
+    while i < len(chars):
+        j = i
+        while j + 1 < len(chars) and ord(chars[j + 1]) == ord(chars[j]) + 1:
+            j += 1
+        if j - i >= 2:
+            parts.append(_CLASS_ESCAPES.get(chars[i], chars[i]) + '-' + _CLASS_ESCAPES.get(chars[j], chars[j]))
+        else:
+            parts.extend(_CLASS_ESCAPES.get(c, c) for c in chars[i:j + 1])
+        i = j + 1
+    return '[' + ''.join(parts) + ']'
+
+
+def _build_trie_regex(node: Dict) -> str:
+    """将前缀树的一个节点输出为正则，匹配从该节点到各个名称结尾的所有后缀"""
+    # 按首字符之后的部分分组：后缀相同的分支合并为字符类，如 HK 1 港|HK 2 港 -> HK [12] 港
+    by_tail = {}  # {后缀正则: [首字符, ...]}
+    for char in sorted(key for key in node if key is not _TRIE_END):
+        child = node[char]
+        # 只有一个分支的路径直接连接，不产生分组
+        parts = []
+        while len(child) == 1 and _TRIE_END not in child:
+            next_char, child = next(iter(child.items()))
+            parts.append(_REGEX_ESCAPES.get(next_char, next_char))
+        tail = ''.join(parts) + _build_trie_regex(child)
+        by_tail.setdefault(tail, []).append(char)
+
+    alternatives = []
+    for tail, chars in by_tail.items():
+        # 只合并 BMP 字符，避免按 UTF-16 处理的正则引擎拆开代理对
+        class_chars = [c for c in chars if ord(c) < 0x10000]
+        if len(class_chars) < 2:
+            class_chars = []
+        for char in chars:
+            if char not in class_chars:
+                alternatives.append(_REGEX_ESCAPES.get(char, char) + tail)
+        if class_chars:
+            alternatives.append(_char_class(class_chars) + tail)
+
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1:
+        body = alternatives[0]
+        # 没有后缀的单个字符（或字符类）可以直接加 ?，否则需要分组
+        single_unit = '' in by_tail
+    else:
+        body = '(?:' + '|'.join(alternatives) + ')'
+        single_unit = True
+
+    if _TRIE_END in node:
+        # 名称可以在这里结束，其余部分可选
+        return body + '?' if single_unit else '(?:' + body + ')?'
+    return body
+
+
+def build_name_regex(names: Iterable[str]) -> str:
+    """构建匹配任一节点名称的正则表达式
+
+    名称逐字符插入前缀树，共同前缀只出现一次，只以一个字符区分的分支合并为字符类，
+    得到的正则比直接用 | 连接所有名称短得多，匹配时也不必逐个尝试每个名称。
+    与 '|'.join(re.escape(name) ...) 匹配完全相同的字符串集合；忽略空名称。
+
+    Returns:
+        正则表达式（未做 YAML 转义），没有名称时返回空字符串
+    """
+    root = {}
+    for name in names:
+        if not name:
+            continue
+        node = root
+        for char in name:
+            node = node.setdefault(char, {})
+        node[_TRIE_END] = True
+    return _build_trie_regex(root)
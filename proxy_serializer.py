@@ -0,0 +1,283 @@
+import re
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List
+
+# 节点行中字段的输出顺序（重要字段优先），其他字段按原顺序排在后面
+FIELD_ORDER = ('name', 'type', 'server', 'port', 'ports', 'mport',
+               'password', 'cipher', 'uuid', 'alterId', 'udp',
+               'skip-cert-verify', 'sni', 'dialer-proxy')
+FIELD_RANK = {key: rank for rank, key in enumerate(FIELD_ORDER)}
+
+# 双引号字符串中需要转义的字符：反斜杠、双引号，以及 YAML 中不可打印或有特殊含义的字符
+_ESCAPE_RE = re.compile('[\\\\"\x00-\x1f\x7f-\x9f\u2028\u2029\ufeff\ufffe\uffff]')
+_ESCAPE_SEARCH = _ESCAPE_RE.search
+_ESCAPES = {
+    '\\': '\\\\', '"': '\\"', '\0': '\\0', '\a': '\\a', '\b': '\\b', '\t': '\\t',
+    '\n': '\\n', '\v': '\\v', '\f': '\\f', '\r': '\\r', '\x1b': '\\e',
+    '\x85': '\\N', '\u2028': '\\L', '\u2029': '\\P'
+}
+
+# 可以不加引号输出的键，且不会被解析为布尔值或 null
+_PLAIN_KEY_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_\-]*\Z')
+_RESERVED_KEYS = frozenset(['true', 'false', 'yes', 'no', 'on', 'off', 'null'])
+
+
+def _escape_char(match) -> str:
+    char = match.group(0)
+    escaped = _ESCAPES.get(char)
+    if escaped is not None:
+        return escaped
+    code = ord(char)
+    return f'\\x{code:02x}' if code < 0x100 else f'\\u{code:04x}'
+
+
+def quote_string(value: str) -> str:
+    """转为 YAML 双引号字符串"""
+    if _ESCAPE_RE.search(value):
+        value = _ESCAPE_RE.sub(_escape_char, value)
+    return '"' + value + '"'
+
+
+@lru_cache(maxsize=1024)
+def _format_key(key: str) -> str:
+    """格式化映射的键，普通标识符不加引号（节点中的键种类很少，结果缓存）"""
+    if _PLAIN_KEY_RE.match(key) and key.lower() not in _RESERVED_KEYS:
+        return key + ': '
+    return quote_string(key) + ': '
+
+
+def _emit_key(key: Any, out: List[str]):
+    """输出映射的键及其后的冒号"""
+    if isinstance(key, str):
+        out.append(_format_key(key))
+    else:
+        _emit(key, out)
+        out.append(': ')
+
+
+def _emit_float(value: float, out: List[str]):
+    if value != value:
+        out.append('.nan')
+    elif value in (float('inf'), float('-inf')):
+        out.append('.inf' if value > 0 else '-.inf')
+    else:
+        text = repr(value)
+        # 1e-05 这样没有小数点的写法在 YAML 1.1 中会被解析为字符串
+        if '.' not in text and 'e' in text:
+            text = text.replace('e', '.0e', 1)
+        out.append(text)
+
+
+def _emit(value: Any, out: List[str]):
+    """以 flow style 递归输出任意值，所有片段追加到同一个列表中"""
+    if isinstance(value, str):
+        out.append(quote_string(value))
+    elif value is None:
+        out.append('null')
+    elif isinstance(value, bool):
+        out.append('true' if value else 'false')
+    elif isinstance(value, int):
+        out.append(str(value))
+    elif isinstance(value, float):
+        _emit_float(value, out)
+    elif isinstance(value, dict):
+        if not value:
+            out.append('{}')
+            return
+        out.append('{ ')
+        first = True
+        for k, v in value.items():
+            if not first:
+                out.append(', ')
+            first = False
+            _emit_key(k, out)
+            _emit(v, out)
+        out.append(' }')
+    elif isinstance(value, (list, tuple)):
+        out.append('[')
+        first = True
+        for item in value:
+            if not first:
+                out.append(', ')
+            first = False
+            _emit(item, out)
+        out.append(']')
+    else:
+        # 其他类型按字符串输出
+        out.append(quote_string(str(value)))
+
+
+# 节点键序列 -> (输出顺序的键, 对应的 "键: " 前缀, 原顺序的公开键)；同一订阅的节点通常只有少数几种键序列
+_SHAPES = {}
+_MAX_SHAPES = 1024
+
+
+def _shape(keys: tuple):
+    """计算一种键序列的输出顺序：FIELD_ORDER 中的字段在前，其他字段按原顺序在后，内部字段不输出
+
+    含非字符串键时返回 None，由通用路径处理（1 和 True 这样相等的键会落到同一个缓存项）。
+    """
+    public = tuple(key for key in keys if type(key) is str and key[:1] != '_')
+    if len(public) != len(keys) and any(type(key) is not str for key in keys):
+        return None
+    ordered = [key for key in public if key in FIELD_RANK]
+    ordered.sort(key=FIELD_RANK.get)
+    ordered += [key for key in public if key not in FIELD_RANK]
+    return ordered, [_format_key(key) for key in ordered], public
+
+
+def _get_shape(proxy: Dict[str, Any]):
+    keys = tuple(proxy)
+    shape = _SHAPES.get(keys, False)
+    if shape is False:
+        if len(_SHAPES) >= _MAX_SHAPES:
+            _SHAPES.clear()
+        shape = _SHAPES[keys] = _shape(keys)
+    return shape
+
+
+def _render_generic(proxy: Dict[str, Any]) -> str:
+    """逐字段判断顺序的通用渲染，用于含非字符串键的节点"""
+    ordered = [None] * len(FIELD_ORDER)
+    extra = []
+    for item in proxy.items():
+        key, value = item
+        if value is None or (isinstance(key, str) and key[:1] == '_'):
+            continue
+        rank = FIELD_RANK.get(key)
+        if rank is None:
+            extra.append(item)
+        else:
+            ordered[rank] = item
+
+    out = ['  - { ']
+    first = True
+    for item in ordered + extra:
+        if item is None:
+            continue
+        if not first:
+            out.append(', ')
+        first = False
+        _emit_key(item[0], out)
+        _emit(item[1], out)
+    out.append(' }')
+    return ''.join(out)
+
+
+def render_proxy(proxy: Dict[str, Any]) -> str:
+    """将节点渲染为一行 flow style 的 YAML（不含换行符）
+
+    FIELD_ORDER 中的字段在前，其他字段按原顺序在后，以下划线开头的内部字段和值为 None 的字段不输出。
+    字段顺序和键的前缀按键序列缓存，每个节点只需按顺序取值并格式化，整行最后只拼接一次。
+    """
+    shape = _get_shape(proxy)
+    if shape is None:
+        return _render_generic(proxy)
+
+    parts = []
+    for key, prefix in zip(shape[0], shape[1]):
+        value = proxy[key]
+        if value is None:
+            continue
+        # 最常见的字符串、整数和布尔值直接输出，省去函数调用
+        value_type = type(value)
+        if value_type is str:
+            if _ESCAPE_SEARCH(value):
+                value = _ESCAPE_RE.sub(_escape_char, value)
+            parts.append(prefix + '"' + value + '"')
+        elif value_type is int:
+            parts.append(prefix + str(value))
+        elif value_type is bool:
+            parts.append(prefix + ('true' if value else 'false'))
+        else:
+            out = [prefix]
+            _emit(value, out)
+            parts.append(''.join(out))
+    return '  - { ' + ', '.join(parts) + ' }'
+
+
+class ProxySerializer:
+    """带缓存的节点序列化器
+
+    以节点内容为键（字典按其哈希查找）缓存渲染结果，
+    多次生成配置时未变化的节点直接复用上次渲染的行。
+    """
+
+    def __init__(self, max_entries: int = 20000):
+        """
+        Args:
+            max_entries: 最多缓存的节点行数
+        """
+        self.max_entries = max_entries
+        self._lines = OrderedDict()  # {content_key: line}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_key(proxy: Dict[str, Any]) -> Hashable:
+        """节点内容的缓存键
+
+        由公开字段的键序列和值的 repr 组成：比 JSON 序列化加哈希快得多，且保留字段顺序（影响额外字段的输出顺序）。
+        以下划线开头的内部字段（_id、_latency、_source 等）不输出，不参与缓存键，测速结果变化时仍然命中。
+        """
+        shape = _get_shape(proxy)
+        if shape is None:
+            return repr({key: value for key, value in proxy.items() if not (isinstance(key, str) and key[:1] == '_')})
+        public = shape[2]
+        return public, repr(tuple(map(proxy.__getitem__, public)))
+
+    def render(self, proxy: Dict[str, Any]) -> str:
+        """渲染单个节点，命中缓存时不重新格式化"""
+        return self.render_all([proxy])[0]
+
+    def render_all(self, proxies: List[Dict[str, Any]]) -> List[str]:
+        """渲染节点列表，返回每个节点的行
+
+        整批节点只加锁两次：先查找全部缓存，再在锁外渲染未命中的节点，最后一起写入缓存。
+        """
+        keys = [self.content_key(proxy) for proxy in proxies]
+        with self._lock:
+            lines = [self._lines.get(key) for key in keys]
+            hits = 0
+            for key, line in zip(keys, lines):
+                if line is not None:
+                    self._lines.move_to_end(key)
+                    hits += 1
+            self.hits += hits
+
+        if hits == len(lines):
+            return lines
+
+        rendered = {}
+        for index, line in enumerate(lines):
+            if line is None:
+                lines[index] = render_proxy(proxies[index])
+                rendered[keys[index]] = lines[index]
+
+        with self._lock:
+            self.misses += len(lines) - hits
+            self._lines.update(rendered)
+            while len(self._lines) > self.max_entries:
+                self._lines.popitem(last=False)
+        return lines
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._lines.clear()
+            self.hits = self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._lines),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,219 @@
+import os
+import time
+import random
+import threading
+from datetime import datetime
+from typing import Dict, Any, List
+
+from file_store import read_json, update_json
+
+
+class RegenerationScheduler:
+    """后台定时重新生成配置并上传到 Gist
+
+    对已保存的每个命名 Gist，按各自的间隔（加随机抖动）重新执行
+    获取 → 过滤 → 合并 → 上传，节点选择和链式代理设置来自保存的链式代理配置。
+    生成的内容与上次上传的一致时跳过上传（见 ClashConfigManager.publish_to_gist）。
+    """
+
+    DEFAULT_JOB = {
+        'enabled': True,
+        'interval': 3600,              # 运行间隔（秒）
+        'jitter': 300,                 # 随机抖动上限（秒）
+        'filter_options': None         # 为 None 时使用最近一次手动获取节点时的过滤选项
+    }
+
+    def __init__(self, manager, config_file: str = 'data/scheduler.json', tick: float = 5):
+        """
+        Args:
+            manager: ClashConfigManager 实例
+            config_file: 各 Gist 任务设置的保存位置
+            tick: 检查是否有到期任务的间隔（秒）
+        """
+        self.manager = manager
+        self.config_file = config_file
+        self.tick = tick
+        self.default_interval = int(os.getenv('SCHEDULER_INTERVAL', str(self.DEFAULT_JOB['interval'])))
+        self.default_jitter = int(os.getenv('SCHEDULER_JITTER', str(self.DEFAULT_JOB['jitter'])))
+
+        self._status = {}     # {gist_name: 运行状态}
+        self._next_run = {}   # {gist_name: 下次运行的时间戳}
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()  # 同一时间只运行一个任务
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # ---------- 任务设置 ----------
+
+    def load_jobs(self) -> Dict[str, Dict[str, Any]]:
+        """加载每个 Gist 的任务设置，未单独设置的 Gist 使用默认值"""
+        overrides = read_json(self.config_file, {})
+        jobs = {}
+        for name in self.manager.load_gist_configs():
+            job = dict(self.DEFAULT_JOB, interval=self.default_interval, jitter=self.default_jitter)
+            job.update(overrides.get(name, {}))
+            jobs[name] = job
+        return jobs
+
+    def set_job(self, name: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+        """更新某个 Gist 的任务设置
+
+        Args:
+            name: Gist 名称
+            settings: 可包含 enabled、interval、jitter、filter_options
+        """
+        if name not in self.manager.load_gist_configs():
+            raise ValueError(f'Gist "{name}" 不存在')
+
+        allowed = {key: settings[key] for key in self.DEFAULT_JOB if key in settings}
+        if 'interval' in allowed and int(allowed['interval']) < 60:
+            raise ValueError('运行间隔不能小于 60 秒')
+
+        def apply(overrides):
+            overrides.setdefault(name, {}).update(allowed)
+            return overrides
+        update_json(self.config_file, apply, {})
+
+        # 设置变化后重新安排下次运行时间
+        with self._lock:
+            self._next_run.pop(name, None)
+        return self.load_jobs()[name]
+
+    # ---------- 调度 ----------
+
+    def _schedule_next(self, name: str, job: Dict[str, Any], now: float):
+        delay = int(job['interval']) + random.uniform(0, max(0, int(job.get('jitter', 0))))
+        self._next_run[name] = now + delay
+
+    def start(self):
+        """启动后台调度线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='regeneration-scheduler', daemon=True)
+        self._thread.start()
+        print("[Scheduler] 后台定时生成已启动")
+
+    def stop(self):
+        """停止后台调度线程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.tick * 2)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                now = time.time()
+                for name, job in self.load_jobs().items():
+                    if not job.get('enabled'):
+                        continue
+                    with self._lock:
+                        if name not in self._next_run:
+                            self._schedule_next(name, job, now)
+                        due = self._next_run[name] <= now
+                    if due:
+                        self.run_job(name, job)
+                        with self._lock:
+                            self._schedule_next(name, job, time.time())
+            except Exception as e:
+                print(f"[Scheduler] 调度出错: {e}")
+            self._stop_event.wait(self.tick)
+
+    # ---------- 执行 ----------
+
+    def _select_nodes(self, config: Dict[str, Any], fetched: List[Dict[str, Any]]):
+        """根据保存的配置选择节点
+
+        新获取的节点默认选中，只排除上次获取到但用户未选中的节点。
+        """
+        selected_ids = set(config.get('selected_proxy_ids', []))
+        if 'deselected_proxy_ids' in config:
+            deselected = set(config['deselected_proxy_ids'])
+        else:
+            # 旧版本保存的配置没有记录未选中的节点
+            previous_ids = {proxy.get('_id') for proxy in config.get('all_proxies', [])}
+            deselected = previous_ids - selected_ids
+
+        selected = [proxy for proxy in fetched if proxy.get('_id') not in deselected]
+        custom = [node for node in config.get('custom_nodes', []) if node.get('_id') in selected_ids]
+        return selected, custom
+
+    def run_job(self, name: str, job: Dict[str, Any] = None) -> Dict[str, Any]:
+        """立即为指定的 Gist 重新生成并上传配置
+
+        Returns:
+            本次运行的状态，outcome 为 uploaded、unchanged、skipped（没有订阅 URL）或 error
+        """
+        if job is None:
+            job = self.load_jobs().get(name)
+            if job is None:
+                raise ValueError(f'Gist "{name}" 不存在')
+
+        with self._run_lock:
+            started = time.time()
+            status = {'last_run': datetime.now().isoformat(), 'outcome': 'error', 'message': ''}
+
+            try:
+                self._generate(name, job, status)
+            except Exception as e:
+                status['outcome'] = 'error'
+                status['message'] = str(e)
+
+            status['duration'] = round(time.time() - started, 3)
+            with self._lock:
+                self._status[name] = status
+            print(f"[Scheduler] {name}: {status['outcome']} ({status['duration']}s) {status['message']}")
+            return status
+
+    def _generate(self, name: str, job: Dict[str, Any], status: Dict[str, Any]):
+        """获取 → 过滤 → 合并 → 上传，结果写入 status"""
+        github_token = os.getenv('GITHUB_TOKEN')
+        if not github_token:
+            raise Exception('未配置 GITHUB_TOKEN')
+
+        config = self.manager.load_chained_proxy_config()
+        urls = config.get('subscription_urls') or self.manager.load_saved_urls_simple()
+        if not urls:
+            status['outcome'] = 'skipped'
+            status['message'] = '没有保存的订阅 URL，跳过本次生成'
+            return
+
+        # 与手动获取节点时使用相同的过滤选项，任务单独设置时以任务设置为准；
+        # 定时任务跳过熔断中的订阅，不反复请求持续失败的服务端
+        filter_options = job.get('filter_options') or config.get('filter_options') or {'regions': ['hk']}
+        fetched = self.manager.fetch_proxies_from_urls(urls, filter_options, use_circuit_breaker=True)
+        selected, custom = self._select_nodes(config, fetched)
+
+        all_nodes, cleaned_chained = self.manager.prepare_config_nodes(
+            selected, custom, config.get('chained_nodes', {}))
+        if not all_nodes:
+            raise Exception('没有任何节点需要处理')
+
+        # 内容与上次上传一致时由 publish_to_gist 跳过更新
+        content = self.manager.merge_proxies_to_template(all_nodes, cleaned_chained)
+        upload = self.manager.publish_to_gist(content, github_token, reuse_gist=True, gist_name=name)
+        status['nodes'] = len(all_nodes)
+        status['subscription_url'] = upload['raw_url']
+        if upload['skipped']:
+            status['outcome'] = 'unchanged'
+            status['message'] = f"{upload['reason']}，跳过上传"
+        else:
+            status['outcome'] = 'uploaded'
+            status['message'] = f'已上传 {len(all_nodes)} 个节点'
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取调度器和每个任务的状态"""
+        jobs = self.load_jobs()
+        with self._lock:
+            result = {}
+            for name, job in jobs.items():
+                item = dict(job)
+                item.update(self._status.get(name, {}))
+                next_run = self._next_run.get(name)
+                item['next_run'] = datetime.fromtimestamp(next_run).isoformat() if next_run and job.get('enabled') else None
+                result[name] = item
+        return {'running': self.running, 'jobs': result}
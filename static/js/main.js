@@ -1,6 +1,7 @@
 // 全局变量
 let urlList = [];
 let allProxies = [];
+let lastFilterOptions = null;  // 最近一次获取节点时使用的过滤选项，保存配置时一并保存
 let selectedProxies = [];
 let customNodes = [];
 let customUrlList = []; // 自定义节点的URL列表
@@ -634,11 +635,13 @@ async function fetchProxies() {
         regions: activeRegions,
         keywords: customKeywords
     };
+    lastFilterOptions = filterOptions;
     
     try {
         showLoading('正在获取节点...');
         
-        const response = await fetch('/api/fetch-proxies', {
+        // 使用流式接口：每个订阅完成后立即显示其节点
+        const response = await fetch('/api/fetch-proxies/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -647,22 +650,34 @@ async function fetchProxies() {
             })
         });
         
-        const data = await response.json();
+        allProxies = [];
+        selectedProxies = [];
+        let finished = 0;
+        let streamError = null;
         
-        if (data.success) {
-            allProxies = data.proxies;
-            selectedProxies = [...allProxies]; // 默认全选
-            displayProxies();
-            showToast(`成功获取 ${allProxies.length} 个节点`, 'success');
-            
-            // 显示节点选择区域
-            getElement('proxySelectionSection').style.display = 'block';
-            getElement('proxySelectionSection').scrollIntoView({ behavior: 'smooth' });
-            
-            // 启用生成配置按钮
-            updateGenerateButtonState();
+        await readServerSentEvents(response, (event, data) => {
+            if (event === 'subscription') {
+                finished++;
+                allProxies = allProxies.concat(data.proxies);
+                selectedProxies = selectedProxies.concat(data.proxies); // 默认全选
+                displayProxies();
+                
+                // 收到第一个订阅的结果后即显示节点区域
+                if (finished === 1) {
+                    hideLoading();
+                    getElement('proxySelectionSection').style.display = 'block';
+                    getElement('proxySelectionSection').scrollIntoView({ behavior: 'smooth' });
+                }
+                updateGenerateButtonState();
+            } else if (event === 'error') {
+                streamError = data.error;
+            }
+        });
+        
+        if (streamError) {
+            showToast('获取节点失败: ' + streamError, 'error');
         } else {
-            showToast('获取节点失败: ' + data.error, 'error');
+            showToast(`成功获取 ${allProxies.length} 个节点`, 'success');
         }
     } catch (error) {
         showToast('获取节点失败: ' + error.message, 'error');
@@ -671,6 +686,34 @@ async function fetchProxies() {
     }
 }
 
+// 读取 Server-Sent Events 响应，逐个事件回调
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // 事件之间以空行分隔
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 // 提取自定义节点 URL
 async function extractCustomUrls() {
     const text = getElement('customNodesUrlInput').value.trim();
@@ -904,6 +947,7 @@ function displayProxies() {
                     <div class="proxy-details">
                         <span class="proxy-type">${proxy.type.toUpperCase()}</span>
                         <span class="proxy-server">${proxy.server}:${proxy.port}</span>
+                        ${proxy._aliases && proxy._aliases.length ? `<span class="proxy-aliases" title="其他订阅中的同一节点">别名: ${escapeHtml(proxy._aliases.join(', '))}</span>` : ''}
                     </div>
                 </div>
                 <div class="chain-controls" onclick="event.stopPropagation()">
@@ -1027,6 +1071,11 @@ async function loadChainedProxyConfig() {
                 customNodes = config.custom_nodes;
             }
             
+            // 加载获取节点时使用的过滤选项
+            if (config.filter_options) {
+                lastFilterOptions = config.filter_options;
+            }
+            
             // 加载链式代理配置
             if (config.chained_nodes) {
                 chainedConfig = config.chained_nodes;
@@ -1096,7 +1145,9 @@ async function saveChainedProxyConfig() {
             // 新增：保存选中的节点ID列表
             selected_proxy_ids: selectedProxies.map(p => p._id),
             // 新增：保存当前使用的URL列表
-            subscription_urls: urlList.filter(item => item.selected).map(item => item.url)
+            subscription_urls: urlList.filter(item => item.selected).map(item => item.url),
+            // 保存获取节点时使用的过滤选项，定时任务按相同的条件获取
+            filter_options: lastFilterOptions
         };
         
         const response = await fetch('/api/chained-proxy-config', {
@@ -1218,6 +1269,8 @@ async function generateConfig() {
             body: JSON.stringify({
                 selected_proxies: selectedNonCustomProxies,  // 只包含选中的非自定义节点
                 custom_nodes: selectedCustomNodes,  // 只包含选中的自定义节点
+                all_proxies: allProxies.filter(proxy => !proxy.is_custom),  // 获取到的全部节点，用于记录未选中的节点
+                filter_options: lastFilterOptions,  // 获取节点时使用的过滤选项
                 chained_config: cleanedChainedConfig,  // 使用清理后的链式代理配置
                 github_token: githubToken,
                 reuse_gist: reuseGist,
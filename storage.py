@@ -0,0 +1,262 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# 链式代理配置中按行存储的节点列表：{配置字段: 节点类型}
+NODE_FIELDS = {'custom_nodes': 'custom', 'all_proxies': 'subscription'}
+# 链式代理配置中按行存储的映射字段，其余字段整体存为设置项
+CHAIN_FIELD = 'chained_nodes'
+
+
+class Storage:
+    """SQLite 数据存储
+
+    保存订阅 URL、Gist 配置、Gist 上传摘要、链式代理配置中的节点和链式映射，
+    每次修改只写入变化的行。所有写操作在 BEGIN IMMEDIATE 事务中执行，
+    同一进程内的并发请求由锁串行化，多个进程之间由 SQLite 的写锁串行化。
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS urls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            alias TEXT,
+            auto_alias TEXT,
+            added_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS gists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            gist_id TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS gist_digests (
+            gist_id TEXT PRIMARY KEY,
+            name TEXT,
+            digest TEXT NOT NULL,
+            raw_url TEXT,
+            updated TEXT
+        );
+        CREATE TABLE IF NOT EXISTS nodes (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            node_id TEXT,
+            data TEXT NOT NULL,
+            PRIMARY KEY (kind, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_nodes_node_id ON nodes (node_id);
+        CREATE TABLE IF NOT EXISTS chain_mappings (
+            node_id TEXT PRIMARY KEY,
+            dialer TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    '''
+
+    def __init__(self, db_path: str = 'data/storage.db'):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 自动提交模式，事务由 _transaction 显式控制；timeout 为等待其他进程写锁的时间
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction() as conn:
+            # executescript 会先提交当前事务，这里逐条执行以保证建表在同一事务中
+            for statement in self.SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：正常结束时提交，出现异常时回滚"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ---------- 元数据 ----------
+
+    def get_meta(self, key: str) -> Optional[str]:
+        rows = self._query('SELECT value FROM meta WHERE key = ?', (key,))
+        return rows[0][0] if rows else None
+
+    def set_meta(self, key: str, value: str):
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    # ---------- 订阅 URL ----------
+
+    def list_urls(self) -> List[Dict[str, str]]:
+        """按添加顺序返回所有 URL 记录"""
+        rows = self._query('SELECT url, alias, auto_alias, added_at FROM urls ORDER BY id')
+        return [{'url': url, 'alias': alias, 'auto_alias': auto_alias, 'added_at': added_at}
+                for url, alias, auto_alias, added_at in rows]
+
+    def add_urls(self, items: List[Dict[str, str]]) -> int:
+        """添加 URL 记录，已存在的 URL 保持不变
+
+        Returns:
+            新添加的数量
+        """
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO urls (url, alias, auto_alias, added_at) VALUES (?, ?, ?, ?)',
+                [(item['url'], item.get('alias'), item.get('auto_alias'), item.get('added_at')) for item in items])
+            return conn.total_changes - before
+
+    def missing_urls(self, urls: List[str]) -> List[str]:
+        """返回尚未保存的 URL（保持输入顺序并去重）"""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return []
+        existing = set()
+        # 分批查询，避免超出 SQLite 的参数个数限制
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            existing.update(row[0] for row in self._query(
+                f'SELECT url FROM urls WHERE url IN ({placeholders})', batch))
+        return [url for url in urls if url not in existing]
+
+    def delete_url(self, url: str) -> bool:
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM urls WHERE url = ?', (url,)).rowcount > 0
+
+    def update_url_alias(self, url: str, alias: str) -> bool:
+        with self._transaction() as conn:
+            return conn.execute('UPDATE urls SET alias = ? WHERE url = ?', (alias, url)).rowcount > 0
+
+    # ---------- Gist 配置 ----------
+
+    def list_gists(self) -> Dict[str, str]:
+        """按添加顺序返回 {name: gist_id}"""
+        return {name: gist_id for name, gist_id in self._query('SELECT name, gist_id FROM gists ORDER BY id')}
+
+    def set_gist(self, name: str, gist_id: str):
+        """添加 Gist 配置，名称已存在时更新 Gist ID（保持原有顺序）"""
+        with self._transaction() as conn:
+            updated = conn.execute('UPDATE gists SET gist_id = ? WHERE name = ?', (gist_id, name)).rowcount
+            if not updated:
+                conn.execute('INSERT INTO gists (name, gist_id) VALUES (?, ?)', (name, gist_id))
+
+    def delete_gist(self, name: str) -> bool:
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM gists WHERE name = ?', (name,)).rowcount > 0
+
+    def rename_gist(self, old_name: str, new_name: str) -> bool:
+        """重命名 Gist，新名称已存在时不修改"""
+        with self._transaction() as conn:
+            if conn.execute('SELECT 1 FROM gists WHERE name = ?', (new_name,)).fetchone():
+                return False
+            return conn.execute('UPDATE gists SET name = ? WHERE name = ?', (new_name, old_name)).rowcount > 0
+
+    def replace_gists(self, configs: Dict[str, str]):
+        """用给定的配置整体替换所有 Gist 配置"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM gists')
+            conn.executemany('INSERT INTO gists (name, gist_id) VALUES (?, ?)', list(configs.items()))
+
+    # ---------- Gist 上传摘要 ----------
+
+    def get_gist_digest(self, gist_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query('SELECT name, digest, raw_url, updated FROM gist_digests WHERE gist_id = ?', (gist_id,))
+        if not rows:
+            return None
+        name, digest, raw_url, updated = rows[0]
+        return {'name': name, 'digest': digest, 'raw_url': raw_url, 'updated': updated}
+
+    def set_gist_digest(self, gist_id: str, name: str, digest: str, raw_url: str, updated: str = None):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO gist_digests (gist_id, name, digest, raw_url, updated) VALUES (?, ?, ?, ?, ?)',
+                (gist_id, name, digest, raw_url, updated or datetime.now().isoformat()))
+
+    # ---------- 链式代理配置 ----------
+
+    def load_chained_config(self) -> Optional[Dict[str, Any]]:
+        """读取链式代理配置，从未保存过时返回 None"""
+        with self._lock:
+            settings = self._conn.execute('SELECT key, value FROM settings').fetchall()
+            nodes = self._conn.execute('SELECT kind, data FROM nodes ORDER BY kind, position').fetchall()
+            mappings = self._conn.execute('SELECT node_id, dialer FROM chain_mappings').fetchall()
+        if not (settings or nodes or mappings):
+            return None
+
+        config = {key: json.loads(value) for key, value in settings}
+        by_kind = {kind: [] for kind in NODE_FIELDS.values()}
+        for kind, data in nodes:
+            by_kind.setdefault(kind, []).append(json.loads(data))
+        for field, kind in NODE_FIELDS.items():
+            config[field] = by_kind[kind]
+        config[CHAIN_FIELD] = dict(mappings)
+        return config
+
+    def save_chained_config(self, config: Dict[str, Any]):
+        """保存链式代理配置，只写入与已保存内容不同的节点、映射和设置项"""
+        with self._transaction() as conn:
+            for field, kind in NODE_FIELDS.items():
+                self._sync_nodes(conn, kind, config.get(field) or [])
+
+            existing = dict(conn.execute('SELECT node_id, dialer FROM chain_mappings').fetchall())
+            mappings = {str(node_id): dialer for node_id, dialer in (config.get(CHAIN_FIELD) or {}).items()}
+            conn.executemany('INSERT OR REPLACE INTO chain_mappings (node_id, dialer) VALUES (?, ?)',
+                             [item for item in mappings.items() if existing.get(item[0]) != item[1]])
+            conn.executemany('DELETE FROM chain_mappings WHERE node_id = ?',
+                             [(node_id,) for node_id in existing if node_id not in mappings])
+
+            existing = dict(conn.execute('SELECT key, value FROM settings').fetchall())
+            settings = {key: json.dumps(value, ensure_ascii=False) for key, value in config.items()
+                        if key not in NODE_FIELDS and key != CHAIN_FIELD}
+            conn.executemany('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
+                             [item for item in settings.items() if existing.get(item[0]) != item[1]])
+            conn.executemany('DELETE FROM settings WHERE key = ?',
+                             [(key,) for key in existing if key not in settings])
+
+    @staticmethod
+    def _sync_nodes(conn: sqlite3.Connection, kind: str, nodes: List[Dict[str, Any]]):
+        existing = {key: (position, data) for key, position, data in conn.execute(
+            'SELECT key, position, data FROM nodes WHERE kind = ?', (kind,))}
+
+        changed = []
+        keys = set()
+        for position, node in enumerate(nodes):
+            node_id = node.get('_id')
+            # 没有 _id 或 _id 重复的节点按位置保存
+            key = str(node_id) if node_id and str(node_id) not in keys else f'#{position}'
+            keys.add(key)
+            # 保持字段的原始顺序：生成的配置按节点字段顺序输出，排序会改变生成内容
+            data = json.dumps(node, ensure_ascii=False)
+            if existing.get(key) != (position, data):
+                changed.append((kind, key, position, node_id, data))
+
+        conn.executemany('INSERT OR REPLACE INTO nodes (kind, key, position, node_id, data) VALUES (?, ?, ?, ?, ?)',
+                         changed)
+        conn.executemany('DELETE FROM nodes WHERE kind = ? AND key = ?',
+                         [(kind, key) for key in existing if key not in keys])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
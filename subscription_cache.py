@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable
+
+from file_store import atomic_write, file_lock, file_signature
+
+
+class SubscriptionCache:
+    """订阅内容的磁盘缓存
+
+    以 URL 为键保存原始内容、校验信息（ETag/Last-Modified）和解析后的节点列表。
+    在有效期内直接使用缓存；过期后发送条件请求，服务端返回 304 时跳过下载和解析。
+    缓存总大小超过上限时，按最近访问时间淘汰最旧的条目。
+    索引文件的修改在文件锁内完成并原子写入，多个进程可以共用同一个缓存目录；
+    内存中的索引在索引文件被其他进程修改后自动重新读取。
+    命中缓存时只在内存中记录访问时间，随下一次索引写入或每隔 ACCESS_FLUSH_INTERVAL 秒写入一次。
+    """
+
+    # 访问时间写回索引文件的最长间隔（秒）
+    ACCESS_FLUSH_INTERVAL = 60
+
+    def __init__(self, cache_dir: str = 'data/subscription_cache', ttl: float = 600,
+                 max_bytes: int = 50 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: 缓存目录
+            ttl: 缓存有效期（秒），有效期内不发送请求
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self._index = None  # {key: {url, etag, last_modified, fetched_at, accessed_at, size}}
+        self._index_signature = None  # 读取或写入索引时索引文件的签名
+        self._pending_access = {}  # {key: accessed_at}，尚未写入索引的访问时间
+        self._last_access_flush = time.time()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{suffix}")
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        signature = file_signature(self.index_file)
+        if self._index is None or signature != self._index_signature:
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except Exception:
+                self._index = {}
+            self._index_signature = signature
+        return self._index
+
+    def _apply_access(self, index: Dict[str, Dict[str, Any]]):
+        """把内存中记录的访问时间合并到索引（调用方需持有锁）"""
+        for key, accessed_at in self._pending_access.items():
+            meta = index.get(key)
+            if meta and accessed_at > meta.get('accessed_at', 0):
+                meta['accessed_at'] = accessed_at
+        self._pending_access.clear()
+        self._last_access_flush = time.time()
+
+    def _save_index(self):
+        self._apply_access(self._index)
+        atomic_write(self.index_file, json.dumps(self._index, ensure_ascii=False))
+        self._index_signature = file_signature(self.index_file)
+
+    @contextmanager
+    def _locked_index(self):
+        """修改索引：持有线程锁和索引文件锁，期间读取的是索引文件的最新内容"""
+        with self._lock, file_lock(self.index_file):
+            yield self._load_index()
+
+    def _remove_files(self, key: str):
+        for suffix in ('body', 'json'):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """获取缓存条目的元数据（不含内容），没有缓存时返回 None"""
+        with self._lock:
+            meta = self._load_index().get(self._key(url))
+            return dict(meta) if meta else None
+
+    def is_fresh(self, meta: Dict[str, Any]) -> bool:
+        """判断缓存条目是否仍在有效期内"""
+        return time.time() - meta.get('fetched_at', 0) < self.ttl
+
+    @staticmethod
+    def conditional_headers(meta: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """根据缓存的校验信息生成条件请求头"""
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def load_proxies(self, url: str) -> Optional[List[Dict[str, Any]]]:
+        """读取缓存的节点列表，并更新访问时间"""
+        key = self._key(url)
+        try:
+            with open(self._path(key, 'json'), 'r', encoding='utf-8') as f:
+                proxies = json.load(f)
+        except Exception:
+            return None
+
+        now = time.time()
+        with self._lock:
+            self._pending_access[key] = now
+            due = now - self._last_access_flush >= self.ACCESS_FLUSH_INTERVAL
+        if due:
+            with self._locked_index():
+                self._save_index()
+        return proxies
+
+    def load_body(self, url: str) -> Optional[str]:
+        """读取缓存的原始订阅内容"""
+        try:
+            with open(self._path(self._key(url), 'body'), 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception:
+            return None
+
+    def put(self, url: str, body: str, proxies: List[Dict[str, Any]],
+            etag: str = None, last_modified: str = None):
+        """写入缓存条目，并在超过大小上限时淘汰旧条目"""
+        key = self._key(url)
+        # YAML 中的日期、二进制等值无法直接写成 JSON，按字符串保存（输出配置时本来就按字符串输出）
+        proxies_json = json.dumps(proxies, ensure_ascii=False, default=str)
+
+        with self._locked_index() as index:
+            atomic_write(self._path(key, 'body'), body)
+            atomic_write(self._path(key, 'json'), proxies_json)
+
+            self._apply_access(index)
+            now = time.time()
+            index[key] = {
+                'url': url,
+                'etag': etag,
+                'last_modified': last_modified,
+                'fetched_at': now,
+                'accessed_at': now,
+                'size': len(body.encode('utf-8')) + len(proxies_json.encode('utf-8'))
+            }
+            self._evict(keep=key)
+            self._save_index()
+
+    def touch(self, url: str):
+        """服务端确认内容未修改（304）时，刷新缓存的获取时间"""
+        with self._locked_index() as index:
+            meta = index.get(self._key(url))
+            if meta:
+                meta['fetched_at'] = time.time()
+                self._save_index()
+
+    def _evict(self, keep: str = None):
+        """按最近访问时间淘汰条目，直到总大小不超过上限（调用方需持有锁）"""
+        index = self._load_index()
+        total = sum(meta.get('size', 0) for meta in index.values())
+        if total <= self.max_bytes:
+            return
+
+        for key in sorted(index, key=lambda k: index[k].get('accessed_at', 0)):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= index[key].get('size', 0)
+            self._remove_files(key)
+            del index[key]
+
+    def clear(self):
+        """清空所有缓存"""
+        with self._locked_index() as index:
+            for key in list(index):
+                self._remove_files(key)
+            self._index = {}
+            self._save_index()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            index = self._load_index()
+            return {
+                'entries': len(index),
+                'size': sum(meta.get('size', 0) for meta in index.values()),
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl
+            }
+
+
+class ParseMemo:
+    """按内容哈希缓存订阅解析结果
+
+    服务端返回 200 但内容与上次完全相同时，直接返回之前的解析结果而不重新解析。
+    内存中使用 LRU 缓存，可选开启磁盘持久层以便重启后复用。
+    内存中的解析结果以 pickle 序列化保存，保留 YAML 中的日期、二进制和非字符串键，
+    命中时反序列化出新的列表，调用方可以放心修改。
+    磁盘持久层使用 JSON，无法用 JSON 原样表示的解析结果只缓存在内存中。
+    """
+
+    def __init__(self, max_entries: int = 64, persist_dir: str = None):
+        """
+        Args:
+            max_entries: 内存（及磁盘）中最多保存的条目数
+            persist_dir: 磁盘持久层目录，为 None 时只使用内存
+        """
+        self.max_entries = max_entries
+        self.persist_dir = persist_dir
+        self._entries = OrderedDict()  # {content_hash: pickled_proxies}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.persist_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.persist_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception:
+            return None
+
+    def _write_disk(self, key: str, proxies: List[Dict[str, Any]]):
+        if not self.persist_dir:
+            return
+        try:
+            data = json.dumps(proxies, ensure_ascii=False)
+            if json.loads(data) != proxies:
+                return  # JSON 会改变值的类型（如整数键变为字符串），不持久化
+        except (TypeError, ValueError):
+            return
+        try:
+            atomic_write(self._disk_path(key), data)
+
+            # 超出条目上限时删除最旧的文件
+            files = [os.path.join(self.persist_dir, name) for name in os.listdir(self.persist_dir)
+                     if name.endswith('.json')]
+            if len(files) > self.max_entries:
+                files.sort(key=os.path.getmtime)
+                for path in files[:len(files) - self.max_entries]:
+                    os.remove(path)
+        except OSError as e:
+            print(f"写入解析缓存失败: {e}")
+
+    def _remember(self, key: str, data: bytes):
+        """放入内存 LRU（调用方需持有锁）"""
+        self._entries[key] = data
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_parse(self, content: str, parser: Callable[[str], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """返回内容的解析结果，命中缓存时不调用 parser
+
+        Args:
+            content: 订阅原始内容
+            parser: 未命中时使用的解析函数
+
+        Returns:
+            解析得到的节点列表（新的副本）
+        """
+        key = self.content_hash(content)
+
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if data is not None:
+            return pickle.loads(data)
+
+        text = self._read_disk(key)
+        if text is not None:
+            try:
+                proxies = json.loads(text)
+            except ValueError:
+                proxies = None
+            if proxies is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, pickle.dumps(proxies, pickle.HIGHEST_PROTOCOL))
+                return proxies
+
+        proxies = parser(content)
+        with self._lock:
+            self.misses += 1
+        try:
+            data = pickle.dumps(proxies, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            # 无法序列化时不缓存，直接返回解析结果
+            print(f"解析结果无法缓存: {e}")
+            return proxies
+        with self._lock:
+            self._remember(key, data)
+        self._write_disk(key, proxies)
+        return proxies
+
+    def clear(self):
+        """清空内存中的缓存和统计"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'persistent': bool(self.persist_dir),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / total, 4) if total else 0.0
+            }
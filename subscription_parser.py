@@ -1,9 +1,11 @@
 import base64
+import codecs
+import itertools
 import json
-import yaml
+import yaml_backend
 import re
 from urllib.parse import urlparse, parse_qs, unquote
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, Tuple
 from functools import wraps
 
 def safe_parse(func):
@@ -16,51 +18,223 @@ def safe_parse(func):
             return None
     return wrapper
 
+class _Base64StreamDecoder:
+    """增量 Base64 解码器，每次只解码完整的 4 字符分组，剩余部分留到下一次"""
+    
+    def __init__(self):
+        self._pending = ''
+        
+    def decode(self, text: str, final: bool = False) -> bytes:
+        data = self._pending + ''.join(text.split()).replace('-', '+').replace('_', '/')
+        if final:
+            data += '=' * (-len(data) % 4)
+            self._pending = ''
+        else:
+            cut = len(data) - len(data) % 4
+            data, self._pending = data[:cut], data[cut:]
+        return base64.b64decode(data) if data else b''
+
+
 class SubscriptionParser:
     """订阅内容解析器"""
     
+    # 订阅格式
+    FORMAT_CLASH_YAML = 'clash_yaml'
+    FORMAT_BASE64 = 'base64'
+    FORMAT_SHARE_LINKS = 'share_links'
+    
+    # 格式识别时检查的前缀长度
+    SNIFF_LENGTH = 4096
+    
+    # 最多解码的 Base64 层数（部分订阅服务会把 Base64 内容再编码一次）
+    MAX_BASE64_LAYERS = 2
+    
+    # 支持的分享链接协议
+    SHARE_LINK_SCHEMES = ('ss://', 'vmess://', 'trojan://', 'hysteria2://')
+    
+    _SHARE_LINK_RE = re.compile(r'^\s*(?:ss|vmess|trojan|hysteria2)://', re.MULTILINE)
+    _BASE64_RE = re.compile(r'^[A-Za-z0-9+/=_\-\s]+$')
+    
     @staticmethod
-    def parse_subscription(content: str) -> List[Dict[str, Any]]:
-        """解析订阅内容，自动识别格式"""
-        proxies = []
+    def detect_format(content: str) -> str:
+        """只检查内容的前缀，识别订阅格式
+        
+        Returns:
+            FORMAT_SHARE_LINKS、FORMAT_BASE64 或 FORMAT_CLASH_YAML
+        """
+        head = content[:SubscriptionParser.SNIFF_LENGTH].lstrip()
+        
+        if SubscriptionParser._SHARE_LINK_RE.search(head):
+            return SubscriptionParser.FORMAT_SHARE_LINKS
+        if head and SubscriptionParser._BASE64_RE.match(head):
+            return SubscriptionParser.FORMAT_BASE64
+        return SubscriptionParser.FORMAT_CLASH_YAML
         
-        # 尝试作为 YAML 解析
+    @staticmethod
+    def _decode_base64(content: str) -> Optional[str]:
+        """解码 Base64 订阅内容，兼容换行、缺少填充和 URL 安全字符"""
         try:
-            data = yaml.safe_load(content)
-            if isinstance(data, dict) and 'proxies' in data:
-                return data['proxies']
-        except:
-            pass
+            data = ''.join(content.split())
+            data = data.replace('-', '+').replace('_', '/')
+            data += '=' * (-len(data) % 4)
+            return base64.b64decode(data).decode('utf-8')
+        except Exception:
+            return None
+    
+    @staticmethod
+    def parse_subscription(content: str) -> List[Dict[str, Any]]:
+        """解析订阅内容，先识别格式，再交给对应的解析器"""
+        content_format = SubscriptionParser.detect_format(content)
+        
+        # Base64 内容解码后再识别一次实际格式，仍是 Base64 时再解码一层
+        for _ in range(SubscriptionParser.MAX_BASE64_LAYERS):
+            if content_format != SubscriptionParser.FORMAT_BASE64:
+                break
+            decoded = SubscriptionParser._decode_base64(content)
+            if decoded is None:
+                return []
+            content = decoded
+            content_format = SubscriptionParser.detect_format(content)
             
-        # 尝试作为 Base64 解析
+        if content_format == SubscriptionParser.FORMAT_CLASH_YAML:
+            proxies = SubscriptionParser._parse_clash_yaml(content)
+            if proxies is not None:
+                return proxies
+                
+        return SubscriptionParser.parse_share_links(content)
+        
+    @staticmethod
+    def _parse_clash_yaml(content: str) -> Optional[List[Dict[str, Any]]]:
+        """解析 Clash YAML 订阅，不是有效的 Clash 配置时返回 None"""
         try:
-            decoded = base64.b64decode(content).decode('utf-8')
-            return SubscriptionParser.parse_subscription(decoded)
-        except:
-            pass
-            
-        # 尝试作为分享链接列表解析
-        lines = content.strip().split('\n')
-        for line in lines:
+            return yaml_backend.load_proxies(content)
+        except Exception:
+            return None
+        
+    @staticmethod
+    def parse_share_link(line: str) -> Optional[Dict[str, Any]]:
+        """解析单条分享链接，不支持的协议返回 None"""
+        if line.startswith('ss://'):
+            return SubscriptionParser.parse_ss(line)
+        elif line.startswith('vmess://'):
+            return SubscriptionParser.parse_vmess(line)
+        elif line.startswith('trojan://'):
+            return SubscriptionParser.parse_trojan(line)
+        elif line.startswith('hysteria2://'):
+            return SubscriptionParser.parse_hysteria2(line)
+        return None
+        
+    @staticmethod
+    def parse_share_links(content: str) -> List[Dict[str, Any]]:
+        """解析分享链接列表（每行一个链接）"""
+        proxies = []
+        for line in content.split('\n'):
             line = line.strip()
             if not line:
                 continue
                 
-            proxy = None
-            if line.startswith('ss://'):
-                proxy = SubscriptionParser.parse_ss(line)
-            elif line.startswith('vmess://'):
-                proxy = SubscriptionParser.parse_vmess(line)
-            elif line.startswith('trojan://'):
-                proxy = SubscriptionParser.parse_trojan(line)
-            elif line.startswith('hysteria2://'):
-                proxy = SubscriptionParser.parse_hysteria2(line)
-                
+            proxy = SubscriptionParser.parse_share_link(line)
             if proxy:
                 proxies.append(proxy)
                 
         return proxies
         
+    @staticmethod
+    def _iter_decoded_text(chunks: Iterable[bytes]) -> Iterator[str]:
+        """将字节块流增量解码为 UTF-8 文本块"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+            
+    @staticmethod
+    def _iter_base64_text(text_chunks: Iterable[str]) -> Iterator[str]:
+        """将 Base64 文本块流增量解码为 UTF-8 文本块"""
+        b64_decoder = _Base64StreamDecoder()
+        utf8_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for text in text_chunks:
+            decoded = utf8_decoder.decode(b64_decoder.decode(text))
+            if decoded:
+                yield decoded
+        tail = utf8_decoder.decode(b64_decoder.decode('', final=True), final=True)
+        if tail:
+            yield tail
+            
+    @staticmethod
+    def _peek_text(text_chunks: Iterator[str]) -> Tuple[str, Iterator[str]]:
+        """读取足够识别格式的前缀，返回 (前缀, 包含前缀的完整文本流)"""
+        parts = []
+        size = 0
+        for text in text_chunks:
+            parts.append(text)
+            size += len(text)
+            if size >= SubscriptionParser.SNIFF_LENGTH:
+                break
+        head = ''.join(parts)
+        return head, itertools.chain([head], text_chunks)
+        
+    @staticmethod
+    def _iter_lines(text_chunks: Iterable[str]) -> Iterator[str]:
+        """将文本块流切分为行，只保留未完成的一行在内存中"""
+        pending = ''
+        for text in text_chunks:
+            pending += text
+            lines = pending.split('\n')
+            pending = lines.pop()
+            yield from lines
+        if pending:
+            yield pending
+            
+    @staticmethod
+    def iter_parse_stream(chunks: Iterable[bytes],
+                          node_filter: Callable[[Dict[str, Any]], bool] = None,
+                          stats: Dict[str, int] = None) -> Iterator[Dict[str, Any]]:
+        """流式解析订阅内容，逐个产出节点
+        
+        分享链接列表（含 Base64 编码的）边下载边解码、边解析，
+        内存占用只取决于保留下来的节点数量；Clash YAML 无法增量解析，会先读完整个内容。
+        
+        Args:
+            chunks: 订阅内容的字节块流（如 response.iter_content()）
+            node_filter: 节点过滤函数，返回 False 的节点不会被产出
+            stats: 可选的统计字典，会写入 'total'（解析出的节点总数）
+        """
+        if stats is not None:
+            stats['total'] = 0
+            
+        head, text_chunks = SubscriptionParser._peek_text(SubscriptionParser._iter_decoded_text(chunks))
+        content_format = SubscriptionParser.detect_format(head)
+        
+        # Base64 内容边解码边识别实际格式，仍是 Base64 时再解码一层
+        for _ in range(SubscriptionParser.MAX_BASE64_LAYERS):
+            if content_format != SubscriptionParser.FORMAT_BASE64:
+                break
+            head, text_chunks = SubscriptionParser._peek_text(SubscriptionParser._iter_base64_text(text_chunks))
+            content_format = SubscriptionParser.detect_format(head)
+            
+        proxies = None
+        if content_format == SubscriptionParser.FORMAT_CLASH_YAML:
+            content = ''.join(text_chunks)
+            proxies = SubscriptionParser._parse_clash_yaml(content)
+            if proxies is None:
+                text_chunks = iter([content])
+                
+        if proxies is None:
+            proxies = (SubscriptionParser.parse_share_link(line.strip())
+                       for line in SubscriptionParser._iter_lines(text_chunks))
+            
+        for proxy in proxies:
+            if not proxy:
+                continue
+            if stats is not None:
+                stats['total'] += 1
+            if node_filter is None or node_filter(proxy):
+                yield proxy
+        
     @staticmethod
     @safe_parse
     def parse_ss(url: str) -> Optional[Dict[str, Any]]:
@@ -233,7 +407,7 @@ class SubscriptionParser:
                 if content.startswith('{'):
                     content = f"- {content}"
             
-            parsed = yaml.safe_load(content)
+            parsed = yaml_backend.load(content)
             
             if isinstance(parsed, list):
                 nodes = parsed
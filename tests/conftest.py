@@ -0,0 +1,88 @@
+import hashlib
+import http.server
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+# 项目模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SubscriptionServer:
+    """本地订阅服务
+
+    每个路径返回预先设置的内容，支持 ETag 条件请求（304）和响应延迟，并统计每个路径的请求次数。
+    """
+
+    def __init__(self):
+        self.routes = {}  # {path: (status, body, delay)}
+        self.hits = Counter()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits[self.path] += 1
+                status, body, delay = server.routes.get(self.path, (404, b'', 0))
+                if delay:
+                    time.sleep(delay)
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self._httpd.server_address[1]}'
+
+    def set(self, path: str, body, status: int = 200, delay: float = 0) -> str:
+        """设置路径的响应，返回完整 URL"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.routes[path] = (status, body, delay)
+        return self.base + path
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def subscription_server():
+    server = SubscriptionServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """在临时目录中工作的 ClashConfigManager（数据库和缓存都写到 tmp_path/data）"""
+    from utils import ClashConfigManager
+
+    monkeypatch.chdir(tmp_path)
+    instance = ClashConfigManager()
+    yield instance
+    instance.health.close()
+
+
+@pytest.fixture
+def client(manager, monkeypatch):
+    """Flask 测试客户端，接口使用临时目录中的 manager"""
+    import app as app_module  # 首次导入时创建的管理器也位于 manager 的临时目录
+
+    monkeypatch.setattr(app_module, 'config_manager', manager)
+    return app_module.app.test_client()
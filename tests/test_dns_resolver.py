@@ -0,0 +1,113 @@
+import base64
+
+import pytest
+
+from dns_resolver import DnsResolver, group_hosts
+from test_subscription_fetch import ALL_REGIONS
+
+# 测试用的解析结果：a、b 共享 1.1.1.2，b、c 共享 1.1.1.3，cdn-x 和 cdn-y 共用一个 CDN 入口
+RECORDS = {
+    'a.example.com': ['1.1.1.1', '1.1.1.2'],
+    'b.example.com': ['1.1.1.3', '1.1.1.2'],
+    'c.example.com': ['1.1.1.3'],
+    'd.example.com': ['2.2.2.2'],
+    'cdn-x.example.com': ['3.3.3.3'],
+    'cdn-y.example.com': ['3.3.3.3'],
+}
+
+
+class StubResolver(DnsResolver):
+    def __init__(self, records=RECORDS):
+        super().__init__()
+        self.records = records
+        self.lookups = []
+
+    def resolve_many(self, hosts):
+        hosts = set(hosts)
+        self.lookups.append(hosts)
+        return {host: list(self.records.get(host, [])) for host in hosts}
+
+
+def ss_link(name, host, port=8388):
+    userinfo = base64.b64encode(b'aes-256-gcm:pw').decode()
+    return f'ss://{userinfo}@{host}:{port}#{name.replace(" ", "%20")}'
+
+
+def trojan_link(name, host, sni=None):
+    return f'trojan://pw@{host}:443?{"sni=" + sni if sni else ""}#{name.replace(" ", "%20")}'
+
+
+def test_group_hosts_merges_on_any_shared_address():
+    groups = group_hosts({'a': ['1.1.1.1', '1.1.1.2'], 'b': ['1.1.1.3', '1.1.1.2'], 'c': ['1.1.1.3'],
+                          'd': ['2.2.2.2'], 'e': []})
+    assert groups['a'] == groups['b'] == groups['c'] == ['1.1.1.1', '1.1.1.2', '1.1.1.3']
+    assert groups['d'] == ['2.2.2.2']
+    assert 'e' not in groups
+
+
+def test_backend_view_groups_transitively():
+    proxies = [{'_id': host[0], 'name': host, 'server': host, 'port': 443}
+               for host in ('a.example.com', 'c.example.com', 'd.example.com', 'b.example.com', 'missing.example.com')]
+    view = StubResolver().backend_view(proxies)
+    assert [(group['ip'], [node['name'] for node in group['nodes']]) for group in view['backends']] == [
+        ('1.1.1.1', ['a.example.com', 'c.example.com', 'b.example.com']), ('2.2.2.2', ['d.example.com'])]
+    assert view['backends'][0]['addresses'] == ['1.1.1.1', '1.1.1.2', '1.1.1.3']
+    assert [node['name'] for node in view['unresolved']] == ['missing.example.com']
+    assert view['shared'] == 3
+
+
+@pytest.fixture
+def stub_resolver(manager):
+    resolver = StubResolver()
+    manager.resolver = resolver
+    return resolver
+
+
+def fetch_names(manager, urls, **kwargs):
+    proxies, details = manager.fetch_proxies_with_details(urls, ALL_REGIONS, **kwargs)
+    return [proxy['name'] for proxy in proxies], [detail['duplicates_dropped'] for detail in details]
+
+
+def test_dedupe_by_resolved_backend_is_opt_in(manager, subscription_server, stub_resolver):
+    first = subscription_server.set('/a', '\n'.join([ss_link('A 1', 'a.example.com'), ss_link('D 1', 'd.example.com'),
+                                                     trojan_link('X 1', 'cdn-x.example.com')]))
+    second = subscription_server.set('/b', '\n'.join([ss_link('B 1', 'b.example.com'), ss_link('B 2', 'b.example.com', 9000),
+                                                      trojan_link('Y 1', 'cdn-y.example.com'),
+                                                      trojan_link('Y 2', 'cdn-y.example.com', sni='cdn-x.example.com')]))
+
+    assert fetch_names(manager, [first, second]) == (['A 1', 'D 1', 'X 1', 'B 1', 'B 2', 'Y 1', 'Y 2'], [0, 0])
+    assert stub_resolver.lookups == []
+
+    # a 与 b 共享 1.1.1.2；TLS 节点未指定 SNI 时按原域名区分，显式 SNI 相同时视为同一节点
+    names, dropped = fetch_names(manager, [first, second], dedupe_options={'resolve': True})
+    assert names == ['A 1', 'D 1', 'X 1', 'B 2', 'Y 1']
+    assert dropped == [0, 2]
+
+    streamed = {result['index']: result for result in manager.iter_fetch_proxies(
+        [first, second], ALL_REGIONS, dedupe_options={'resolve': True})}
+    total = sum(len(result['proxies']) for result in streamed.values())
+    assert total == 5 and sum(result['detail']['duplicates_dropped'] for result in streamed.values()) == 2
+
+
+def test_regions_inferred_from_shared_backend(manager, subscription_server, stub_resolver):
+    url = subscription_server.set('/sub', '\n'.join([
+        ss_link('香港 01', 'a.example.com'), ss_link('Premium 01', 'b.example.com'),
+        ss_link('Premium 02', 'd.example.com'), ss_link('美国 01', 'b.example.com')]))
+
+    proxies, _ = manager.fetch_proxies_with_details([url], {'regions': ['hk']})
+    assert [proxy['name'] for proxy in proxies] == ['香港 01']
+
+    manager.subscription_cache.ttl = 3600
+    proxies, details = manager.fetch_proxies_with_details([url], {'regions': ['hk'], 'resolve_regions': True})
+    # 名称属于其他地区的节点不参与推断
+    assert [(proxy['name'], proxy['_region']) for proxy in proxies] == [('香港 01', 'hk'), ('Premium 01', 'hk')]
+    assert details[0]['filtered_nodes'] == 2 and details[0]['regions'] == {'hk': 2}
+
+    proxies, _ = manager.fetch_proxies_with_details([url], dict(ALL_REGIONS, resolve_regions=True))
+    assert {proxy['name']: proxy.get('_region') for proxy in proxies} == {
+        '香港 01': 'hk', 'Premium 01': 'hk', 'Premium 02': None, '美国 01': 'us'}
+
+
+def test_resolve_option_must_be_boolean(manager):
+    with pytest.raises(ValueError):
+        manager.fetch_proxies_with_details(['http://127.0.0.1:1/'], ALL_REGIONS, dedupe_options={'resolve': 'yes'})
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from test_subscription_fetch import ALL_REGIONS, trojan_links
+
+
+def read_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@pytest.mark.parametrize('dedupe', [None, {'policy': 'none'}])
+def test_stream_ids_match_batch_ids(client, subscription_server, dedupe):
+    # 慢的订阅排在前面，流式结果的到达顺序与 URL 顺序相反；同一订阅内有身份相同的节点
+    slow = subscription_server.set('/slow', trojan_links('HK 2', 'HK 1') + '\n' + trojan_links('HK 1').replace(
+        '#HK%201', '#HK%201%20备用'), delay=0.5)
+    fast = subscription_server.set('/fast', trojan_links('HK 1', 'JP 1'))
+    body = {'urls': [slow, fast], 'filter_options': ALL_REGIONS}
+    if dedupe is not None:
+        body['dedupe'] = dedupe
+
+    events = read_events(client.post('/api/fetch-proxies/stream', json=body))
+    assert [event for event, _ in events] == ['subscription', 'subscription', 'done']
+    assert [payload['index'] for _, payload in events[:2]] == [1, 0]
+    streamed = {(proxy['_source'], proxy['name']): proxy['_id'] for _, payload in events[:2] for proxy in payload['proxies']}
+
+    batch = client.post('/api/fetch-proxies', json=body).get_json()
+    assert batch['success']
+    ids = {(proxy['_source'], proxy['name']): proxy['_id'] for proxy in batch['proxies']}
+    assert len(set(ids.values())) == len(ids)
+    if dedupe is None:
+        # 去重时批量获取保留 URL 靠前的慢订阅中的 HK 1，流式保留先到的快订阅中的；两边都有的节点 ID 相同
+        assert set(streamed.values()) <= set(ids.values())
+        common = streamed.keys() & ids.keys()
+        assert {name for _, name in common} == {'HK 2', 'JP 1'}
+        assert all(streamed[key] == ids[key] for key in common)
+    else:
+        assert streamed == ids
+
+
+@pytest.mark.parametrize('body', ['not json', '[1, 2]', 'null'])
+def test_stream_rejects_invalid_body(client, body):
+    response = client.post('/api/fetch-proxies/stream', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,114 @@
+import json
+import multiprocessing
+import os
+import threading
+
+from file_store import atomic_write, read_json, update_json, write_json
+from subscription_cache import SubscriptionCache
+
+PROCESSES = 6
+THREADS = 4
+INCREMENTS = 25
+
+
+def _increment(data):
+    data['count'] = data.get('count', 0) + 1
+    return data
+
+
+def _counter_worker(path: str):
+    """每个进程中多个线程同时对计数器做读-改-写"""
+    def run():
+        for _ in range(INCREMENTS):
+            update_json(path, _increment, {})
+
+    threads = [threading.Thread(target=run) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _cache_worker(cache_dir: str, worker: int):
+    cache = SubscriptionCache(cache_dir=cache_dir)
+    for index in range(20):
+        url = f'http://example.com/{worker}/{index}'
+        cache.put(url, 'body', [{'name': url}], etag=str(index))
+        cache.touch(url)
+        assert cache.load_proxies(url) == [{'name': url}]
+
+
+def _run_processes(target, args_list):
+    processes = [multiprocessing.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert all(process.exitcode == 0 for process in processes)
+
+
+def test_concurrent_update_json_loses_no_increments(tmp_path):
+    path = str(tmp_path / 'counter.json')
+    _run_processes(_counter_worker, [(path,)] * PROCESSES)
+
+    assert read_json(path)['count'] == PROCESSES * THREADS * INCREMENTS
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_readers_never_see_partial_files(tmp_path):
+    path = str(tmp_path / 'data.json')
+    write_json(path, {'items': []})
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    json.load(f)
+            except ValueError as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for size in range(200):
+            write_json(path, {'items': list(range(size * 50))})
+    finally:
+        stop.set()
+        reader.join()
+    assert errors == []
+
+
+def test_shared_subscription_cache_index(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    _run_processes(_cache_worker, [(cache_dir, worker) for worker in range(PROCESSES)])
+
+    cache = SubscriptionCache(cache_dir=cache_dir)
+    assert cache.get_stats()['entries'] == PROCESSES * 20
+    assert cache.load_proxies('http://example.com/0/0') == [{'name': 'http://example.com/0/0'}]
+
+
+def test_read_json_reloads_after_external_write(tmp_path):
+    path = str(tmp_path / 'state.json')
+    write_json(path, {'value': 1})
+    first = read_json(path)
+    first['value'] = 'modified'  # 返回的是副本，不影响缓存
+    assert read_json(path) == {'value': 1}
+
+    # 模拟其他进程直接替换文件
+    atomic_write(path, json.dumps({'value': 2}))
+    assert read_json(path) == {'value': 2}
+    assert read_json(str(tmp_path / 'missing.json'), {'default': True}) == {'default': True}
+
+
+def test_atomic_write_keeps_permissions(tmp_path):
+    path = str(tmp_path / '.env')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('A=1\n')
+    os.chmod(path, 0o600)
+    atomic_write(path, 'A=2\n')
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == 'A=2\n'
+    if os.name == 'posix':
+        assert os.stat(path).st_mode & 0o777 == 0o600
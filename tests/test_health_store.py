@@ -0,0 +1,127 @@
+import types
+
+import pytest
+
+import health_store
+from health_store import HealthStore, KIND_GET, KIND_HEAD, KIND_STREAM
+from subscription_parser import SubscriptionParser
+from test_subscription_fetch import ALL_REGIONS, trojan_links
+
+URL = 'https://sub.example.com/a'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的时钟：记录时间戳和熔断判断都使用 clock.now"""
+    fake = types.SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(health_store, 'time', types.SimpleNamespace(time=lambda: fake.now))
+    return fake
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    instance = HealthStore(str(tmp_path / 'health.db'), failure_threshold=3, backoff_base=10, backoff_max=25)
+    yield instance
+    instance.close()
+
+
+def record(store, clock, url, latency, ok=True, kind=KIND_GET):
+    clock.now += 1
+    store.record(url, kind, latency, ok, '可用' if ok else '超时')
+
+
+def test_timeout_uses_host_p95(store, clock):
+    for latency in (0.5, 1.0, 1.5, 2.0):
+        record(store, clock, URL, latency)
+    # 样本不足时使用默认值
+    assert store.timeout_for(URL, default=15) == 15
+
+    record(store, clock, 'https://sub.example.com/b', 4.0)
+    # 同一主机的订阅共享样本：p95 为 4 秒，超时为 4 * 2 + 2
+    assert store.timeout_for(URL, default=15) == 10
+
+    # 失败记录和其他类型的记录不计入
+    record(store, clock, URL, 30.0, ok=False)
+    record(store, clock, URL, 30.0, kind=KIND_HEAD)
+    assert store.timeout_for(URL, default=15) == 10
+    assert store.timeout_for(URL, default=5, kinds=(KIND_HEAD,)) == 5
+
+    # 结果限制在 [minimum, maximum] 内
+    assert store.timeout_for(URL, default=15, maximum=8) == 8
+    for _ in range(5):
+        record(store, clock, 'https://fast.example.com/', 0.1, kind=KIND_STREAM)
+    assert store.timeout_for('https://fast.example.com/', default=15) == 3
+
+
+def test_circuit_opens_and_half_opens_after_backoff(store, clock):
+    for _ in range(2):
+        record(store, clock, URL, 1.0, ok=False)
+    assert store.circuit_state(URL) == {'open': False, 'failure_streak': 2, 'retry_at': None}
+
+    record(store, clock, URL, 1.0, ok=False)
+    state = store.circuit_state(URL)
+    assert state['open'] and state['failure_streak'] == 3
+    assert state['retry_at'] == clock.now + 10
+
+    # 退避结束后放行试探
+    clock.now += 10
+    assert not store.circuit_state(URL)['open']
+
+    # 试探失败：退避时间翻倍，并且不超过上限
+    record(store, clock, URL, 1.0, ok=False)
+    assert store.circuit_state(URL)['retry_at'] == clock.now + 20
+    clock.now += 20
+    record(store, clock, URL, 1.0, ok=False)
+    assert store.circuit_state(URL)['retry_at'] == clock.now + 25
+
+    # 试探成功后熔断解除
+    clock.now += 25
+    record(store, clock, URL, 1.0)
+    assert store.circuit_state(URL) == {'open': False, 'failure_streak': 0, 'retry_at': None}
+
+
+def test_order_slowest_first(store, clock):
+    urls = ['https://a.example.com/', 'https://b.example.com/', 'https://c.example.com/', 'https://d.example.com/']
+    record(store, clock, urls[0], 1.0)
+    record(store, clock, urls[0], 3.0)
+    record(store, clock, urls[1], 5.0)
+    record(store, clock, urls[2], 0.5)
+    # 失败记录不影响平均耗时
+    record(store, clock, urls[2], 60.0, ok=False)
+
+    # 没有历史的订阅视为最慢，排在最前
+    assert store.order_slowest_first(urls) == [3, 1, 0, 2]
+
+
+def test_background_fetch_skips_open_circuit(manager, subscription_server):
+    url = subscription_server.set('/down', '', status=500)
+    for _ in range(manager.health.failure_threshold):
+        manager.fetch_proxies_with_details([url], ALL_REGIONS)
+    hits = subscription_server.hits['/down']
+
+    # 后台获取跳过熔断中的订阅
+    _, details = manager.fetch_proxies_with_details([url], ALL_REGIONS, use_circuit_breaker=True)
+    assert details[0]['cache'] == 'circuit_open'
+    assert subscription_server.hits['/down'] == hits
+
+    # 用户发起的获取仍然发送请求，成功后熔断解除
+    subscription_server.set('/down', trojan_links('HK 1'))
+    proxies, details = manager.fetch_proxies_with_details([url], ALL_REGIONS)
+    assert details[0]['cache'] == 'miss' and len(proxies) == 1
+    assert not manager.health.circuit_state(url)['open']
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_parse_errors_are_recorded(manager, subscription_server, monkeypatch, streaming):
+    def broken(*args, **kwargs):
+        raise ValueError('broken')
+
+    monkeypatch.setattr(SubscriptionParser, 'iter_parse_stream', broken)
+    monkeypatch.setattr(SubscriptionParser, 'parse_subscription', broken)
+    url = subscription_server.set('/sub', trojan_links('HK 1'))
+
+    _, details = manager.fetch_proxies_with_details([url], ALL_REGIONS, streaming=streaming)
+    assert details[0]['status'] == '解析失败: broken'
+    summary = manager.get_health_summary([url])[0]
+    assert summary['last_ok'] is False and summary['failure_streak'] == 1
+    assert manager.get_recent_fetch_status(url) == (False, '解析失败: broken')
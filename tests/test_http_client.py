@@ -0,0 +1,80 @@
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+from http_client import HttpClient
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """/slow 3 秒后才响应，/busy 返回 503 并要求很长的 Retry-After，/flaky 前两次返回 503"""
+
+    hits = 0
+
+    def do_GET(self):
+        Handler.hits += 1
+        if self.path == '/slow':
+            time.sleep(3)
+        failing = self.path == '/busy' or (self.path == '/flaky' and Handler.hits <= 2)
+        self.send_response(503 if failing else 200)
+        if self.path == '/busy':
+            self.send_header('Retry-After', '3600')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.hits = 0
+    srv = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{srv.server_address[1]}'
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_read_timeout_is_not_retried(server):
+    client = HttpClient(backoff_factor=0.01)
+    started = time.perf_counter()
+    with pytest.raises(requests.exceptions.Timeout):
+        client.get(server + '/slow', timeout=0.5)
+    assert Handler.hits == 1
+    assert time.perf_counter() - started < 2
+
+
+def test_retry_after_is_capped(server):
+    client = HttpClient(retries=2, backoff_factor=0.01, max_retry_after=0.2)
+    started = time.perf_counter()
+    response = client.get(server + '/busy', timeout=2)
+    assert response.status_code == 503
+    assert Handler.hits == 3
+    assert time.perf_counter() - started < 2
+
+
+def test_post_is_not_retried(server):
+    client = HttpClient(backoff_factor=0.01, max_retry_after=0.2)
+    # 非幂等请求即使返回 503 也只发送一次
+    assert client.post(server + '/busy', timeout=2).status_code == 503
+    assert Handler.hits == 1
+
+
+def test_attempt_started_excludes_retries(server):
+    client = HttpClient(retries=2, backoff_factor=0.3)
+    started = time.perf_counter()
+    response = client.get(server + '/flaky', timeout=2)
+    assert response.status_code == 200 and Handler.hits == 3
+    # 最后一次尝试在两次 503 和退避等待（第二次重试前 0.6 秒）之后才开始
+    assert client.attempt_started(response, started) - started >= 0.5
+
+    # 没有重试时就是调用方记录的开始时间
+    response = client.get(server + '/flaky', timeout=2)
+    assert client.attempt_started(response, started) == started
@@ -0,0 +1,158 @@
+import os
+import socket
+import ssl
+import threading
+
+import pytest
+
+from latency_prober import LatencyProber, probe_target
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+class Listener:
+    """本地测试用监听端口
+
+    mode:
+        'tcp'   - 只接受 TCP 连接
+        'tls'   - 接受连接并完成 TLS 握手（自签名证书）
+        'stall' - 接受 TCP 连接但从不响应 TLS 握手
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        self._connections = []
+        self._thread = None
+        if mode == 'tls':
+            self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self.context.load_cert_chain(os.path.join(DATA_DIR, 'selfsigned.pem'),
+                                         os.path.join(DATA_DIR, 'selfsigned.key'))
+        if mode != 'tcp':
+            self._thread = threading.Thread(target=self._serve, daemon=True)
+            self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            if self.mode == 'tls':
+                threading.Thread(target=self._handshake, args=(conn,), daemon=True).start()
+            else:
+                self._connections.append(conn)
+
+    def _handshake(self, conn):
+        try:
+            with self.context.wrap_socket(conn, server_side=True) as tls:
+                tls.recv(1)
+        except (OSError, ssl.SSLError):
+            pass
+
+    def close(self):
+        self.sock.close()
+        for conn in self._connections:
+            conn.close()
+
+
+@pytest.fixture
+def listeners():
+    created = []
+
+    def make(mode):
+        listener = Listener(mode)
+        created.append(listener)
+        return listener
+
+    yield make
+    for listener in created:
+        listener.close()
+
+
+def closed_port() -> int:
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_probe_target():
+    assert probe_target({'server': 'a', 'port': '443', 'type': 'ss'}) == ('a', 443, None)
+    assert probe_target({'server': 'a', 'port': 443, 'type': 'trojan'}) == ('a', 443, 'a')
+    assert probe_target({'server': 'a', 'port': 443, 'type': 'vmess', 'tls': True, 'servername': 'b'}) == ('a', 443, 'b')
+    assert probe_target({'server': 'a', 'port': 443, 'type': 'hysteria2'}) is None
+    assert probe_target({'server': 'a', 'port': 'x', 'type': 'ss'}) is None
+
+
+def test_probe_outcomes(listeners):
+    tcp = listeners('tcp')
+    tls = listeners('tls')
+    stall = listeners('stall')
+    targets = [('127.0.0.1', tcp.port, None), ('127.0.0.1', tls.port, 'localhost'),
+               ('127.0.0.1', closed_port(), None), ('127.0.0.1', stall.port, 'localhost')]
+
+    results = LatencyProber(timeout=1.0).probe_targets(targets)
+    ok_tcp, ok_tls, refused, stalled = (results[target] for target in targets)
+
+    assert ok_tcp['ok'] and ok_tcp['tls'] is None and ok_tcp['latency'] == ok_tcp['tcp']
+    assert ok_tls['ok'] and ok_tls['tls'] is not None
+    assert ok_tls['latency'] == pytest.approx(ok_tls['tcp'] + ok_tls['tls'], abs=0.11)
+    assert not refused['ok'] and refused['tcp'] is None and refused['latency'] is None
+    # TCP 连接成功但 TLS 握手超时：保留 TCP 连接时间
+    assert not stalled['ok'] and stalled['error'] == '超时' and stalled['tcp'] is not None
+
+
+def test_results_are_cached(listeners):
+    tcp = listeners('tcp')
+    target = ('127.0.0.1', tcp.port, None)
+
+    cached = LatencyProber(timeout=1.0, ttl=300)
+    assert cached.probe_targets([target])[target]['ok']
+    tcp.close()
+    # 有效期内不重新测试
+    assert cached.probe_targets([target])[target]['ok']
+    assert cached.get_stats()['entries'] == 1
+
+    expired = LatencyProber(timeout=1.0, ttl=0)
+    listener = listeners('tcp')
+    target = ('127.0.0.1', listener.port, None)
+    assert expired.probe_targets([target])[target]['ok']
+    listener.close()
+    assert not expired.probe_targets([target])[target]['ok']
+
+
+def test_select_fastest(listeners):
+    ports = [listeners('tcp').port for _ in range(3)]
+    dead = closed_port()
+
+    def node(name, port, region='hk', **extra):
+        return dict({'name': name, 'type': 'ss', 'server': '127.0.0.1', 'port': port, '_region': region}, **extra)
+
+    proxies = [node('hk1', ports[0]), node('hk-dead', dead), node('hk2', ports[1]),
+               node('hk-udp', 1, type='hysteria2'), node('hk3', ports[2]),
+               node('jp1', ports[0], 'jp'), node('chain', dead, _keep=True)]
+    prober = LatencyProber(timeout=1.0)
+    keep = lambda proxy: proxy.get('_keep', False)  # noqa: E731
+
+    selected = prober.select_fastest(proxies, top_n=2, keep=keep)
+    names = [proxy['name'] for proxy in selected]
+    # 必须保留的节点排在最前面且不参与测试
+    assert names[0] == 'chain' and '_latency' not in selected[0]
+    hk = [name for name in names if name.startswith('hk')]
+    assert len(hk) == 2 and set(hk) <= {'hk1', 'hk2', 'hk3'}
+    assert names[-1] == 'jp1'
+    assert all(proxy['_latency'] is not None for proxy in selected[1:])
+
+    # 不限数量时：测试失败的节点被丢弃，无法测速的节点排在同地区已测速节点之后
+    names = [proxy['name'] for proxy in prober.select_fastest(proxies, keep=keep)]
+    assert 'hk-dead' not in names
+    assert names.index('hk-udp') > max(names.index(name) for name in ('hk1', 'hk2', 'hk3'))
+
+    # 超过最大延迟的节点被丢弃，无法测速的节点保留
+    names = [proxy['name'] for proxy in prober.select_fastest(proxies, max_latency=-1, keep=keep)]
+    assert names == ['chain', 'hk-udp']
@@ -0,0 +1,61 @@
+import random
+import re
+
+import pytest
+
+from proxy_filter import build_name_regex
+
+# 包含正则元字符、字符类中需要转义的字符和多字节字符，名称之间有大量共同前缀
+ALPHABET = list('ab01-') + list('.^$*+?()[]{}|\\/') + [' ', '香', '港', '🇭🇰', '\n']
+
+
+def random_names(rng: random.Random):
+    stems = [''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 4))) for _ in range(rng.randint(1, 4))]
+    names = set()
+    for _ in range(rng.randint(1, 25)):
+        suffix = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 3)))
+        names.add(rng.choice(stems) + suffix)
+    return sorted(names)
+
+
+def probes(rng: random.Random, names):
+    """名称本身、前缀、延长和修改过的字符串"""
+    result = set(names)
+    for name in names:
+        result.update(name[:i] for i in range(len(name)))
+        result.add(name + rng.choice(ALPHABET))
+        if name:
+            i = rng.randrange(len(name))
+            result.add(name[:i] + rng.choice(ALPHABET) + name[i + 1:])
+            result.add(name[:i] + name[i + 1:])
+    for _ in range(20):
+        result.add(''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 6))))
+    return result
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_matches_same_names_as_alternation(seed):
+    rng = random.Random(seed)
+    names = random_names(rng)
+    compact = re.compile(build_name_regex(names))
+    reference = re.compile('|'.join(re.escape(name) for name in names if name))
+
+    for text in probes(rng, names):
+        assert bool(compact.fullmatch(text)) == bool(reference.fullmatch(text)), text
+        assert bool(compact.search(text)) == bool(reference.search(text)), text
+        padded = 'x' + text + 'y'
+        assert bool(compact.search(padded)) == bool(reference.search(padded)), padded
+
+
+def test_common_prefixes_are_compacted():
+    names = [f'香港 {i:02d}' for i in range(1, 21)]
+    pattern = build_name_regex(names)
+    assert len(pattern) < len('|'.join(re.escape(name) for name in names)) // 3
+    assert all(re.fullmatch(pattern, name) for name in names)
+    assert not re.fullmatch(pattern, '香港 21')
+
+
+def test_empty_input():
+    assert build_name_regex([]) == ''
+    assert build_name_regex(['', '']) == ''
+    assert re.fullmatch(build_name_regex(['', 'a']), 'a')
@@ -0,0 +1,124 @@
+import pytest
+
+from node_index import (assign_node_ids, dedupe_sources, node_fingerprint, parse_dedupe_options, SnapshotStore,
+                        DEDUPE_MERGE_NAMES, DEDUPE_NONE, DEDUPE_PREFER_SOURCE)
+from test_subscription_fetch import ALL_REGIONS, trojan_links
+
+
+def node(name, server='hk.example.com', port=443, **extra):
+    return {'name': name, 'type': 'trojan', 'server': server, 'port': port, 'password': 'pw', **extra}
+
+
+def names(sources):
+    return [[proxy['name'] for proxy in proxies] for proxies in sources]
+
+
+def test_fingerprint_normalizes_scalars():
+    assert node_fingerprint(node('a', port=443)) == node_fingerprint(node('b', port='443'))
+    assert node_fingerprint(node('a', server='HK.example.com ')) == node_fingerprint(node('b'))
+    assert node_fingerprint(node('a', tls=True)) == node_fingerprint(node('b', tls='true'))
+    assert node_fingerprint(node('a', **{'ws-opts': {'path': '/x', 'headers': {'Host': 'h'}}})) == \
+        node_fingerprint(node('b', **{'ws-opts': {'headers': {'Host': 'h'}, 'path': '/x'}}))
+    assert node_fingerprint(node('a', port=443)) != node_fingerprint(node('b', port=8443))
+    # 密码区分大小写
+    assert node_fingerprint(node('a', password='PW')) != node_fingerprint(node('b'))
+
+
+def test_duplicates_inside_one_source_are_kept():
+    sources = [[node('HK 1'), node('HK 1 备用')], [node('HK A', port='443'), node('JP', server='jp.example.com')]]
+    result, dropped = dedupe_sources(sources)
+    assert names(result) == [['HK 1', 'HK 1 备用'], ['JP']]
+    assert dropped == [0, 1]
+
+
+def test_prefer_source_keeps_all_copies_from_preferred_source():
+    sources = [[node('HK 1')], [node('HK A'), node('HK B')]]
+    result, dropped = dedupe_sources(sources, DEDUPE_PREFER_SOURCE, source_ids=['u1', 'u2'],
+                                     preferred_sources=['u2'])
+    assert names(result) == [[], ['HK A', 'HK B']]
+    assert dropped == [1, 0]
+
+
+def test_merge_names_records_aliases_from_other_sources():
+    sources = [[node('HK 1'), node('HK 1 备用')], [node('HK A'), node('HK 1')]]
+    result, _ = dedupe_sources(sources, DEDUPE_MERGE_NAMES)
+    assert names(result) == [['HK 1', 'HK 1 备用'], []]
+    assert result[0][0]['_aliases'] == ['HK A']
+
+
+def test_none_policy_keeps_everything():
+    sources = [[node('HK 1')], [node('HK A')]]
+    assert dedupe_sources(sources, DEDUPE_NONE) == (sources, [0, 0])
+
+
+@pytest.mark.parametrize('options', ['first', ['first'], {'policy': 'newest'},
+                                     {'policy': 'prefer', 'preferred_sources': 'http://a'}])
+def test_invalid_dedupe_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        parse_dedupe_options(options)
+
+
+def test_ids_are_stable_for_duplicates_within_a_source():
+    first = assign_node_ids([node('HK 1'), node('HK 2')])
+    again = assign_node_ids([node('HK 2'), node('HK 1')])
+    assert {p['name']: p['_id'] for p in first} == {p['name']: p['_id'] for p in again}
+    assert len({p['_id'] for p in first}) == 2
+
+
+def test_invalid_policy_fails_before_fetching(manager, subscription_server):
+    url = subscription_server.set('/sub', trojan_links('HK 1'))
+    with pytest.raises(ValueError):
+        manager.fetch_proxies_with_details([url], ALL_REGIONS, dedupe_options={'policy': 'newest'})
+    with pytest.raises(ValueError):
+        next(manager.iter_fetch_proxies([url], ALL_REGIONS, dedupe_options={'policy': 'newest'}))
+    assert subscription_server.hits['/sub'] == 0
+
+
+def test_fetch_dedupes_across_sources_only(manager, subscription_server):
+    first = subscription_server.set('/a', trojan_links('HK 1') + '\n' + trojan_links('HK 1 copy').replace(
+        'hk-1-copy', 'hk-1'))
+    second = subscription_server.set('/b', trojan_links('HK 1').replace('#HK%201', '#HK%20A'))
+    proxies, details = manager.fetch_proxies_with_details([first, second], ALL_REGIONS)
+    assert [proxy['name'] for proxy in proxies] == ['HK 1', 'HK 1 copy']
+    assert [detail['duplicates_dropped'] for detail in details] == [0, 1]
+
+    # 流式获取按到达顺序保留先到订阅中的全部节点
+    streamed = {(len(result['proxies']), result['detail']['duplicates_dropped'])
+                for result in manager.iter_fetch_proxies([first, second], ALL_REGIONS)}
+    assert streamed in ({(2, 0), (0, 1)}, {(1, 0), (0, 2)})
+
+
+@pytest.mark.parametrize('dedupe', ['first', ['first'], {'policy': 'newest'}])
+def test_routes_reject_invalid_dedupe(client, subscription_server, dedupe):
+    url = subscription_server.set('/sub', trojan_links('HK 1'))
+    for path in ('/api/fetch-proxies', '/api/fetch-proxies/stream'):
+        response = client.post(path, json={'urls': [url], 'dedupe': dedupe})
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
+    assert subscription_server.hits['/sub'] == 0
+
+
+def test_snapshot_store_serves_several_polling_clients():
+    store = SnapshotStore(versions_per_key=2)
+    v1 = store.diff('u', 'k', assign_node_ids([node('HK 1')]))['version']
+    v2 = store.diff('u', 'k', assign_node_ids([node('HK 1'), node('JP', server='jp.example.com')]))['version']
+
+    # 客户端 A 持有 v1，客户端 B 持有 v2，互不影响
+    current = assign_node_ids([node('HK 1'), node('JP', server='jp.example.com'), node('US', server='us.example.com')])
+    diff_a = store.diff('u', 'k', current, v1)
+    diff_b = store.diff('u', 'k', current, v2)
+    assert not diff_a['reset'] and [p['name'] for p in diff_a['added']] == ['JP', 'US']
+    assert not diff_b['reset'] and [p['name'] for p in diff_b['added']] == ['US']
+    assert diff_a['version'] == diff_b['version']
+
+    # 超出保留数量的旧版本需要整体重置
+    store.diff('u', 'k', assign_node_ids([node('HK 2', port=8443)]))
+    assert store.diff('u', 'k', current, v1)['reset']
+    assert store.diff('u', 'other', current, v2)['reset']
+
+
+def test_ids_without_dedupe_are_unique_per_source():
+    first = assign_node_ids([node('HK 1')], source='u1')
+    second = assign_node_ids([node('HK 1')], source='u2')
+    assert first[0]['_id'] != second[0]['_id']
+    assert assign_node_ids([node('HK 1')], source='u1')[0]['_id'] == first[0]['_id']
@@ -0,0 +1,161 @@
+import math
+import random
+
+import pytest
+import yaml
+
+from proxy_serializer import FIELD_ORDER, ProxySerializer, quote_string, render_proxy
+
+LOADERS = [pytest.param(yaml.SafeLoader, id='python')]
+if getattr(yaml, '__with_libyaml__', False):
+    LOADERS.append(pytest.param(yaml.CSafeLoader, id='libyaml'))
+
+# 容易破坏 YAML 结构的片段
+HOSTILE = ['"', "'", '\\', ':', ': ', ' #', '#', '- ', '{', '}', '[', ']', ',', '&a', '*a', '!tag', '%', '@', '`',
+           '|', '>', '?', '~', 'null', 'true', 'no', 'on', '0x1f', '1e3', '.inf', '---', '...', ' ', '\t', '\n',
+           '\r\n', '\x00', '\x07', '\x1b', '\x7f', '\x85', '\xa0', '\u2028', '\u2029', '\ufeff', '香港', '🇭🇰',
+           'é', 'ẞ', '\U0001f600']
+
+
+def random_string(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 6)):
+        if rng.random() < 0.5:
+            parts.append(rng.choice(HOSTILE))
+        else:
+            parts.append(''.join(rng.choice('abcXYZ019 -_./') for _ in range(rng.randint(1, 5))))
+    return ''.join(parts)
+
+
+def random_scalar(rng: random.Random):
+    kind = rng.randrange(7)
+    if kind == 0:
+        return random_string(rng)
+    if kind == 1:
+        return rng.choice([0, -1, 443, 2 ** 63, -2 ** 70, rng.randint(-10 ** 6, 10 ** 6)])
+    if kind == 2:
+        return rng.choice([0.0, -0.0, 1.5, 1e-5, 1e300, -2.5e-300, float('inf'), float('-inf'), float('nan'),
+                           rng.uniform(-1e6, 1e6)])
+    if kind == 3:
+        return rng.choice([True, False])
+    if kind == 4:
+        return None
+    return random_string(rng)
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    roll = rng.random()
+    if depth < 3 and roll < 0.2:
+        return {random_key(rng): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    if depth < 3 and roll < 0.35:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return random_scalar(rng)
+
+
+def random_key(rng: random.Random):
+    if rng.random() < 0.1:
+        return rng.randint(-5, 5)
+    return rng.choice(['path', 'Host', 'headers', 'a b', 'true', 'null', 'x-y', '1', '']) if rng.random() < 0.5 \
+        else random_string(rng)
+
+
+def random_proxy(rng: random.Random) -> dict:
+    proxy = {'name': random_string(rng), 'type': rng.choice(['ss', 'vmess', 'trojan']),
+             'server': random_string(rng), 'port': rng.randint(1, 65535)}
+    for _ in range(rng.randint(0, 6)):
+        proxy[random_string(rng) or 'k'] = random_value(rng)
+    if rng.random() < 0.3:
+        proxy['_id'] = 'internal'
+    return proxy
+
+
+def normalize(value):
+    """NaN 无法直接比较，替换为可比较的标记"""
+    if isinstance(value, float) and math.isnan(value):
+        return 'NaN'
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+
+def expected_node(proxy: dict) -> dict:
+    return {key: value for key, value in proxy.items()
+            if value is not None and not (isinstance(key, str) and key.startswith('_'))}
+
+
+def load_line(line: str, loader) -> dict:
+    return yaml.load('proxies:\n' + line + '\n', Loader=loader)['proxies'][0]
+
+
+@pytest.mark.parametrize('loader', LOADERS)
+@pytest.mark.parametrize('seed', range(20))
+def test_render_round_trip(seed, loader):
+    rng = random.Random(seed)
+    for _ in range(50):
+        proxy = random_proxy(rng)
+        line = render_proxy(proxy)
+        assert '\n' not in line
+        assert normalize(load_line(line, loader)) == normalize(expected_node(proxy))
+
+
+@pytest.mark.parametrize('loader', LOADERS)
+def test_quote_string_round_trip(loader):
+    for text in HOSTILE + [''.join(HOSTILE), '']:
+        assert yaml.load(quote_string(text), Loader=loader) == text
+
+
+def test_field_order_and_internal_fields():
+    proxy = {'extra': 1, 'port': 443, '_id': 'x', 'name': 'a', 'server': 's', 'type': 'ss', 'udp': None}
+    line = render_proxy(proxy)
+    keys = list(load_line(line, yaml.SafeLoader))
+    assert keys == ['name', 'type', 'server', 'port', 'extra']
+    assert keys[:4] == [key for key in FIELD_ORDER if key in proxy and key != 'udp']
+
+
+def test_serializer_cache():
+    serializer = ProxySerializer(max_entries=2)
+    proxy = {'name': 'a', 'type': 'ss', 'server': 's', 'port': 1}
+    assert serializer.render(proxy) == serializer.render(dict(proxy)) == render_proxy(proxy)
+    assert (serializer.hits, serializer.misses) == (1, 1)
+
+    for index in range(3):
+        serializer.render(dict(proxy, port=index + 2))
+    assert serializer.get_stats()['entries'] == 2
+
+
+def test_serializer_ignores_internal_fields():
+    serializer = ProxySerializer()
+    proxy = {'name': 'a', 'type': 'ss', 'server': 's', 'port': 1, '_id': 'x', '_latency': 120}
+    line = serializer.render(proxy)
+    assert serializer.render(dict(proxy, _latency=80, _source='http://sub')) == line
+    assert serializer.render({key: value for key, value in proxy.items() if key[:1] != '_'}) == line
+    assert (serializer.hits, serializer.misses) == (2, 1)
+
+
+def test_serializer_distinguishes_equal_values_of_other_types():
+    serializer = ProxySerializer()
+    base = {'name': 'a', 'type': 'ss', 'server': 's', 'port': 1}
+    for values in ([True, 1, 1.0], [False, 0, 0.0, -0.0]):
+        lines = [serializer.render(dict(base, udp=value)) for value in values]
+        assert lines == [render_proxy(dict(base, udp=value)) for value in values]
+        assert len(set(lines)) == len(values)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_serializer_matches_render_proxy(seed):
+    rng = random.Random(seed)
+    serializer = ProxySerializer(max_entries=100)
+    proxies = [random_proxy(rng) for _ in range(200)]
+    # 非字符串的顶层键走通用路径，与相等的字符串键/布尔键互不混淆
+    proxies += [{'name': 'a', 1: 'one'}, {'name': 'a', True: 'one'}, {'name': 'a', '1': 'one'}]
+    for _ in range(2):
+        assert serializer.render_all(proxies) == [render_proxy(proxy) for proxy in proxies]
+    assert render_proxy({'name': 'a', True: 'one'}) != render_proxy({'name': 'a', 1: 'one'})
+
+
+@pytest.mark.parametrize('loader', LOADERS)
+def test_render_non_string_keys_round_trip(loader):
+    proxy = {'port': 443, 1: 'one', 'name': 'a', '_id': 'x', 2.5: [1, 2], None: 'n'}
+    assert load_line(render_proxy(proxy), loader) == expected_node(proxy)
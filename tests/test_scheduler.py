@@ -0,0 +1,120 @@
+import pytest
+
+from scheduler import RegenerationScheduler
+
+
+class FakeManager:
+    """只实现调度器用到的方法，记录生成和上传的内容"""
+
+    def __init__(self, config=None, saved_urls=None, fetched=None, skipped=False):
+        self.config = config or {}
+        self.saved_urls = saved_urls or []
+        self.fetched = fetched or []
+        self.skipped = skipped
+        self.fetch_calls = []
+        self.published = []
+
+    def load_gist_configs(self):
+        return {'main': 'gist-id'}
+
+    def load_chained_proxy_config(self):
+        return self.config
+
+    def load_saved_urls_simple(self):
+        return self.saved_urls
+
+    def fetch_proxies_from_urls(self, urls, filter_options, use_circuit_breaker=False):
+        self.fetch_calls.append((urls, filter_options))
+        return [dict(proxy) for proxy in self.fetched]
+
+    def prepare_config_nodes(self, selected, custom, chained):
+        return selected + custom, chained
+
+    def merge_proxies_to_template(self, nodes, chained):
+        return '\n'.join(node['name'] for node in nodes)
+
+    def publish_to_gist(self, content, token, reuse_gist, gist_name):
+        self.published.append((gist_name, content))
+        return {'raw_url': 'https://gist.example/raw', 'skipped': self.skipped, 'reason': '内容与上次上传一致'}
+
+
+def node(node_id, name=None):
+    return {'_id': node_id, 'name': name or node_id}
+
+
+@pytest.fixture
+def make_scheduler(tmp_path, monkeypatch):
+    monkeypatch.setenv('GITHUB_TOKEN', 'token')
+
+    def make(manager):
+        return RegenerationScheduler(manager, config_file=str(tmp_path / 'scheduler.json'))
+    return make
+
+
+def test_select_nodes_keeps_new_nodes_and_drops_deselected(make_scheduler):
+    scheduler = make_scheduler(FakeManager())
+    config = {'selected_proxy_ids': ['a', 'c1'], 'deselected_proxy_ids': ['b'],
+              'custom_nodes': [node('c1'), node('c2')]}
+    selected, custom = scheduler._select_nodes(config, [node('a'), node('b'), node('new')])
+    assert [proxy['_id'] for proxy in selected] == ['a', 'new']
+    assert [proxy['_id'] for proxy in custom] == ['c1']
+
+
+def test_select_nodes_infers_deselected_from_legacy_config(make_scheduler):
+    scheduler = make_scheduler(FakeManager())
+    config = {'selected_proxy_ids': ['a'], 'all_proxies': [node('a'), node('b')]}
+    selected, _ = scheduler._select_nodes(config, [node('a'), node('b'), node('new')])
+    assert [proxy['_id'] for proxy in selected] == ['a', 'new']
+
+
+def test_run_job_uploads_selected_nodes(make_scheduler):
+    manager = FakeManager(config={'subscription_urls': ['http://sub'], 'filter_options': {'regions': ['jp']},
+                                  'deselected_proxy_ids': ['b']},
+                          fetched=[node('a', 'JP 1'), node('b', 'JP 2')])
+    scheduler = make_scheduler(manager)
+    status = scheduler.run_job('main')
+    assert status['outcome'] == 'uploaded' and status['nodes'] == 1
+    assert manager.fetch_calls == [(['http://sub'], {'regions': ['jp']})]
+    assert manager.published == [('main', 'JP 1')]
+    assert scheduler.get_status()['jobs']['main']['outcome'] == 'uploaded'
+
+
+def test_run_job_prefers_job_filter_and_reports_unchanged(make_scheduler):
+    manager = FakeManager(saved_urls=['http://saved'], fetched=[node('a')], skipped=True)
+    scheduler = make_scheduler(manager)
+    scheduler.set_job('main', {'filter_options': {'regions': ['us']}})
+    status = scheduler.run_job('main')
+    assert status['outcome'] == 'unchanged'
+    assert manager.fetch_calls == [(['http://saved'], {'regions': ['us']})]
+
+
+def test_run_job_without_urls_is_skipped(make_scheduler):
+    manager = FakeManager()
+    status = make_scheduler(manager).run_job('main')
+    assert status['outcome'] == 'skipped'
+    assert manager.fetch_calls == [] and manager.published == []
+
+
+def test_run_job_reports_errors(make_scheduler, monkeypatch):
+    manager = FakeManager(config={'subscription_urls': ['http://sub']})
+    scheduler = make_scheduler(manager)
+    assert scheduler.run_job('main')['outcome'] == 'error'  # 没有节点
+
+    monkeypatch.delenv('GITHUB_TOKEN')
+    status = scheduler.run_job('main')
+    assert status['outcome'] == 'error' and 'GITHUB_TOKEN' in status['message']
+
+    with pytest.raises(ValueError):
+        scheduler.run_job('missing')
+
+
+def test_app_starts_scheduler_once_per_process(client, monkeypatch):
+    import app as app_module
+
+    starts = []
+    monkeypatch.setenv('SCHEDULER_ENABLED', 'true')
+    monkeypatch.setattr(app_module, '_scheduler_started', False)
+    monkeypatch.setattr(app_module.scheduler, 'start', lambda: starts.append(1))
+    for _ in range(3):
+        assert client.get('/api/scheduler/status').status_code == 200
+    assert starts == [1]
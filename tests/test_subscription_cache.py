@@ -0,0 +1,58 @@
+import datetime
+import os
+
+from subscription_cache import ParseMemo
+from subscription_parser import SubscriptionParser
+
+# 节点中带有 JSON 无法原样表示的 YAML 值：日期、时间戳、二进制和整数键
+YAML_WITH_DATES = '''proxies:
+  - name: HK 1
+    type: ss
+    server: hk.example.com
+    port: 443
+    cipher: aes-256-gcm
+    password: pw
+    expire: 2030-01-02
+    updated: 2024-05-06 07:08:09
+    blob: !!binary aGVsbG8=
+    opts: {1: one}
+'''
+
+
+def test_parse_memo_keeps_yaml_types():
+    memo = ParseMemo()
+    first = memo.get_or_parse(YAML_WITH_DATES, SubscriptionParser.parse_subscription)
+    node = first[0]
+    assert node['expire'] == datetime.date(2030, 1, 2)
+    assert isinstance(node['updated'], datetime.datetime)
+    assert node['blob'] == b'hello'
+
+    second = memo.get_or_parse(YAML_WITH_DATES, SubscriptionParser.parse_subscription)
+    assert second == first and memo.hits == 1
+    assert second[0]['opts'] == {1: 'one'}
+
+    # 每次命中返回新的副本
+    second[0]['name'] = 'changed'
+    assert memo.get_or_parse(YAML_WITH_DATES, SubscriptionParser.parse_subscription)[0]['name'] == 'HK 1'
+
+
+def test_parse_memo_persists_only_json_safe_results(tmp_path):
+    persist_dir = str(tmp_path)
+    plain = 'proxies:\n  - {name: HK 2, type: ss, server: s, port: 1}\n'
+
+    memo = ParseMemo(persist_dir=persist_dir)
+    memo.get_or_parse(YAML_WITH_DATES, SubscriptionParser.parse_subscription)
+    memo.get_or_parse(plain, SubscriptionParser.parse_subscription)
+    assert os.listdir(persist_dir) == [ParseMemo.content_hash(plain) + '.json']
+
+    restarted = ParseMemo(persist_dir=persist_dir)
+    assert restarted.get_or_parse(plain, lambda content: []) == [
+        {'name': 'HK 2', 'type': 'ss', 'server': 's', 'port': 1}]
+    assert restarted.disk_hits == 1
+
+
+def test_parse_memo_does_not_cache_unpicklable_results():
+    memo = ParseMemo()
+    result = [{'name': 'x', 'callback': lambda: None}]
+    assert memo.get_or_parse('content', lambda content: result) is result
+    assert memo.get_stats()['entries'] == 0
@@ -0,0 +1,38 @@
+ALL_REGIONS = {'regions': ['all']}
+
+
+def trojan_links(*names, port=443):
+    return '\n'.join(f'trojan://pw@{name.lower().replace(" ", "-")}.example.com:{port}#{name.replace(" ", "%20")}'
+                     for name in names)
+
+
+def test_fresh_cache_hit_does_not_count_as_availability(manager, subscription_server):
+    url = subscription_server.set('/sub', trojan_links('HK 1', 'HK 2'))
+
+    _, details = manager.fetch_proxies_with_details([url], ALL_REGIONS)
+    assert details[0]['cache'] == 'miss'
+    assert manager.get_recent_fetch_status(url) == (True, '可用')
+
+    # 有效期内的缓存命中没有访问订阅，不能作为可用性结果
+    manager._fetch_status.clear()
+    _, details = manager.fetch_proxies_with_details([url], ALL_REGIONS)
+    assert details[0]['cache'] == 'hit'
+    assert manager.get_recent_fetch_status(url) is None
+    assert subscription_server.hits['/sub'] == 1
+
+    # 过期后的 304 重新验证是真实请求
+    manager.subscription_cache.ttl = 0
+    _, details = manager.fetch_proxies_with_details([url], ALL_REGIONS)
+    assert details[0]['cache'] == 'revalidated'
+    assert manager.get_recent_fetch_status(url) == (True, '未修改')
+
+
+def test_yaml_date_fields_survive_fetch_and_cache(manager, subscription_server):
+    url = subscription_server.set('/clash', 'proxies:\n'
+                                  '  - {name: HK 1, type: ss, server: hk.example.com, port: 443, expire: 2030-01-02}\n')
+
+    for expected_cache in ('miss', 'hit'):
+        proxies, details = manager.fetch_proxies_with_details([url], ALL_REGIONS)
+        assert details[0]['cache'] == expected_cache
+        assert [proxy['name'] for proxy in proxies] == ['HK 1']
+        assert 'expire: "2030-01-02"' in manager.proxy_serializer.render(proxies[0])
@@ -0,0 +1,49 @@
+import base64
+
+import pytest
+
+from subscription_parser import SubscriptionParser
+
+LINKS = 'trojan://pw@hk.example.com:443#HK%201\nss://YWVzLTI1Ni1nY206cHc=@jp.example.com:8388#JP%201\n'
+CLASH = 'proxies:\n  - {name: HK 1, type: ss, server: hk.example.com, port: 443, cipher: aes-256-gcm, password: pw}\n'
+
+
+def b64(text: str, wrap: int = 0) -> str:
+    encoded = base64.b64encode(text.encode('utf-8')).decode()
+    if wrap:
+        encoded = '\n'.join(encoded[i:i + wrap] for i in range(0, len(encoded), wrap))
+    return encoded
+
+
+def parse_stream(content: str, chunk_size: int = 7):
+    data = content.encode('utf-8')
+    return list(SubscriptionParser.iter_parse_stream(data[i:i + chunk_size] for i in range(0, len(data), chunk_size)))
+
+
+CASES = {
+    'plain': (LINKS, ['HK 1', 'JP 1']),
+    'base64': (b64(LINKS), ['HK 1', 'JP 1']),
+    'base64-wrapped': (b64(LINKS, wrap=76), ['HK 1', 'JP 1']),
+    'double-base64': (b64(b64(LINKS)), ['HK 1', 'JP 1']),
+    'double-base64-wrapped': (b64(b64(LINKS, wrap=76), wrap=76), ['HK 1', 'JP 1']),
+    'clash': (CLASH, ['HK 1']),
+    'base64-clash': (b64(CLASH), ['HK 1']),
+    'double-base64-clash': (b64(b64(CLASH)), ['HK 1']),
+}
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_parse_subscription(case):
+    content, names = CASES[case]
+    assert [proxy['name'] for proxy in SubscriptionParser.parse_subscription(content)] == names
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_iter_parse_stream(case):
+    content, names = CASES[case]
+    assert [proxy['name'] for proxy in parse_stream(content)] == names
+
+
+def test_undecodable_base64_yields_nothing():
+    assert SubscriptionParser.parse_subscription('QUJD$') == []
+    assert SubscriptionParser.parse_subscription(b64('QUJD')) == []
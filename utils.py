@@ -1,11 +1,25 @@
 import os
 import json
 import requests
-import yaml
 import re
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 from subscription_parser import SubscriptionParser
+from http_client import HttpClient
+from subscription_cache import SubscriptionCache, ParseMemo
+from proxy_filter import compile_node_filter, build_name_regex, NodeFilter
+from proxy_serializer import ProxySerializer, quote_string
+from config_template import load_template, SLOT_PROXIES, SLOT_EXCLUDE_FILTER
+from latency_prober import LatencyProber
+from dns_resolver import DnsResolver
+from storage import Storage
+from file_store import read_json, write_json, update_json
+from health_store import HealthStore, KIND_GET, KIND_STREAM, KIND_HEAD
+from node_index import dedupe_sources, assign_node_ids, backend_fingerprints, parse_dedupe_options, SnapshotStore, DEDUPE_NONE
 from urllib.parse import urlparse
 
 
@@ -29,29 +43,127 @@ class ClashConfigManager:
         '52pokemon': '52Pokemon订阅'
     }
     
-    def __init__(self):
+    # 请求订阅时使用的默认请求头
+    DEFAULT_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    
+    # 最近一次获取结果的有效期（秒），用于轻量模式的可用性测试
+    FETCH_STATUS_TTL = 300
+    
+    # 流式获取订阅时每次读取的字节数
+    STREAM_CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, max_workers: int = None, per_host_limit: int = None):
+        self.template_file = 'example.yaml'
+        # 旧版本使用的文件，首次启动时迁移到 SQLite 存储
         self.gist_id_file = '.gist_id'
         self.urls_file = 'data/urls.json'
-        self.template_file = 'example.yaml'
         self.chained_config_file = 'data/chained_proxy_config.json'
-        self._gist_configs = None  # 缓存 Gist 配置
+        self.gist_digest_file = 'data/gist_digests.json'  # 每个 Gist 上次上传内容的摘要
+        
+        # URL、Gist、链式代理配置和上传摘要统一保存在 SQLite 中
+        self.storage = Storage(os.getenv('STORAGE_DB', 'data/storage.db'))
+        self._migrate_legacy_files()
+        
+        # 并发获取订阅的配置：总线程数和单个主机的最大并发数
+        self.max_workers = max_workers or int(os.getenv('FETCH_MAX_WORKERS', '8'))
+        self.per_host_limit = per_host_limit or int(os.getenv('FETCH_PER_HOST_LIMIT', '2'))
+        self._host_semaphores = {}  # {host: BoundedSemaphore}
+        self._host_lock = threading.Lock()
+        self._fetch_status = {}  # {url: (timestamp, is_available, status_msg)}
+        self._fetch_status_lock = threading.Lock()
+        
+        # 共享的连接池会话，获取订阅、测试 URL 和上传 Gist 都复用它
+        self.http = HttpClient(pool_maxsize=max(self.max_workers, self.per_host_limit))
+        
+        # 订阅磁盘缓存（条件请求 + 有效期 + 大小淘汰）
+        self.subscription_cache = SubscriptionCache(
+            ttl=float(os.getenv('SUBSCRIPTION_CACHE_TTL', '600')),
+            max_bytes=int(float(os.getenv('SUBSCRIPTION_CACHE_MAX_MB', '50')) * 1024 * 1024)
+        )
+        
+        # 按内容哈希缓存解析结果，内容未变化时跳过解析
+        persist_memo = os.getenv('PARSE_MEMO_PERSIST', 'false').lower() == 'true'
+        self.parse_memo = ParseMemo(
+            max_entries=int(os.getenv('PARSE_MEMO_SIZE', '64')),
+            persist_dir='data/parse_memo' if persist_memo else None
+        )
+        
+        # 每个订阅最近一次的节点快照，用于增量刷新
+        self.snapshots = SnapshotStore()
+        self.proxy_serializer = ProxySerializer()  # 节点行渲染缓存
+        
+        # 订阅健康历史：获取顺序、熔断和按 p95 设置的超时
+        self.health = HealthStore(
+            failure_threshold=int(os.getenv('HEALTH_FAILURE_THRESHOLD', '3')),
+            backoff_base=float(os.getenv('HEALTH_BACKOFF_BASE', '60')),
+            backoff_max=float(os.getenv('HEALTH_BACKOFF_MAX', '3600'))
+        )
+        
+        # 节点服务器域名的批量解析和缓存，测速和后端视图共用
+        self.resolver = DnsResolver(max_ttl=float(os.getenv('DNS_CACHE_TTL', '300')))
+        
+        # 节点延迟测试（TCP 连接 + TLS 握手），结果按目标缓存
+        self.prober = LatencyProber(
+            concurrency=int(os.getenv('PROBE_CONCURRENCY', '64')),
+            timeout=float(os.getenv('PROBE_TIMEOUT', '3')),
+            ttl=float(os.getenv('PROBE_CACHE_TTL', '300')),
+            resolver=self.resolver
+        )
         
     def _read_json_file(self, file_path: str, default_value=None):
-        """通用JSON文件读取函数"""
-        if not os.path.exists(file_path):
-            return default_value if default_value is not None else {}
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return default_value if default_value is not None else {}
+        """通用JSON文件读取函数（按文件修改时间缓存，其他进程写入后自动重新读取）"""
+        return read_json(file_path, default_value if default_value is not None else {})
             
     def _write_json_file(self, file_path: str, data: dict, ensure_dir: bool = True):
-        """通用JSON文件写入函数"""
-        if ensure_dir:
-            os.makedirs(os.path.dirname(file_path) if os.path.dirname(file_path) else '.', exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """通用JSON文件写入函数（文件锁 + 临时文件重命名的原子写入，会自动创建目录）"""
+        write_json(file_path, data)
+        
+    def _update_json_file(self, file_path: str, update, default_value=None):
+        """在文件锁内读取、修改并写回 JSON 文件，并发修改时不会丢失更新
+        
+        Args:
+            update: 接收当前内容并返回新内容的函数
+        """
+        return update_json(file_path, update, default_value if default_value is not None else {})
+        
+    def _migrate_legacy_files(self):
+        """把旧版本的 JSON 和 .gist_id 文件导入 SQLite 存储（只执行一次）
+        
+        导入成功后原文件重命名为 *.migrated 作为备份。
+        """
+        if self.storage.get_meta('legacy_migrated'):
+            return
+            
+        migrated = []
+        if os.path.exists(self.urls_file):
+            data = self._migrate_url_data(self._read_json_file(self.urls_file, {'version': '2.0', 'urls': []}))
+            self.storage.add_urls(data.get('urls', []))
+            migrated.append(self.urls_file)
+            
+        if os.path.exists(self.gist_id_file):
+            for name, gist_id in self._read_legacy_gist_file().items():
+                self.storage.set_gist(name, gist_id)
+            migrated.append(self.gist_id_file)
+            
+        if os.path.exists(self.gist_digest_file):
+            for gist_id, record in self._read_json_file(self.gist_digest_file, {}).items():
+                self.storage.set_gist_digest(gist_id, record.get('name'), record.get('digest', ''),
+                                             record.get('raw_url'), record.get('updated'))
+            migrated.append(self.gist_digest_file)
+            
+        if os.path.exists(self.chained_config_file):
+            config = self._read_json_file(self.chained_config_file, None)
+            if config:
+                self.storage.save_chained_config(config)
+            migrated.append(self.chained_config_file)
+            
+        for file_path in migrated:
+            os.replace(file_path, file_path + '.migrated')
+        if migrated:
+            print(f"已将 {', '.join(migrated)} 迁移到 {self.storage.db_path}")
+        self.storage.set_meta('legacy_migrated', datetime.now().isoformat())
         
     def _migrate_url_data(self, data: dict) -> dict:
         """迁移旧版本URL数据到新格式"""
@@ -108,11 +220,8 @@ class ClashConfigManager:
             return f"订阅_{url[:20]}..."
         
     def load_saved_urls(self) -> List[Dict[str, str]]:
-        """加载保存的 URL 历史（新格式）"""
-        data = self._read_json_file(self.urls_file, {'version': '2.0', 'urls': []})
-        # 迁移旧数据
-        data = self._migrate_url_data(data)
-        return data.get('urls', [])
+        """加载保存的 URL 历史"""
+        return self.storage.list_urls()
     
     def load_saved_urls_simple(self) -> List[str]:
         """加载保存的 URL 历史（仅返回URL字符串列表，用于兼容）"""
@@ -120,31 +229,15 @@ class ClashConfigManager:
         return [item['url'] for item in urls_data]
         
     def save_urls(self, urls: List[str]):
-        """保存 URL 到历史记录"""
-        existing_data = self.load_saved_urls()
-        existing_url_map = {item['url']: item for item in existing_data}
-        
-        # 处理新URL
-        for url in urls:
-            if url not in existing_url_map:
-                # 新URL，生成默认别名
-                alias = self.generate_default_alias(url)
-                existing_url_map[url] = {
-                    'url': url,
-                    'alias': alias,
-                    'auto_alias': alias,
-                    'added_at': datetime.now().isoformat()
-                }
-        
-        # 转换回列表
-        all_urls = list(existing_url_map.values())
-        
-        data = {
-            'version': '2.0',
-            'urls': all_urls,
-            'updated': datetime.now().isoformat()
-        }
-        self._write_json_file(self.urls_file, data)
+        """保存 URL 到历史记录（只插入新的 URL）"""
+        added_at = datetime.now().isoformat()
+        items = []
+        for url in self.storage.missing_urls(urls):
+            # 新URL，生成默认别名
+            alias = self.generate_default_alias(url)
+            items.append({'url': url, 'alias': alias, 'auto_alias': alias, 'added_at': added_at})
+        if items:
+            self.storage.add_urls(items)
         
     def delete_url(self, url: str) -> bool:
         """从历史记录中删除指定的URL
@@ -155,21 +248,7 @@ class ClashConfigManager:
         Returns:
             是否删除成功
         """
-        existing_data = self.load_saved_urls()
-        
-        # 找到并删除对应的URL
-        original_length = len(existing_data)
-        existing_data = [item for item in existing_data if item['url'] != url]
-        
-        if len(existing_data) < original_length:
-            data = {
-                'version': '2.0',
-                'urls': existing_data,
-                'updated': datetime.now().isoformat()
-            }
-            self._write_json_file(self.urls_file, data)
-            return True
-        return False
+        return self.storage.delete_url(url)
     
     def update_url_alias(self, url: str, new_alias: str) -> bool:
         """更新URL的别名
@@ -181,52 +260,231 @@ class ClashConfigManager:
         Returns:
             是否更新成功
         """
-        existing_data = self.load_saved_urls()
-        
-        for item in existing_data:
-            if item['url'] == url:
-                item['alias'] = new_alias
-                data = {
-                    'version': '2.0',
-                    'urls': existing_data,
-                    'updated': datetime.now().isoformat()
-                }
-                self._write_json_file(self.urls_file, data)
-                return True
-        return False
+        return self.storage.update_url_alias(url, new_alias)
             
     def test_url_availability(self, url: str) -> Tuple[bool, str]:
-        """测试 URL 是否可用"""
+        """测试 URL 是否可用（超时时间根据该主机的历史耗时确定，结果记录到健康历史）"""
+        timeout = self.health.timeout_for(url, default=5, kinds=(KIND_HEAD,))
+        started = time.perf_counter()
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.head(url, headers=headers, timeout=5, allow_redirects=True)
+            response = self.http.head(url, headers=self.DEFAULT_HEADERS, timeout=timeout, allow_redirects=True)
             if response.status_code < 400:
-                return True, "可用"
+                result = (True, "可用")
             else:
-                return False, f"HTTP {response.status_code}"
+                result = (False, f"HTTP {response.status_code}")
         except requests.exceptions.Timeout:
-            return False, "超时"
+            result = (False, "超时")
         except requests.exceptions.ConnectionError:
-            return False, "连接错误"
+            result = (False, "连接错误")
         except Exception as e:
-            return False, str(e)
+            result = (False, str(e))
             
-    def fetch_and_parse_subscription(self, url: str) -> List[Dict[str, Any]]:
-        """获取并解析订阅内容"""
+        self.health.record(url, KIND_HEAD, time.perf_counter() - started, result[0], result[1])
+        return result
+            
+    def get_http_stats(self) -> Dict[str, Any]:
+        """获取 HTTP 连接池的复用统计"""
+        return self.http.get_stats()
+        
+    def _record_fetch_status(self, url: str, is_available: bool, status_msg: str):
+        """记录最近一次获取订阅的状态，供轻量模式的可用性测试复用"""
+        with self._fetch_status_lock:
+            self._fetch_status[url] = (time.time(), is_available, status_msg)
+            
+    def get_recent_fetch_status(self, url: str, max_age: float = None) -> Optional[Tuple[bool, str]]:
+        """获取最近一次获取订阅的状态
+        
+        Args:
+            url: 订阅 URL
+            max_age: 最大有效时间（秒），默认为 FETCH_STATUS_TTL
+            
+        Returns:
+            (是否可用, 状态信息)，没有有效记录时返回 None
+        """
+        if max_age is None:
+            max_age = self.FETCH_STATUS_TTL
+        with self._fetch_status_lock:
+            record = self._fetch_status.get(url)
+        if record is None or time.time() - record[0] > max_age:
+            return None
+        return record[1], record[2]
+        
+    def _download_subscription(self, url: str, extra_headers: Dict[str, str] = None,
+                               stats: Dict[str, Any] = None) -> Tuple[bool, str, Optional[requests.Response]]:
+        """通过单次 GET 请求下载订阅，并根据响应本身判断可用状态
+        
+        Args:
+            url: 订阅 URL
+            extra_headers: 额外的请求头（如条件请求头）
+            stats: 可选，累计请求耗时（elapsed，秒）并记录内容大小（body_size）
+            
+        Returns:
+            (是否可用, 状态信息, 响应对象)，不可用时响应为 None；
+            服务端返回 304 时视为可用，状态为"未修改"
+        """
+        headers = dict(self.DEFAULT_HEADERS)
+        if extra_headers:
+            headers.update(extra_headers)
+            
+        # 超时时间根据该主机的历史 p95 耗时确定，没有足够历史时为 15 秒
+        timeout = self.health.timeout_for(url, default=15)
+        started = time.perf_counter()
+        response = None
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()
+            response = self.http.get(url, headers=headers, timeout=timeout)
+            if response.status_code == 304:
+                result = (True, "未修改", response)
+            elif response.status_code < 400:
+                result = (True, "可用", response)
+            else:
+                result = (False, f"HTTP {response.status_code}", None)
+        except requests.exceptions.Timeout:
+            result = (False, "超时", None)
+        except requests.exceptions.ConnectionError:
+            result = (False, "连接错误", None)
+        except Exception as e:
+            result = (False, str(e), None)
+            
+        if stats is not None:
+            # 只统计最后一次尝试的耗时：计入重试和退避等待会抬高 p95，进而放大自适应超时
+            if response is not None:
+                started = self.http.attempt_started(response, started)
+            stats['elapsed'] = stats.get('elapsed', 0) + time.perf_counter() - started
+            if result[2] is not None:
+                stats['body_size'] = len(result[2].content)
+                
+        self._record_fetch_status(url, result[0], result[1])
+        return result
+        
+    def _load_subscription(self, url: str, force_refresh: bool = False,
+                           stats: Dict[str, Any] = None) -> Tuple[bool, str, List[Dict[str, Any]], str]:
+        """获取订阅的节点列表，优先使用磁盘缓存
+        
+        Args:
+            url: 订阅 URL
+            force_refresh: 是否忽略缓存强制重新下载
+            stats: 可选，记录网络请求的耗时和内容大小（见 _download_subscription）
             
-            content = response.text
-            return SubscriptionParser.parse_subscription(content)
+        Returns:
+            (是否可用, 状态信息, 节点列表, 缓存状态)，
+            缓存状态为 'hit'（有效期内）、'revalidated'（304）或 'miss'
+        """
+        cache = self.subscription_cache
+        meta = None if force_refresh else cache.get(url)
+        
+        # 有效期内直接使用缓存，不发送请求
+        if meta and cache.is_fresh(meta):
+            proxies = cache.load_proxies(url)
+            if proxies is not None:
+                # 没有访问订阅，不记录可用状态（轻量可用性测试只复用真实请求或 304 重新验证的结果）
+                return True, "可用（缓存）", proxies, 'hit'
+                
+        # 发送条件请求
+        is_available, status_msg, response = self._download_subscription(url, cache.conditional_headers(meta), stats)
+        if not is_available:
+            return False, status_msg, [], 'miss'
+            
+        if response.status_code == 304:
+            proxies = cache.load_proxies(url)
+            if proxies is not None:
+                cache.touch(url)
+                return True, status_msg, proxies, 'revalidated'
+            # 缓存文件丢失，无条件重新下载
+            is_available, status_msg, response = self._download_subscription(url, stats=stats)
+            if not is_available:
+                return False, status_msg, [], 'miss'
+                
+        content = response.text
+        proxies = self.parse_memo.get_or_parse(content, SubscriptionParser.parse_subscription)
+        cache.put(url, content, proxies,
+                  etag=response.headers.get('ETag'),
+                  last_modified=response.headers.get('Last-Modified'))
+        return True, status_msg, proxies, 'miss'
+        
+    def _stream_subscription(self, url: str, node_filter: NodeFilter,
+                             stats: Dict[str, Any] = None) -> Tuple[bool, str, List[Dict[str, Any]], int]:
+        """流式获取订阅：边下载边解析，并在流中完成过滤
+        
+        只保留通过过滤的节点，内存占用与订阅大小无关。流式模式不经过订阅缓存。
+        stats 可选，记录最后一次尝试的耗时（elapsed，秒）和下载的字节数（body_size）。
+        下载中断、解析出错等任何异常都视为不可用，不会抛出。
+        
+        Returns:
+            (是否可用, 状态信息, 过滤后的节点列表, 解析出的节点总数)
+        """
+        timeout = self.health.timeout_for(url, default=15)
+        
+        def counted(chunks):
+            for chunk in chunks:
+                if stats is not None:
+                    stats['body_size'] = stats.get('body_size', 0) + len(chunk)
+                yield chunk
+                
+        started = time.perf_counter()
+        try:
+            with self.http.get(url, headers=self.DEFAULT_HEADERS, timeout=timeout, stream=True) as response:
+                started = self.http.attempt_started(response, started)
+                if response.status_code >= 400:
+                    result = (False, f"HTTP {response.status_code}", [], 0)
+                else:
+                    parse_stats = {}
+                    chunks = counted(response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE))
+                    filtered = list(SubscriptionParser.iter_parse_stream(chunks, node_filter.accept, parse_stats))
+                    result = (True, "可用", filtered, parse_stats.get('total', 0))
+        except requests.exceptions.Timeout:
+            result = (False, "超时", [], 0)
+        except requests.exceptions.ConnectionError:
+            result = (False, "连接错误", [], 0)
+        except requests.exceptions.RequestException as e:
+            result = (False, str(e), [], 0)
         except Exception as e:
-            raise Exception(f"获取订阅失败: {str(e)}")
+            result = (False, f"解析失败: {str(e)}", [], 0)
             
+        if stats is not None:
+            stats['elapsed'] = time.perf_counter() - started
+        self._record_fetch_status(url, result[0], result[1])
+        return result
+        
+    def fetch_and_parse_subscription(self, url: str, force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """获取并解析订阅内容"""
+        is_available, status_msg, proxies, _ = self._load_subscription(url, force_refresh)
+        if not is_available:
+            raise Exception(f"获取订阅失败: {status_msg}")
+        return proxies
+        
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取订阅缓存、解析缓存、节点渲染缓存、测速结果缓存和 DNS 缓存的统计"""
+        return {
+            'subscription_cache': self.subscription_cache.get_stats(),
+            'parse_memo': self.parse_memo.get_stats(),
+            'render_cache': self.proxy_serializer.get_stats(),
+            'latency_cache': self.prober.get_stats(),
+            'dns_cache': self.resolver.get_stats()
+        }
+            
+    def get_health_summary(self, urls: List[str] = None) -> List[Dict[str, Any]]:
+        """获取订阅的健康摘要（最近状态、p95 耗时、当前超时和熔断状态）"""
+        return self.health.get_summary(urls)
+        
+    def get_backend_view(self, proxies: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """解析节点的服务器地址，按后端 IP 分组，找出实际指向同一服务器的节点
+        
+        Returns:
+            {'backends': [{'ip', 'hosts', 'nodes'}], 'unresolved': [...], 'shared': int}
+        """
+        return self.resolver.backend_view(proxies)
+        
+    def compile_filter(self, filter_options: Dict[str, Any]) -> NodeFilter:
+        """编译过滤选项（按配置缓存，相同配置只编译一次）
+        
+        判断节点时会把匹配到的地区写入节点的 _region 字段，自定义关键词匹配的地区为 'custom'；
+        选择 'all' 时不按地区过滤，仅尽量标注地区。
+        
+        Raises:
+            ValueError: 正则表达式或端口范围无效
+        """
+        return compile_node_filter(filter_options, self.REGION_KEYWORDS)
+        
     def filter_proxies(self, proxies: List[Dict[str, Any]], filter_options: Dict[str, Any]) -> List[Dict[str, Any]]:
         """根据过滤选项过滤代理节点
         
@@ -235,39 +493,36 @@ class ClashConfigManager:
             filter_options: 过滤选项，可包含：
                 - regions: List[str] - 地区列表，如 ['hk', 'tw']，'all' 表示所有
                 - keywords: List[str] - 自定义关键词列表
+                - include_regex / exclude_regex: str - 名称包含/排除正则
+                - types: List[str] - 协议类型
+                - ports: str - 端口或端口范围，如 "443,8000-9000"
+                - tls_required: bool - 只保留启用 TLS 的节点
+                - max_per_region: int - 每个地区最多保留的节点数
+                - resolve_regions: bool - 名称中没有地区的节点使用同一后端 IP 上其他节点的地区
+                
+        Returns:
+            过滤后的节点列表，每个节点的 _region 字段为其匹配的地区
         """
-        regions = filter_options.get('regions', [])
-        keywords = filter_options.get('keywords', [])
+        node_filter = self.compile_filter(filter_options)
+        filtered = self._resolve_regions([proxy for proxy in proxies if node_filter.accept(proxy)], node_filter)
+        limiter = node_filter.new_limiter()
+        return [proxy for proxy in filtered if limiter(proxy)] if limiter is not None else filtered
         
-        # 如果选择了 'all'，返回所有节点
-        if 'all' in regions:
+    def _resolve_regions(self, proxies: List[Dict[str, Any]], node_filter: NodeFilter) -> List[Dict[str, Any]]:
+        """启用 resolve_regions 时解析节点的服务器地址，为名称中没有地区的节点按后端推断地区"""
+        if not node_filter.resolve_regions or not proxies:
             return proxies
-            
-        filtered_nodes = []
-        
-        # 收集所有需要匹配的关键词
-        all_keywords = []
+        return node_filter.apply_backend_regions(proxies, self.resolver.resolve_backends(proxies))
         
-        # 添加地区关键词
-        for region in regions:
-            if region in self.REGION_KEYWORDS:
-                all_keywords.extend(self.REGION_KEYWORDS[region])
-                
-        # 添加自定义关键词
-        all_keywords.extend(keywords)
-        
-        # 如果没有任何关键词，返回空列表
-        if not all_keywords:
-            return []
-            
-        # 过滤节点
+    @staticmethod
+    def _count_regions(proxies: List[Dict[str, Any]]) -> Dict[str, int]:
+        """统计各地区的节点数量"""
+        counts = {}
         for proxy in proxies:
-            if isinstance(proxy, dict) and 'name' in proxy:
-                name = proxy['name'].lower()
-                if any(kw.lower() in name for kw in all_keywords):
-                    filtered_nodes.append(proxy)
-                    
-        return filtered_nodes
+            region = proxy.get('_region')
+            if region:
+                counts[region] = counts.get(region, 0) + 1
+        return counts
         
     def load_chained_proxy_config(self) -> Dict[str, Any]:
         """加载链式代理配置"""
@@ -277,14 +532,18 @@ class ClashConfigManager:
             'custom_nodes': [],  # 用户手动添加的节点
             'chained_nodes': {},  # {node_id: dialer_proxy_name} 映射
         }
-        return self._read_json_file(self.chained_config_file, default_config)
+        return self.storage.load_chained_config() or default_config
         
     def save_chained_proxy_config(self, config: Dict[str, Any]):
         """保存链式代理配置"""
         # 清理无效的引用
         config = self._clean_chained_config(config)
+        # 记录获取到但未选中的节点，定时任务据此排除它们
+        selected_ids = set(config.get('selected_proxy_ids', []))
+        config['deselected_proxy_ids'] = [proxy['_id'] for proxy in config.get('all_proxies', [])
+                                          if '_id' in proxy and proxy['_id'] not in selected_ids]
         config['updated'] = datetime.now().isoformat()
-        self._write_json_file(self.chained_config_file, config)
+        self.storage.save_chained_config(config)
             
     def apply_dialer_proxy_config(self, nodes: List[Dict[str, Any]], chained_config: Dict[str, str]) -> List[Dict[str, Any]]:
         """为节点应用 dialer-proxy 配置
@@ -348,81 +607,6 @@ class ClashConfigManager:
         
         return config
         
-    def _format_yaml_value(self, key: str, value: Any) -> Optional[str]:
-        """格式化 YAML 值"""
-        if value is None:
-            return None
-            
-        if isinstance(value, str):
-            # 字符串值需要引号
-            if any(char in value for char in [':', '{', '}', '"', '\n', '#']):
-                # 对包含特殊字符的字符串使用双引号
-                escaped_value = value.replace('\\', '\\\\').replace('"', '\\"')
-                return f'{key}: "{escaped_value}"'
-            else:
-                return f'{key}: "{value}"'
-        elif isinstance(value, bool):
-            # 布尔值转换为小写
-            return f'{key}: {str(value).lower()}'
-        elif isinstance(value, (int, float)):
-            # 数字直接转换
-            return f'{key}: {value}'
-        elif isinstance(value, list):
-            # 列表转换为 YAML 数组格式
-            return f'{key}: [{", ".join(str(item) for item in value)}]'
-        elif isinstance(value, dict):
-            # 字典转换为内联格式
-            dict_items = []
-            for k, v in value.items():
-                if isinstance(v, str):
-                    dict_items.append(f'{k}: "{v}"')
-                else:
-                    dict_items.append(f'{k}: {v}')
-            return f'{key}: {{ {", ".join(dict_items)} }}'
-        else:
-            # 其他类型尝试直接转换
-            return f'{key}: {value}'
-            
-    def _escape_for_yaml_regex(self, name: str) -> str:
-        """为 YAML 中的正则表达式智能转义节点名称
-        
-        Args:
-            name: 节点名称
-            
-        Returns:
-            转义后的名称，适用于 YAML 双引号字符串中的正则表达式
-        """
-        # 定义需要在正则表达式中转义的特殊字符
-        # 注意：这里只包含真正需要转义的字符
-        regex_special_chars = {
-            '.': True,  # 匹配任意字符
-            '^': True,  # 行首
-            '$': True,  # 行尾
-            '*': True,  # 零次或多次
-            '+': True,  # 一次或多次
-            '?': True,  # 零次或一次
-            '{': True,  # 量词开始
-            '}': True,  # 量词结束
-            '[': True,  # 字符类开始
-            ']': True,  # 字符类结束
-            '(': True,  # 分组开始
-            ')': True,  # 分组结束
-            '|': True,  # 或操作
-            '\\': True, # 反斜杠本身
-            # 注意：- 在字符类外部不是特殊字符，不需要转义
-        }
-        
-        escaped = ""
-        for char in name:
-            if char in regex_special_chars:
-                # 在 YAML 双引号字符串中，反斜杠需要双重转义
-                escaped += "\\\\" + char
-            else:
-                # 普通字符直接添加，不需要转义
-                escaped += char
-        
-        return escaped
-        
     def merge_proxies_to_template(self, proxies: List[Dict[str, Any]], chained_config: Dict[str, str] = None) -> str:
         """将代理节点合并到模板中
         
@@ -430,103 +614,51 @@ class ClashConfigManager:
             proxies: 代理节点列表
             chained_config: 链式代理配置，用于生成 exclude-filter
         """
-        # 读取模板文件
-        with open(self.template_file, 'r', encoding='utf-8') as f:
-            template_lines = f.readlines()
+        # 读取编译后的模板（文件未修改时使用缓存）
+        template = load_template(self.template_file)
             
-        # 生成代理节点的 YAML 格式
-        proxy_yaml_lines = []
-        for proxy in proxies:
-            # 使用 flow style 生成紧凑的节点格式
-            items = []
-            
-            # 定义字段顺序（重要字段优先）
-            field_order = ['name', 'type', 'server', 'port', 'ports', 'mport',
-                          'password', 'cipher', 'uuid', 'alterId', 'udp',
-                          'skip-cert-verify', 'sni', 'dialer-proxy']
-            
-            # 首先按照定义的顺序添加字段
-            for key in field_order:
-                if key in proxy and not key.startswith('_'):
-                    value = proxy[key]
-                    formatted_value = self._format_yaml_value(key, value)
-                    if formatted_value:
-                        items.append(formatted_value)
-            
-            # 然后添加其他未在顺序中定义的字段
-            for key, value in proxy.items():
-                if key not in field_order and not key.startswith('_'):
-                    formatted_value = self._format_yaml_value(key, value)
-                    if formatted_value:
-                        items.append(formatted_value)
-            
-            # 构建节点行
-            proxy_line = '  - { ' + ', '.join(items) + ' }'
-            proxy_yaml_lines.append(proxy_line)
+        # 生成代理节点的 YAML 格式（flow style，未变化的节点复用缓存的行）
+        proxy_yaml_lines = self.proxy_serializer.render_all(proxies)
             
         # 如果有链式代理配置，收集需要排除的节点名称
         exclude_names = []
         if chained_config:
             for proxy in proxies:
                 if proxy.get('_id') in chained_config and 'dialer-proxy' in proxy:
-                    # 对节点名称进行智能转义
-                    name = proxy.get('name', '')
-                    # 使用智能转义，避免YAML解析错误
-                    escaped_name = self._escape_for_yaml_regex(name)
-                    exclude_names.append(escaped_name)
-        
-        # 查找需要插入节点的位置
-        result_lines = []
-        i = 0
-        proxies_added = False
-        
-        while i < len(template_lines):
-            line = template_lines[i]
-            
-            # 检查是否是 exclude-filter 行
-            if 'exclude-filter:' in line and exclude_names:
-                # 生成新的 exclude-filter 行
-                exclude_pattern = '|'.join(exclude_names)
-                # 保持原有的缩进
-                indent = line[:len(line) - len(line.lstrip())]
-                new_line = f'{indent}exclude-filter: "{exclude_pattern}"\n'
-                result_lines.append(new_line)
-                # 调试信息
-                print(f"[DEBUG] Generated exclude-filter: {new_line.strip()}")
+                    exclude_names.append(proxy.get('name', ''))
+        
+        values = {SLOT_PROXIES: ''.join(line + '\n' for line in proxy_yaml_lines)}
+        if exclude_names:
+            # 按前缀树压缩的正则，再转为 YAML 双引号字符串
+            exclude_pattern = build_name_regex(exclude_names)
+            values[SLOT_EXCLUDE_FILTER] = quote_string(exclude_pattern)
+            # 调试信息
+            print(f"[DEBUG] Generated exclude-filter: {values[SLOT_EXCLUDE_FILTER]}")
+            
+        return template.render(values)
+        
+    def _read_legacy_gist_file(self) -> Dict[str, str]:
+        """读取旧版本的 .gist_id 文件（单行 gist_id 或每行 名称:gist_id）"""
+        configs = {}
+        try:
+            with open(self.gist_id_file, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+                
+            # 处理旧格式（单行 gist_id）
+            if len(lines) == 1 and ':' not in lines[0]:
+                gist_id = lines[0].strip()
+                if gist_id:
+                    configs['默认'] = gist_id
             else:
-                result_lines.append(line)
-            
-            # 检查是否是 proxies: 行
-            if line.strip() == 'proxies:' and not proxies_added:
-                # 检查下一行是否有 # 添加处 注释
-                if i + 1 < len(template_lines) and '# 添加处' in template_lines[i + 1]:
-                    # 保留注释行
-                    i += 1
-                    result_lines.append(template_lines[i])
-                    
-                    # 添加新的代理节点
-                    for proxy_line in proxy_yaml_lines:
-                        result_lines.append(proxy_line + '\n')
-                    
-                    # 标记已添加，避免在其他 proxies: 处重复添加
-                    proxies_added = True
-                    
-                    # 跳过原有的代理节点（如果有）
-                    i += 1
-                    while i < len(template_lines):
-                        current_line = template_lines[i]
-                        # 如果遇到非缩进行（新的顶层配置项）或空行，停止跳过
-                        if current_line.strip() and not current_line.startswith(' '):
-                            i -= 1  # 回退一行，让外层循环处理这一行
-                            break
-                        if not current_line.strip():  # 空行
-                            i -= 1  # 回退一行，让外层循环处理这一行
-                            break
-                        i += 1
-            
-            i += 1
-            
-        return ''.join(result_lines)
+                # 新格式（名称:gist_id）
+                for line in lines:
+                    line = line.strip()
+                    if line and ':' in line:
+                        name, gist_id = line.split(':', 1)
+                        configs[name.strip()] = gist_id.strip()
+        except Exception as e:
+            print(f"加载 Gist 配置失败: {e}")
+        return configs
         
     def load_gist_configs(self) -> Dict[str, str]:
         """加载所有 Gist 配置
@@ -534,50 +666,15 @@ class ClashConfigManager:
         Returns:
             {name: gist_id} 字典
         """
-        if self._gist_configs is not None:
-            return self._gist_configs
-            
-        configs = {}
-        
-        if os.path.exists(self.gist_id_file):
-            try:
-                with open(self.gist_id_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    
-                # 处理旧格式（单行 gist_id）
-                if len(lines) == 1 and ':' not in lines[0]:
-                    gist_id = lines[0].strip()
-                    if gist_id:
-                        configs['默认'] = gist_id
-                        # 自动转换为新格式
-                        self.save_gist_configs(configs)
-                else:
-                    # 新格式（名称:gist_id）
-                    for line in lines:
-                        line = line.strip()
-                        if line and ':' in line:
-                            name, gist_id = line.split(':', 1)
-                            configs[name.strip()] = gist_id.strip()
-            except Exception as e:
-                print(f"加载 Gist 配置失败: {e}")
-                
-        self._gist_configs = configs
-        return configs
+        return self.storage.list_gists()
         
     def save_gist_configs(self, configs: Dict[str, str]):
-        """保存 Gist 配置
+        """保存 Gist 配置（整体替换）
         
         Args:
             configs: {name: gist_id} 字典
         """
-        lines = []
-        for name, gist_id in configs.items():
-            lines.append(f"{name}:{gist_id}\n")
-            
-        with open(self.gist_id_file, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
-            
-        self._gist_configs = configs
+        self.storage.replace_gists(configs)
         
     def get_gist_id(self, name: str = None) -> Optional[str]:
         """根据名称获取 Gist ID
@@ -612,9 +709,7 @@ class ClashConfigManager:
             name: Gist 名称
             gist_id: Gist ID
         """
-        configs = self.load_gist_configs()
-        configs[name] = gist_id
-        self.save_gist_configs(configs)
+        self.storage.set_gist(name, gist_id)
         
     def remove_gist_config(self, name: str) -> bool:
         """删除 Gist 配置
@@ -625,12 +720,7 @@ class ClashConfigManager:
         Returns:
             是否删除成功
         """
-        configs = self.load_gist_configs()
-        if name in configs:
-            del configs[name]
-            self.save_gist_configs(configs)
-            return True
-        return False
+        return self.storage.delete_gist(name)
         
     def update_gist_name(self, old_name: str, new_name: str) -> bool:
         """重命名 Gist
@@ -642,20 +732,80 @@ class ClashConfigManager:
         Returns:
             是否重命名成功
         """
-        configs = self.load_gist_configs()
-        if old_name in configs and new_name not in configs:
-            configs[new_name] = configs[old_name]
-            del configs[old_name]
-            self.save_gist_configs(configs)
-            return True
-        return False
+        return self.storage.rename_gist(old_name, new_name)
         
-    def upload_to_gist(self, content: str, github_token: str, reuse_gist: bool = False, gist_name: str = None) -> tuple:
-        """上传内容到 GitHub Gist"""
+    @staticmethod
+    def _content_digest(content: str) -> str:
+        """计算配置内容的摘要"""
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+        
+    @staticmethod
+    def _permanent_raw_url(raw_url: str) -> str:
+        """从 raw_url 中去掉 commit SHA，构建永久链接
+        
+        原始: .../raw/commit_sha/filename
+        永久: .../raw/filename
+        """
+        parts = raw_url.split('/raw/')
+        if len(parts) == 2:
+            base_url = parts[0]
+            filename = parts[1].split('/')[-1]  # 获取文件名
+            return f"{base_url}/raw/{filename}"
+        return raw_url
+        
+    def _load_gist_digest(self, gist_id: str) -> Optional[Dict[str, Any]]:
+        """获取某个 Gist 上次上传内容的摘要记录"""
+        return self.storage.get_gist_digest(gist_id)
+            
+    def _save_gist_digest(self, gist_id: str, gist_name: str, digest: str, raw_url: str):
+        """记录某个 Gist 当前内容的摘要"""
+        self.storage.set_gist_digest(gist_id, gist_name, digest, raw_url)
+            
+    def _fetch_remote_gist_content(self, gist_id: str, headers: Dict[str, str]) -> Tuple[Optional[str], Optional[str]]:
+        """读取 Gist 中配置文件的当前内容
+        
+        Returns:
+            (文件内容, raw_url)，文件不存在时均为 None
+        """
+        response = self.http.get(f'https://api.github.com/gists/{gist_id}', headers=headers, timeout=30)
+        response.raise_for_status()
+        file_info = response.json().get('files', {}).get('clash_config.yaml')
+        if not file_info:
+            return None, None
+            
+        content = file_info.get('content')
+        # 超过 1MB 的文件内容会被截断，需要从 raw_url 读取完整内容
+        if file_info.get('truncated') or content is None:
+            raw_response = self.http.get(file_info['raw_url'], timeout=30)
+            raw_response.raise_for_status()
+            content = raw_response.text
+        return content, file_info.get('raw_url')
+        
+    def publish_to_gist(self, content: str, github_token: str, reuse_gist: bool = False,
+                        gist_name: str = None, verify_remote: bool = None) -> Dict[str, Any]:
+        """上传内容到 GitHub Gist，内容未变化时跳过更新
+        
+        重用 Gist 时，先与本地记录的上次上传内容摘要比较，一致则不发送 PATCH；
+        开启 verify_remote 时，摘要不一致还会读取远程文件当前内容再比较一次。
+        
+        Args:
+            content: 配置内容
+            github_token: GitHub Token
+            reuse_gist: 是否重用 Gist
+            gist_name: Gist 名称
+            verify_remote: 是否比较远程内容，默认读取环境变量 GIST_VERIFY_REMOTE
+            
+        Returns:
+            {'raw_url', 'gist_name', 'skipped', 'reason'}
+        """
+        if verify_remote is None:
+            verify_remote = os.getenv('GIST_VERIFY_REMOTE', 'false').lower() == 'true'
+            
         headers = {
             'Authorization': f'token {github_token}',
             'Accept': 'application/vnd.github.v3+json'
         }
+        digest = self._content_digest(content)
         
         # 检查是否需要重用 Gist
         gist_id = None
@@ -664,6 +814,21 @@ class ClashConfigManager:
                 
         try:
             if gist_id and reuse_gist:
+                # 与上次上传的内容比较
+                record = self._load_gist_digest(gist_id)
+                if record and record.get('digest') == digest and record.get('raw_url'):
+                    return {'raw_url': record['raw_url'], 'gist_name': gist_name,
+                            'skipped': True, 'reason': '内容与上次上传一致'}
+                    
+                # 与远程文件的当前内容比较
+                if verify_remote:
+                    remote_content, remote_raw_url = self._fetch_remote_gist_content(gist_id, headers)
+                    if remote_content is not None and self._content_digest(remote_content) == digest:
+                        raw_url = self._permanent_raw_url(remote_raw_url)
+                        self._save_gist_digest(gist_id, gist_name, digest, raw_url)
+                        return {'raw_url': raw_url, 'gist_name': gist_name,
+                                'skipped': True, 'reason': '内容与远程文件一致'}
+                        
                 # 更新现有 Gist
                 data = {
                     'description': f'Clash Config - Updated {datetime.now().strftime("%Y%m%d_%H%M%S")}',
@@ -674,7 +839,7 @@ class ClashConfigManager:
                     }
                 }
                 
-                response = requests.patch(
+                response = self.http.patch(
                     f'https://api.github.com/gists/{gist_id}',
                     headers=headers,
                     json=data,
@@ -693,7 +858,7 @@ class ClashConfigManager:
                     }
                 }
                 
-                response = requests.post(
+                response = self.http.post(
                     'https://api.github.com/gists',
                     headers=headers,
                     json=data,
@@ -702,7 +867,7 @@ class ClashConfigManager:
                 response.raise_for_status()
                 
                 # 保存新创建的 Gist ID
-                new_gist_id = response.json()['id']
+                gist_id = response.json()['id']
                 
                 # 确定 Gist 名称
                 if not gist_name:
@@ -710,71 +875,392 @@ class ClashConfigManager:
                     gist_name = f"Clash配置_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                 
                 # 添加到配置中
-                self.add_gist_config(gist_name, new_gist_id)
+                self.add_gist_config(gist_name, gist_id)
             
             gist_data = response.json()
             raw_url = gist_data['files']['clash_config.yaml']['raw_url']
             
+            # 记录当前内容的摘要（使用永久链接，下次跳过时直接返回）
+            self._save_gist_digest(gist_id, gist_name, digest, self._permanent_raw_url(raw_url))
+            
             # 如果启用了重用，返回永久链接（去掉 commit SHA）
             if reuse_gist:
-                # 从 raw_url 中提取必要部分，构建永久链接
-                # 原始: .../raw/commit_sha/filename
-                # 永久: .../raw/filename
-                parts = raw_url.split('/raw/')
-                if len(parts) == 2:
-                    base_url = parts[0]
-                    filename = parts[1].split('/')[-1]  # 获取文件名
-                    raw_url = f"{base_url}/raw/{filename}"
-            
-            return raw_url, gist_name
+                raw_url = self._permanent_raw_url(raw_url)
+            
+            return {'raw_url': raw_url, 'gist_name': gist_name, 'skipped': False, 'reason': ''}
         except Exception as e:
             raise Exception(f"上传 Gist 失败: {str(e)}")
             
-    def fetch_proxies_from_urls(self, urls: List[str], filter_options: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """从 URL 列表获取并过滤代理节点
+    def upload_to_gist(self, content: str, github_token: str, reuse_gist: bool = False, gist_name: str = None) -> tuple:
+        """上传内容到 GitHub Gist
+        
+        Returns:
+            (raw_url, gist_name)
+        """
+        result = self.publish_to_gist(content, github_token, reuse_gist, gist_name)
+        return result['raw_url'], result['gist_name']
+            
+    def _get_host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        """获取 URL 所属主机的并发信号量，限制对同一主机的同时请求数"""
+        host = urlparse(url).netloc.lower()
+        with self._host_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_semaphores[host] = semaphore
+        return semaphore
+        
+    def _fetch_single_subscription(self, url: str, node_filter: NodeFilter, force_refresh: bool = False,
+                                   streaming: bool = False,
+                                   use_circuit_breaker: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """获取单个订阅并过滤节点（在线程池中执行）
+        
+        每地区数量限制不在这里应用，由调用方在跨订阅去重和测速之后统一应用。
+        use_circuit_breaker 为 True 时（定时任务等后台获取）熔断中的订阅不发送请求。
+        
+        Returns:
+            (过滤后的节点列表, 该订阅的详情记录)
+        """
+        detail = {'url': url, 'status': '', 'total_nodes': 0, 'filtered_nodes': 0, 'cache': 'miss'}
+        filtered = []
+        
+        # 后台获取时，连续失败的订阅处于熔断期不发送请求，有缓存时使用缓存；
+        # 用户发起的获取和强制刷新总是发送请求，成功后熔断随之解除
+        if use_circuit_breaker and not force_refresh:
+            circuit = self.health.circuit_state(url)
+            if circuit['open']:
+                retry_in = int(circuit['retry_at'] - time.time())
+                detail['status'] = f"已熔断（连续失败 {circuit['failure_streak']} 次，{retry_in} 秒后重试）"
+                detail['cache'] = 'circuit_open'
+                proxies = self.subscription_cache.load_proxies(url)
+                if proxies:
+                    detail['status'] += '，使用缓存'
+                    detail['total_nodes'] = len(proxies)
+                    filtered = self._resolve_regions(
+                        [proxy for proxy in proxies if node_filter.accept(proxy)], node_filter)
+                    detail['filtered_nodes'] = len(filtered)
+                    detail['regions'] = self._count_regions(filtered)
+                return filtered, detail
+        
+        stats = {}
+        try:
+            if streaming:
+                with self._get_host_semaphore(url):
+                    # 流式模式：下载、解析和过滤在同一个流中完成
+                    is_available, status_msg, filtered, total = self._stream_subscription(url, node_filter, stats)
+                    self.health.record(url, KIND_STREAM, stats.get('elapsed'), is_available, status_msg,
+                                       stats.get('body_size'), total if is_available else None)
+                    
+                filtered = self._resolve_regions(filtered, node_filter)
+                detail['status'] = status_msg
+                detail['cache'] = 'stream'
+                detail['total_nodes'] = total
+                detail['filtered_nodes'] = len(filtered)
+                detail['regions'] = self._count_regions(filtered)
+                return filtered, detail
+                
+            with self._get_host_semaphore(url):
+                # 单次（条件）GET 请求，同时得出可用状态
+                try:
+                    is_available, status_msg, proxies, cache_state = self._load_subscription(url, force_refresh, stats)
+                except Exception as e:
+                    # 下载后解析出错同样是一次失败，需要计入健康历史和熔断
+                    is_available, status_msg, proxies, cache_state = False, f"解析失败: {str(e)}", [], 'miss'
+                    self._record_fetch_status(url, False, status_msg)
+                
+            # 有网络请求时记录健康历史（有效期内的缓存命中不记录）
+            if 'elapsed' in stats:
+                self.health.record(url, KIND_GET, stats['elapsed'], is_available, status_msg,
+                                   stats.get('body_size'), len(proxies) if is_available else None)
+                
+            detail['status'] = status_msg
+            detail['cache'] = cache_state
+            if is_available:
+                detail['total_nodes'] = len(proxies)
+                
+                # 过滤节点
+                # 每地区数量限制在去重和测速之后统一应用，这里只判断过滤规则
+                filtered = self._resolve_regions(
+                    [proxy for proxy in proxies if node_filter.accept(proxy)], node_filter)
+                detail['filtered_nodes'] = len(filtered)
+                detail['regions'] = self._count_regions(filtered)
+        except Exception as e:
+            detail['status'] = f"解析失败: {str(e)}"
+            
+        return filtered, detail
+        
+    def fetch_proxies_with_details(self, urls: List[str], filter_options: Dict[str, Any] = None,
+                                   force_refresh: bool = False,
+                                   streaming: bool = False,
+                                   dedupe_options: Dict[str, Any] = None,
+                                   use_circuit_breaker: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """并发地从 URL 列表获取并过滤代理节点
         
         Args:
             urls: 订阅 URL 列表
             filter_options: 过滤选项
+            force_refresh: 是否忽略订阅缓存强制重新下载
+            streaming: 是否使用流式解析（适合节点数量巨大的订阅，不经过缓存）
+            dedupe_options: 跨订阅去重选项（只丢弃其他订阅中已出现的节点，同一订阅内的节点全部保留），可包含：
+                - policy: str - 'first'（默认）、'prefer'、'merge_names' 或 'none'
+                - preferred_sources: List[str] - prefer 策略下优先保留的订阅 URL
+                - resolve: bool - 解析服务器地址，指向同一后端 IP 的不同域名视为同一服务器
+            use_circuit_breaker: 是否跳过熔断中的订阅（后台获取使用，用户发起的获取总是发送请求）
             
         Returns:
-            过滤后的代理节点列表
+            (过滤后的代理节点列表, 每个订阅的详情记录列表)，均按输入 URL 的顺序排列
+            
+        Raises:
+            ValueError: 去重选项无效（在获取订阅之前检查）
         """
         if filter_options is None:
             filter_options = {'regions': ['hk']}  # 默认过滤香港节点
+        dedupe_options = parse_dedupe_options(dedupe_options)
+            
+        # 过滤规则只编译一次，在每个订阅的解析过程中直接使用
+        node_filter = self.compile_filter(filter_options)
             
         # 保存 URL 到历史
         self.save_urls(urls)
         
+        if not urls:
+            return [], []
+            
+        # 使用有界线程池并发获取，按历史耗时从慢到快提交，结果仍按输入顺序排列
+        workers = max(1, min(self.max_workers, len(urls)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                index: executor.submit(self._fetch_single_subscription, urls[index], node_filter,
+                                       force_refresh, streaming, use_circuit_breaker)
+                for index in self.health.order_slowest_first(urls)
+            }
+            results = [futures[index].result() for index in range(len(urls))]
+            
+        # 跨订阅去重（按服务器、端口、协议和凭据识别同一节点）
+        backends = None
+        if dedupe_options['resolve'] and dedupe_options['policy'] != DEDUPE_NONE:
+            backends = self.resolver.resolve_backends(proxy for filtered, _ in results for proxy in filtered)
+        deduped, dropped = dedupe_sources(
+            [filtered for filtered, _ in results],
+            policy=dedupe_options['policy'],
+            source_ids=urls,
+            preferred_sources=dedupe_options['preferred_sources'],
+            backends=backends
+        )
+        
         all_proxies = []
         details = []
+        for url, filtered, (_, detail), duplicates in zip(urls, deduped, results, dropped):
+            for proxy in filtered:
+                proxy['_source'] = url  # 记录节点来源订阅
+            self._assign_source_ids(filtered, url, dedupe_options['policy'])
+            all_proxies.extend(filtered)
+            detail['duplicates_dropped'] = duplicates
+            details.append(detail)
+            
+        # 按延迟筛选，每个地区内按延迟从低到高排序
+        if node_filter.latency_enabled:
+            all_proxies = self.prober.select_fastest(
+                all_proxies, node_filter.latency_top_n, node_filter.max_latency)
+            
+        # 每地区数量限制跨订阅生效，按输入顺序（测速后按延迟顺序）保留
+        limiter = node_filter.new_limiter()
+        if limiter is not None:
+            all_proxies = [proxy for proxy in all_proxies if limiter(proxy)]
+            
+        return all_proxies, details
         
-        for url in urls:
-            detail = {'url': url, 'status': '', 'total_nodes': 0, 'filtered_nodes': 0}
+    @staticmethod
+    def _assign_source_ids(proxies: List[Dict[str, Any]], url: str, policy: str):
+        """为一个订阅去重后的节点生成稳定的 ID，刷新后已保存的链式代理和选中状态仍然有效
+        
+        在测速排序和数量限制之前按订阅分别分配，批量获取和流式获取得到相同的 ID。
+        去重后不同订阅的节点身份互不相同；不去重时 ID 中包含订阅摘要以保持唯一。
+        """
+        assign_node_ids(proxies, 'proxy', source=url if policy == DEDUPE_NONE else None)
+        
+    def fetch_proxies_from_urls(self, urls: List[str], filter_options: Dict[str, Any] = None,
+                                force_refresh: bool = False,
+                                use_circuit_breaker: bool = False) -> List[Dict[str, Any]]:
+        """从 URL 列表获取并过滤代理节点
+        
+        Args:
+            urls: 订阅 URL 列表
+            filter_options: 过滤选项
+            force_refresh: 是否忽略订阅缓存强制重新下载
+            use_circuit_breaker: 是否跳过熔断中的订阅
             
-            # 测试 URL 可用性
-            is_available, status_msg = self.test_url_availability(url)
-            detail['status'] = status_msg
+        Returns:
+            过滤后的代理节点列表
+        """
+        proxies, _ = self.fetch_proxies_with_details(urls, filter_options, force_refresh,
+                                                     use_circuit_breaker=use_circuit_breaker)
+        return proxies
+        
+    def iter_fetch_proxies(self, urls: List[str], filter_options: Dict[str, Any] = None,
+                           force_refresh: bool = False, streaming: bool = False,
+                           dedupe_options: Dict[str, Any] = None,
+                           use_circuit_breaker: bool = False) -> Iterator[Dict[str, Any]]:
+        """并发获取订阅，每个订阅完成后立即产出其结果
+        
+        结果按完成顺序产出，首个节点的等待时间只取决于最快的订阅。
+        去重按到达顺序保留先到订阅中的节点（prefer 和 merge_names 策略需要全部结果，此处按 first 处理），
+        每地区数量限制同样按到达顺序生效。启用测速时每个订阅的节点先测速并按延迟排序，
+        每地区保留最快 N 个的限制也按到达顺序累计，因此不保证是全部订阅中最快的 N 个。
+        节点 ID 与到达顺序无关，与 fetch_proxies_with_details 为同一节点生成的 ID 相同。
+        
+        Yields:
+            {'index': URL 在输入中的序号, 'detail': 详情记录, 'proxies': 该订阅的节点}
+        """
+        if filter_options is None:
+            filter_options = {'regions': ['hk']}  # 默认过滤香港节点
+        # 去重选项在提交任何请求之前检查
+        dedupe_options = parse_dedupe_options(dedupe_options)
+        policy = dedupe_options['policy']
+        node_filter = self.compile_filter(filter_options)
+        
+        # 保存 URL 到历史
+        self.save_urls(urls)
+        
+        if not urls:
+            return
             
-            if is_available:
-                try:
-                    proxies = self.fetch_and_parse_subscription(url)
-                    detail['total_nodes'] = len(proxies)
-                    
-                    # 过滤节点
-                    filtered = self.filter_proxies(proxies, filter_options)
-                    all_proxies.extend(filtered)
-                    detail['filtered_nodes'] = len(filtered)
-                except Exception as e:
-                    detail['status'] = f"解析失败: {str(e)}"
+        limiter = node_filter.new_limiter()
+        latency_limiter = node_filter.new_limiter(node_filter.latency_top_n) if node_filter.latency_top_n else None
+        seen_fingerprints = set()
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(urls))))
+        futures = {}
+        try:
+            # 按历史耗时从慢到快提交
+            futures = {
+                executor.submit(self._fetch_single_subscription, urls[index], node_filter,
+                                force_refresh, streaming, use_circuit_breaker): (index, urls[index])
+                for index in self.health.order_slowest_first(urls)
+            }
+            for future in as_completed(futures):
+                index, url = futures[future]
+                filtered, detail = future.result()
+                
+                kept = []
+                duplicates = 0
+                if policy != DEDUPE_NONE:
+                    # 只丢弃先到订阅中已出现的节点，同一订阅内的节点全部保留；
+                    # 解析服务器地址时每个后端地址一个指纹，与先到的节点共享任意地址即视为重复
+                    backends = self.resolver.resolve_backends(filtered) if dedupe_options['resolve'] else None
+                    fingerprints = [backend_fingerprints(proxy, backends) for proxy in filtered]
+                    unique = [proxy for proxy, prints in zip(filtered, fingerprints)
+                              if seen_fingerprints.isdisjoint(prints)]
+                    duplicates = len(filtered) - len(unique)
+                    for prints in fingerprints:
+                        seen_fingerprints.update(prints)
+                    filtered = unique
+                for proxy in filtered:
+                    proxy['_source'] = url
+                self._assign_source_ids(filtered, url, policy)
+                if node_filter.latency_enabled:
+                    filtered = self.prober.select_fastest(filtered, max_latency=node_filter.max_latency)
+                for proxy in filtered:
+                    if latency_limiter is not None and not latency_limiter(proxy):
+                        continue
+                    if limiter is not None and not limiter(proxy):
+                        continue
+                    kept.append(proxy)
                     
-            details.append(detail)
+                detail['duplicates_dropped'] = duplicates
+                yield {'index': index, 'detail': detail, 'proxies': kept}
+        finally:
+            # 客户端提前断开时不再等待剩余的订阅
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
             
-        # 为每个节点添加唯一 ID，方便前端追踪
-        for i, proxy in enumerate(all_proxies):
-            proxy['_id'] = f"proxy_{i}"
+    def fetch_proxies_incremental(self, urls: List[str], filter_options: Dict[str, Any] = None,
+                                  snapshot_versions: Dict[str, str] = None,
+                                  **fetch_kwargs) -> Dict[str, Any]:
+        """增量获取：只返回相对客户端快照新增、删除和变化的节点
+        
+        Args:
+            urls: 订阅 URL 列表
+            filter_options: 过滤选项
+            snapshot_versions: 客户端持有的快照版本 {url: version}
+            **fetch_kwargs: 传给 fetch_proxies_with_details 的其他参数
+            
+        Returns:
+            包含 snapshots（新版本）、reset_sources（需要整体替换的订阅）、
+            added、changed、removed（节点 ID）和 details 的字典
+        """
+        snapshot_versions = snapshot_versions or {}
+        proxies, details = self.fetch_proxies_with_details(urls, filter_options, **fetch_kwargs)
+        
+        # 过滤和去重选项不同时，快照互不影响
+        options_key = json.dumps([filter_options, fetch_kwargs.get('dedupe_options')],
+                                 sort_keys=True, ensure_ascii=False)
+        
+        by_source = {url: [] for url in urls}
+        for proxy in proxies:
+            by_source.setdefault(proxy.get('_source'), []).append(proxy)
+            
+        result = {'snapshots': {}, 'reset_sources': [], 'added': [], 'changed': [], 'removed': [],
+                  'total': len(proxies), 'details': details}
+        for url in urls:
+            diff = self.snapshots.diff(url, options_key, by_source[url], snapshot_versions.get(url))
+            result['snapshots'][url] = diff['version']
+            if diff['reset']:
+                result['reset_sources'].append(url)
+            result['added'].extend(diff['added'])
+            result['changed'].extend(diff['changed'])
+            result['removed'].extend(diff['removed'])
             
-        return all_proxies
+        return result
+        
+    def prepare_config_nodes(self, selected_proxies: List[Dict[str, Any]],
+                             custom_nodes: List[Dict[str, Any]],
+                             chained_config: Dict[str, str]) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """清理链式代理配置、应用 dialer-proxy 并排序，得到最终写入配置的节点
+        
+        Returns:
+            (排序后的全部节点, 清理后的链式代理配置)
+        """
+        # 收集所有有效节点的ID
+        valid_node_ids = set()
+        for proxy in selected_proxies:
+            if '_id' in proxy:
+                valid_node_ids.add(proxy['_id'])
+        for node in custom_nodes:
+            if '_id' in node:
+                valid_node_ids.add(node['_id'])
+                
+        # 清理 chained_config，只保留有效节点的配置
+        cleaned_chained_config = {}
+        for node_id, dialer in chained_config.items():
+            if node_id in valid_node_ids:
+                cleaned_chained_config[node_id] = dialer
+                
+        # 应用 dialer-proxy 配置
+        selected_proxies = self.apply_dialer_proxy_config(selected_proxies, cleaned_chained_config)
+        custom_nodes = self.apply_dialer_proxy_config(custom_nodes, cleaned_chained_config)
+        
+        # 合并所有节点
+        all_nodes = selected_proxies + custom_nodes
+        
+        # 对节点进行排序：链式代理节点在前，自定义节点次之，普通节点在后
+        def sort_key(node):
+            is_chained = node.get('_id', '') in cleaned_chained_config
+            is_custom = node.get('is_custom', False)
+            
+            # 返回元组用于排序：(链式代理优先级, 自定义节点优先级)
+            # 数字越小，优先级越高
+            if is_chained:
+                return (0, 0 if is_custom else 1)  # 链式代理最优先，其中自定义的更优先
+            elif is_custom:
+                return (1, 0)  # 非链式的自定义节点次之
+            else:
+                return (2, 0)  # 普通节点最后
+        
+        all_nodes.sort(key=sort_key)
+            
+        return all_nodes, cleaned_chained_config
         
     def generate_config_from_proxies(self,
                                    selected_proxies: List[Dict[str, Any]],
@@ -783,7 +1269,11 @@ class ClashConfigManager:
                                    github_token: str = None,
                                    reuse_gist: bool = False,
                                    save_config: bool = True,
-                                   gist_name: str = None) -> Dict[str, Any]:
+                                   gist_name: str = None,
+                                   all_proxies: List[Dict[str, Any]] = None,
+                                   filter_options: Dict[str, Any] = None,
+                                   verify_remote: bool = None,
+                                   latency_top_n: int = None) -> Dict[str, Any]:
         """根据选择的代理节点生成配置
         
         Args:
@@ -794,6 +1284,10 @@ class ClashConfigManager:
             reuse_gist: 是否重用 Gist
             save_config: 是否保存配置到本地
             gist_name: 指定使用的 Gist 名称
+            all_proxies: 获取到的全部订阅节点（含未选中的），用于记录用户取消选中的节点
+            filter_options: 获取节点时使用的过滤选项，保存后供定时任务使用
+            verify_remote: 内容摘要与上次不同时，是否再与远程文件比较
+            latency_top_n: 测速后每个地区只保留延迟最低的 N 个节点（链式代理相关节点和自定义节点始终保留）
             
         Returns:
             包含结果的字典
@@ -810,43 +1304,8 @@ class ClashConfigManager:
             if chained_config is None:
                 chained_config = {}
                 
-            # 收集所有有效节点的ID
-            valid_node_ids = set()
-            for proxy in selected_proxies:
-                if '_id' in proxy:
-                    valid_node_ids.add(proxy['_id'])
-            for node in custom_nodes:
-                if '_id' in node:
-                    valid_node_ids.add(node['_id'])
-                    
-            # 清理 chained_config，只保留有效节点的配置
-            cleaned_chained_config = {}
-            for node_id, dialer in chained_config.items():
-                if node_id in valid_node_ids:
-                    cleaned_chained_config[node_id] = dialer
-                    
-            # 应用 dialer-proxy 配置
-            selected_proxies = self.apply_dialer_proxy_config(selected_proxies, cleaned_chained_config)
-            custom_nodes = self.apply_dialer_proxy_config(custom_nodes, cleaned_chained_config)
-            
-            # 合并所有节点
-            all_nodes = selected_proxies + custom_nodes
-            
-            # 对节点进行排序：链式代理节点在前，自定义节点次之，普通节点在后
-            def sort_key(node):
-                is_chained = node.get('_id', '') in cleaned_chained_config
-                is_custom = node.get('is_custom', False)
-                
-                # 返回元组用于排序：(链式代理优先级, 自定义节点优先级)
-                # 数字越小，优先级越高
-                if is_chained:
-                    return (0, 0 if is_custom else 1)  # 链式代理最优先，其中自定义的更优先
-                elif is_custom:
-                    return (1, 0)  # 非链式的自定义节点次之
-                else:
-                    return (2, 0)  # 普通节点最后
-            
-            all_nodes.sort(key=sort_key)
+            all_nodes, cleaned_chained_config = self.prepare_config_nodes(
+                selected_proxies, custom_nodes, chained_config)
             
             if not all_nodes:
                 result['message'] = "没有任何节点需要处理"
@@ -857,21 +1316,42 @@ class ClashConfigManager:
                 config = self.load_chained_proxy_config()
                 config['custom_nodes'] = custom_nodes
                 config['chained_nodes'] = cleaned_chained_config  # 使用清理后的配置
-                # 保存所有代理节点和选中的节点ID（用于后续清理）
-                config['all_proxies'] = selected_proxies
+                selected_ids = {p['_id'] for p in all_nodes if '_id' in p}
+                if all_proxies is None:
+                    # 未提供获取到的全部节点时，沿用之前保存的节点，保留用户之前取消选中的记录
+                    all_proxies = list(selected_proxies) + [
+                        p for p in config.get('all_proxies', []) if p.get('_id') not in selected_ids]
+                # 保存所有代理节点和选中的节点ID（用于后续清理和计算未选中的节点）
+                config['all_proxies'] = all_proxies
                 config['selected_proxy_ids'] = [p['_id'] for p in all_nodes if '_id' in p]
+                if filter_options is not None:
+                    config['filter_options'] = filter_options
                 self.save_chained_proxy_config(config)
                 
+            # 按延迟筛选（保存的选择不受影响，下次生成时重新测速）
+            if latency_top_n:
+                dialer_names = {node.get('dialer-proxy') for node in all_nodes if node.get('dialer-proxy')}
+                total = len(all_nodes)
+                all_nodes = self.prober.select_fastest(
+                    all_nodes, int(latency_top_n),
+                    keep=lambda node: (node.get('_id') in cleaned_chained_config or node.get('is_custom', False)
+                                       or node.get('name') in dialer_names))
+                result['latency_dropped'] = total - len(all_nodes)
+                
             # 生成配置
             merged_config = self.merge_proxies_to_template(all_nodes, cleaned_chained_config)
             
-            # 上传到 Gist
-            gist_url, actual_gist_name = self.upload_to_gist(merged_config, github_token, reuse_gist, gist_name)
+            # 上传到 Gist（内容未变化时跳过）
+            upload = self.publish_to_gist(merged_config, github_token, reuse_gist, gist_name, verify_remote)
             
             result['success'] = True
-            result['message'] = f"成功生成配置，包含 {len(all_nodes)} 个节点"
-            result['subscription_url'] = gist_url
-            result['gist_name'] = actual_gist_name  # 返回实际使用的 Gist 名称
+            if upload['skipped']:
+                result['message'] = f"配置未变化（{upload['reason']}），跳过上传，包含 {len(all_nodes)} 个节点"
+            else:
+                result['message'] = f"成功生成配置，包含 {len(all_nodes)} 个节点"
+            result['subscription_url'] = upload['raw_url']
+            result['gist_name'] = upload['gist_name']  # 返回实际使用的 Gist 名称
+            result['upload_skipped'] = upload['skipped']  # 是否因内容未变化跳过了上传
             result['reuse_gist'] = reuse_gist  # 返回是否重用了现有 Gist
             result['details'] = {
                 'total_nodes': len(all_nodes),
@@ -0,0 +1,62 @@
+import re
+import yaml
+from typing import Any, Dict, List, Optional
+
+# 优先使用 libyaml 提供的 C 加速加载器/输出器，未安装时回退到纯 Python 实现
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    HAS_LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+    HAS_LIBYAML = False
+
+YAMLError = yaml.YAMLError
+
+# 顶层键所在的行：不以空白、注释符号或列表符号开头
+_TOP_LEVEL_KEY_RE = re.compile(r'^[^\s#\-][^\n:]*:', re.MULTILINE)
+
+
+def load(content: str) -> Any:
+    """安全地加载 YAML 内容"""
+    return yaml.load(content, Loader=SafeLoader)
+
+
+def dump(data: Any, **kwargs) -> str:
+    """安全地输出 YAML 内容，默认保留中文和键顺序"""
+    kwargs.setdefault('allow_unicode', True)
+    kwargs.setdefault('sort_keys', False)
+    return yaml.dump(data, Dumper=SafeDumper, **kwargs)
+
+
+def extract_section(content: str, key: str) -> Optional[str]:
+    """截取顶层块状键（如 proxies:）对应的文本段，找不到时返回 None"""
+    match = re.search(rf'^{re.escape(key)}:[ \t]*(?:#[^\n]*)?$', content, re.MULTILINE)
+    if not match:
+        return None
+    next_key = _TOP_LEVEL_KEY_RE.search(content, match.end())
+    end = next_key.start() if next_key else len(content)
+    return content[match.start():end]
+
+
+def load_proxies(content: str) -> Optional[List[Dict[str, Any]]]:
+    """从 Clash 配置中加载 proxies 列表
+
+    快速路径只解析 proxies: 段，跳过体积往往更大的 rules、dns 等段；
+    截取失败或该段依赖其他段（如锚点引用）时回退到完整解析。
+
+    Returns:
+        节点列表；内容不是包含 proxies 的 Clash 配置时返回 None
+    """
+    section = extract_section(content, 'proxies')
+    if section is not None:
+        try:
+            data = load(section)
+            if isinstance(data, dict) and isinstance(data.get('proxies'), list):
+                return data['proxies']
+        except YAMLError:
+            pass
+
+    data = load(content)
+    if isinstance(data, dict) and 'proxies' in data:
+        return data['proxies']
+    return None